@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Project, ManpowerExpense, MaterialExpense, Payment, LaborWorkType, MaterialItem
+from .models import Project, ManpowerExpense, MaterialExpense, Payment, LaborWorkType, MaterialItem, ProjectLedger, StoredFile, UploadSession
 
 @admin.register(Project)
 class ProjectAdmin(admin.ModelAdmin):
@@ -36,4 +36,21 @@ class MaterialItemAdmin(admin.ModelAdmin):
     list_display = ('name', 'display_name', 'is_active', 'created_at')
     search_fields = ('name', 'display_name')
     list_filter = ('is_active',)
-    ordering = ('display_name',)
\ No newline at end of file
+    ordering = ('display_name',)
+
+@admin.register(ProjectLedger)
+class ProjectLedgerAdmin(admin.ModelAdmin):
+    list_display = ('project', 'total_payments', 'total_manpower', 'total_material', 'manpower_count', 'material_count', 'updated_at')
+    readonly_fields = ProjectLedger.TOTAL_FIELDS + ['updated_at']
+
+@admin.register(StoredFile)
+class StoredFileAdmin(admin.ModelAdmin):
+    list_display = ('name', 'size', 'ref_count', 'created_at')
+    search_fields = ('name', 'sha256')
+    readonly_fields = ('name', 'sha256', 'size', 'ref_count', 'created_at')
+
+@admin.register(UploadSession)
+class UploadSessionAdmin(admin.ModelAdmin):
+    list_display = ('id', 'filename', 'size', 'received', 'status', 'updated_at')
+    list_filter = ('status',)
+    readonly_fields = ('filename', 'size', 'sha256', 'received', 'status', 'stored_name', 'created_at', 'updated_at')
@@ -1,8 +1,19 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 class ConstructionConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'construction'
 
     def ready(self):
-        pass
\ No newline at end of file
+        from django.db.backends.signals import connection_created
+        from . import signals  # noqa: F401 - connects the signal handlers
+
+        if (getattr(settings, 'QUERY_STATS_HEADERS', False) or getattr(settings, 'METRICS_ENABLED', True)
+                or getattr(settings, 'REQUEST_PROFILING', False)):
+            from .query_stats import install
+            connection_created.connect(install)
+
+        if getattr(settings, 'SLOW_QUERY_THRESHOLD_MS', 0) > 0:
+            from .slow_queries import install as install_slow_query_capture
+            connection_created.connect(install_slow_query_capture)
@@ -0,0 +1,27 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+
+
+def _call_and_release(func):
+    try:
+        return func()
+    finally:
+        # Worker threads outlive the call; release their connection the way
+        # Django does at the end of a request (honours CONN_MAX_AGE)
+        close_old_connections()
+
+
+async def run_in_parallel(*funcs):
+    """
+    Run blocking ORM callables concurrently and return their results in order.
+
+    Django's async ORM methods (aaggregate() and the like) all hop onto one
+    shared thread, so gathering several of them still runs the queries one
+    after another. Each callable here gets a worker thread of its own, and
+    with it its own database connection.
+    """
+    return await asyncio.gather(*(
+        sync_to_async(_call_and_release, thread_sensitive=False)(func) for func in funcs
+    ))
@@ -0,0 +1,200 @@
+"""
+Async versions of the read endpoints, routed in place of the sync views when
+ASYNC_READ_VIEWS is on and the site is served over ASGI (e.g. uvicorn).
+
+DRF views are sync only, so these are plain Django async views: they reuse
+the viewsets' querysets, pagination and serializers, read through the async
+ORM and return the same JSON. Before serving, each runs the authentication,
+permission and throttle classes of the sync view it stands in for (see
+check_access). Writes on the list routes are passed on to the sync viewsets.
+"""
+import logging
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from django.views.decorators.http import require_GET
+from rest_framework.exceptions import APIException, AuthenticationFailed, NotAuthenticated, NotFound
+from rest_framework.request import Request
+from rest_framework.utils.encoders import JSONEncoder
+
+from .etags import (
+    aproject_version, aproject_list_etag, apayment_list_etag, aproject_payments_etag, aexpense_list_etag,
+    areport_etag, areference_data_etag
+)
+from .models import Project, ProjectLedger, Payment
+from .reference_data import reference_data
+from .report_cache import report_cache
+from .reports import TIME_RANGES, abuild_report_data
+from .serializers import PaymentSerializer
+from . import views
+from .views import ProjectViewSet, ExpenseViewSet, PaymentViewSet
+
+logger = logging.getLogger(__name__)
+
+
+def json_response(data, status=200):
+    return JsonResponse(data, status=status, encoder=JSONEncoder, safe=False)
+
+
+def acondition(etag_func):
+    """
+    django.views.decorators.http.condition() with an async etag_func, which
+    condition() would call without awaiting.
+    """
+    def decorator(view):
+        @wraps(view)
+        async def inner(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return await view(request, *args, **kwargs)
+            etag = quote_etag(await etag_func(request, *args, **kwargs))
+            response = get_conditional_response(request, etag=etag)
+            if response is None:
+                response = await view(request, *args, **kwargs)
+                response.headers.setdefault('ETag', etag)
+            return response
+        return inner
+    return decorator
+
+
+def access_denied(view_class, initkwargs, request, args, kwargs):
+    """
+    The response DRF would give for a failed authentication, permission or
+    throttle check of view_class (as in APIView.initial()), or None.
+    """
+    view = view_class(**initkwargs)
+    view.args, view.kwargs = args, kwargs
+    drf_request = view.initialize_request(request, *args, **kwargs)
+    try:
+        view.perform_authentication(drf_request)
+        view.check_permissions(drf_request)
+        view.check_throttles(drf_request)
+    except APIException as e:
+        response = json_response({'detail': e.detail}, status=e.status_code)
+        if isinstance(e, (NotAuthenticated, AuthenticationFailed)):
+            authenticate_header = view.get_authenticate_header(drf_request)
+            if authenticate_header:
+                response['WWW-Authenticate'] = authenticate_header
+            else:
+                response.status_code = 403
+        if getattr(e, 'wait', None):
+            response['Retry-After'] = str(int(e.wait))
+        return response
+    return None
+
+
+def check_access(view_class, **initkwargs):
+    """
+    Run the access checks of the sync view_class on GET and HEAD; other
+    methods are passed on to sync views that run their own.
+    """
+    def decorator(view):
+        @wraps(view)
+        async def inner(request, *args, **kwargs):
+            if request.method in ('GET', 'HEAD'):
+                response = await sync_to_async(access_denied)(view_class, initkwargs, request, args, kwargs)
+                if response is not None:
+                    return response
+            return await view(request, *args, **kwargs)
+        return inner
+    return decorator
+
+
+def async_list(viewset_class, etag_func):
+    """
+    Async view for a viewset's list route. GET and HEAD are answered here
+    with the viewset's queryset, paginator and serializer; POST goes to its
+    create().
+    """
+    create = sync_to_async(viewset_class.as_view({'post': 'create'}))
+
+    @check_access(viewset_class, action_map={'get': 'list', 'head': 'list'})
+    @acondition(etag_func)
+    async def list_view(request):
+        if request.method not in ('GET', 'HEAD'):
+            return await create(request)
+
+        view = viewset_class(request=Request(request), format_kwarg=None, action='list', args=(), kwargs={})
+        try:
+            # get_queryset() may check for the search index
+            queryset = await sync_to_async(view.get_queryset)()
+            paginator = view.paginator
+            page = await paginator.apaginate_queryset(queryset, request, view=view) if paginator else None
+            if page is None:
+                rows = [row async for row in queryset]
+                return json_response(view.get_serializer(rows, many=True).data)
+            return json_response(paginator.get_paginated_data(view.get_serializer(page, many=True).data))
+        except NotFound as e:
+            return json_response({'detail': e.detail}, status=e.status_code)
+        except Exception as e:
+            logger.error(f"Error in {viewset_class.__name__} async list: {str(e)}")
+            return json_response({"error": str(e)}, status=500)
+
+    return list_view
+
+
+project_list = async_list(ProjectViewSet, aproject_list_etag)
+expense_list = async_list(ExpenseViewSet, aexpense_list_etag)
+payment_list = async_list(PaymentViewSet, apayment_list_etag)
+
+
+@require_GET
+@check_access(views.report_data.cls)
+@acondition(areport_etag)
+async def report_data(request, project_id):
+    try:
+        version = await aproject_version(request, project_id)
+        if version is None:
+            project = await Project.objects.aget(id=project_id)
+            version = (await sync_to_async(ProjectLedger.for_project)(project)).version
+        time_range = request.GET.get('time_range', 'month')
+        if time_range not in TIME_RANGES:
+            return json_response({"error": f"time_range must be one of {', '.join(TIME_RANGES)}"}, status=400)
+        today = timezone.now().date()
+
+        async def compute():
+            return await abuild_report_data(await Project.objects.aget(id=project_id), time_range, today)
+
+        key = report_cache.make_key(project_id, time_range, version, today)
+        data, hit = await report_cache.aget_or_compute(key, compute)
+        response = json_response(data)
+        response['X-Cache'] = 'HIT' if hit else 'MISS'
+        return response
+    except Project.DoesNotExist:
+        return json_response({"error": "Project not found"}, status=404)
+    except Exception as e:
+        logger.error(f"Error in async report_data: {str(e)}")
+        return json_response({"error": str(e)}, status=500)
+
+
+@require_GET
+@check_access(views.project_payments.cls)
+@acondition(aproject_payments_etag)
+async def project_payments(request, project_id):
+    try:
+        payments = [
+            payment async for payment in Payment.objects.filter(project_id=project_id).select_related('project')
+        ]
+        return json_response(PaymentSerializer(payments, many=True).data)
+    except Exception as e:
+        logger.error(f"Error in async project_payments: {str(e)}")
+        return json_response({"error": str(e)}, status=500)
+
+
+@require_GET
+@check_access(views.material_items_list.cls)
+@acondition(areference_data_etag)
+async def material_items_list(request):
+    snapshot = await sync_to_async(reference_data.snapshot)()
+    return json_response(snapshot.material_items_data)
+
+
+@require_GET
+@check_access(views.labor_work_type_list.cls)
+@acondition(areference_data_etag)
+async def labor_work_type_list(request):
+    snapshot = await sync_to_async(reference_data.snapshot)()
+    return json_response(snapshot.work_types_data)
@@ -0,0 +1,212 @@
+"""
+Endpoint benchmarks (see the run_benchmarks command). Each dataset is
+seeded with ScaleSeeder, then every scenario drives one API endpoint through
+the Django test client and records its median and p95 latency, the number
+of queries it runs and the peak memory it allocates. Results are compared
+against a JSON baseline kept next to this module.
+"""
+import gc
+import json
+import os
+import platform
+import statistics
+import time
+import tracemalloc
+from datetime import date
+
+import django
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from .http_load import percentile
+from .models import LaborWorkType, MaterialItem, ProjectLedger
+from .report_cache import report_cache
+from .seeding import ScaleSeeder
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'benchmark_baseline.json')
+
+DATASETS = {
+    'small': {'projects': 5, 'expenses': 2000, 'payments': 100},
+    'medium': {'projects': 20, 'expenses': 20000, 'payments': 1000},
+    'large': {'projects': 50, 'expenses': 200000, 'payments': 5000},
+}
+SEED = 42
+
+
+class BenchmarkError(Exception):
+    """A scenario's request failed, so its timings mean nothing."""
+
+
+def clear_report_cache():
+    report_cache.cache.clear()
+
+
+def report(time_range):
+    return lambda client, ctx: client.get(f'/api/reports/{ctx["project"]}/', {'time_range': time_range})
+
+
+def create_manpower(client, ctx):
+    return client.post('/api/expenses/', {
+        'type': 'manpower', 'project': ctx['project'], 'work_type': ctx['work_type'], 'date': ctx['today'],
+        'number_of_people': 4, 'per_person_cost': '750', 'total_amount': '3000', 'description': 'Benchmark crew',
+    }, content_type='application/json')
+
+
+def create_material(client, ctx):
+    return client.post('/api/expenses/', {
+        'type': 'material', 'project': ctx['project'], 'item': ctx['item'], 'date': ctx['today'],
+        'quantity': '10', 'per_unit_cost': '420', 'description': 'Benchmark delivery',
+    }, content_type='application/json')
+
+
+def create_payment(client, ctx):
+    return client.post('/api/payments/', {
+        'project': ctx['project'], 'amount': '5000', 'payment_date': ctx['today'], 'payment_type': 'Installment',
+    }, content_type='application/json')
+
+
+# name -> (request(client, ctx), run before every request or None)
+SCENARIOS = {
+    'projects-list': (lambda client, ctx: client.get('/api/projects/'), None),
+    'expenses-manpower': (
+        lambda client, ctx: client.get('/api/expenses/', {'type': 'manpower', 'project_id': ctx['project']}), None,
+    ),
+    'expenses-material': (
+        lambda client, ctx: client.get('/api/expenses/', {'type': 'material', 'project_id': ctx['project']}), None,
+    ),
+    'expenses-all': (
+        lambda client, ctx: client.get('/api/expenses/', {'type': 'all', 'project_id': ctx['project']}), None,
+    ),
+    'expenses-search': (
+        lambda client, ctx: client.get('/api/expenses/', {'type': 'manpower', 'search': 'plastering crew'}), None,
+    ),
+    'payments-list': (lambda client, ctx: client.get('/api/payments/', {'project_id': ctx['project']}), None),
+    'project-payments': (lambda client, ctx: client.get(f'/api/projects/{ctx["project"]}/payments/'), None),
+    'report-month': (report('month'), clear_report_cache),
+    'report-quarter': (report('quarter'), clear_report_cache),
+    'report-year': (report('year'), clear_report_cache),
+    'report-cached': (report('year'), None),
+    'portfolio-summary': (lambda client, ctx: client.get('/api/portfolio/summary/'), None),
+    'create-manpower': (create_manpower, None),
+    'create-material': (create_material, None),
+    'create-payment': (create_payment, None),
+}
+
+
+def seed_dataset(name, log=None):
+    ScaleSeeder(seed=SEED, log=log, **DATASETS[name]).run()
+
+
+def benchmark_context():
+    """Ids the scenarios use: the project with the most expenses and one of each reference row."""
+    ledger = ProjectLedger.objects.order_by('-manpower_count', '-material_count', 'project_id').first()
+    if ledger is None:
+        raise BenchmarkError('No projects to benchmark')
+    return {
+        'project': ledger.project_id,
+        'work_type': LaborWorkType.objects.order_by('pk').values_list('pk', flat=True).first(),
+        'item': MaterialItem.objects.filter(name='cement').values_list('pk', flat=True).first(),
+        'today': date.today().isoformat(),
+    }
+
+
+def measure(name, ctx, iterations=20, rounds=3, warmup=2):
+    """
+    Metrics for one scenario. Latency is timed in `rounds` rounds of
+    `iterations` requests and the best round's median and p95 are kept:
+    other load on the machine only ever adds time, so the fastest round is
+    the most repeatable estimate. Queries and memory come from one more,
+    instrumented request.
+    """
+    request, before = SCENARIOS[name]
+    client = Client()
+
+    def run():
+        if before:
+            before()
+        start = time.perf_counter()
+        response = request(client, ctx)
+        elapsed = time.perf_counter() - start
+        if response.status_code >= 400:
+            raise BenchmarkError(f'{name}: HTTP {response.status_code} {response.content[:200]!r}')
+        return elapsed
+
+    for _ in range(warmup):
+        run()
+    medians = []
+    p95s = []
+    for _ in range(rounds):
+        gc.collect()
+        timings = sorted(run() for _ in range(iterations))
+        medians.append(statistics.median(timings))
+        p95s.append(percentile(timings, 0.95))
+
+    # Counting queries and tracing allocations slow the request down, so
+    # they get a run of their own
+    tracemalloc.start()
+    try:
+        with CaptureQueriesContext(connection) as queries:
+            run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'median_ms': round(min(medians) * 1000, 2),
+        'p95_ms': round(min(p95s) * 1000, 2),
+        'queries': len(queries),
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'machine': platform.machine(),
+    }
+
+
+def load_baseline(path=BASELINE_PATH):
+    try:
+        with open(path) as baseline:
+            return json.load(baseline)
+    except FileNotFoundError:
+        return None
+
+
+def save_results(results, path=BASELINE_PATH):
+    with open(path, 'w') as baseline:
+        json.dump(results, baseline, indent=2, sort_keys=True)
+        baseline.write('\n')
+
+
+def compare(baseline, results, threshold=0.5, memory_threshold=0.2, query_threshold=0,
+            min_delta_ms=2.0, min_delta_kb=64):
+    """
+    Regressions of results against baseline, as messages. Latency regresses
+    when it grows by more than `threshold` (a fraction) and by more than
+    min_delta_ms; peak memory likewise with memory_threshold and
+    min_delta_kb; query counts when they grow by more than query_threshold.
+    Scenarios missing from the baseline are skipped.
+    """
+    limits = {
+        'median_ms': (threshold, min_delta_ms),
+        'p95_ms': (threshold, min_delta_ms),
+        'peak_kb': (memory_threshold, min_delta_kb),
+    }
+    regressions = []
+    for dataset, scenarios in results['datasets'].items():
+        for name, metrics in scenarios.items():
+            base = baseline.get('datasets', {}).get(dataset, {}).get(name)
+            if not base:
+                continue
+            label = f'{dataset}/{name}'
+            for metric, (ratio, floor) in limits.items():
+                if metrics[metric] > base[metric] * (1 + ratio) and metrics[metric] - base[metric] > floor:
+                    regressions.append(f'{label}: {metric} {base[metric]} -> {metrics[metric]}')
+            if metrics['queries'] > base['queries'] + query_threshold:
+                regressions.append(f'{label}: queries {base["queries"]} -> {metrics["queries"]}')
+    return regressions
@@ -0,0 +1,170 @@
+import asyncio
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+from .storage import content_digest
+
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+# Content-addressed URLs never change meaning; a year is the conventional "forever"
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+
+class FileRange:
+    """
+    Read-only view of `length` bytes of an open file from its current
+    position. It exposes fileno() so a WSGI server's file_wrapper can still
+    sendfile() the range; Content-Length bounds what it sends.
+    """
+
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+        self.name = file.name
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+class StoredFileResponse(FileResponse):
+    block_size = 64 * 1024
+
+
+async def aiter_file(file, length, chunk_size=256 * 1024):
+    """
+    Async iterator over `length` bytes of file. Django's ASGI handler reads
+    a sync iterator (a plain FileResponse) to the end before sending, so
+    under ASGI the body is streamed from this instead.
+    """
+    try:
+        while length > 0:
+            data = await asyncio.to_thread(file.read, min(chunk_size, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+    finally:
+        file.close()
+
+
+def byte_range(request, size, etag, last_modified):
+    """
+    (start, end) of the single byte range requested, end inclusive; None to
+    send the whole file; False if the range cannot be satisfied. Ranges in a
+    multi-range or malformed header, or stale per If-Range, are ignored.
+    """
+    header = request.META.get('HTTP_RANGE', '')
+    match = RANGE.match(header.replace(' ', ''))
+    if not match or match.groups() == ('', ''):
+        return None
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range and if_range != etag and parse_http_date_safe(if_range) != int(last_modified):
+        return None
+
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if last and int(last) < start:
+            return None
+    else:
+        # bytes=-N: the last N bytes
+        start, end = max(size - int(last), 0), size - 1
+        if int(last) == 0:
+            return False
+    if start >= size:
+        return False
+    return start, end
+
+
+def serve_file(request, storage, name, filename, immutable=False):
+    """
+    Response for a stored file: conditional GETs (ETag, Last-Modified),
+    single byte ranges, and either a FileResponse or a handoff to the front
+    server per PAYMENT_FILE_SENDFILE ('x-accel-redirect' or 'x-sendfile').
+
+    With immutable=True the URL is content-addressed and may be cached for
+    good; otherwise clients revalidate every time.
+    """
+    path = storage.path(name)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        raise Http404('File not found')
+
+    digest = content_digest(name)
+    etag = f'"{digest}"' if digest else f'"{int(stat.st_mtime_ns):x}-{stat.st_size:x}"'
+    last_modified = int(stat.st_mtime)
+    cache_control = f'private, max-age={IMMUTABLE_MAX_AGE}, immutable' if immutable else 'private, no-cache'
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        sendfile = getattr(settings, 'PAYMENT_FILE_SENDFILE', '')
+        if sendfile == 'x-accel-redirect':
+            # nginx serves the file (ranges included) from an internal location
+            response = HttpResponse(content_type=content_type)
+            prefix = getattr(settings, 'PAYMENT_FILE_ACCEL_PREFIX', '/protected-media/')
+            response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + quote(name)
+        elif sendfile == 'x-sendfile':
+            response = HttpResponse(content_type=content_type)
+            response['X-Sendfile'] = path
+        else:
+            response = file_response(request, path, stat.st_size, content_type, etag, last_modified)
+        response['Content-Disposition'] = f'inline; filename="{filename}"'
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = cache_control
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def file_response(request, path, size, content_type, etag, last_modified):
+    requested = byte_range(request, size, etag, last_modified)
+    if requested is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    start, end = requested or (0, size - 1)
+    length = end - start + 1
+    status = 206 if requested else 200
+    file = open(path, 'rb')
+    file.seek(start)
+    if getattr(request, 'scope', None) is not None:
+        # ASGI
+        response = StreamingHttpResponse(aiter_file(file, length), status=status, content_type=content_type)
+    elif requested is None:
+        response = StoredFileResponse(file, content_type=content_type)
+    else:
+        response = StoredFileResponse(FileRange(file, length), status=status, content_type=content_type)
+    response['Content-Length'] = length
+    if requested:
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return response
+
+
+def payment_file_url(payment):
+    url = reverse('payment_file', args=[payment.pk])
+    digest = content_digest(payment.payment_file.name)
+    return f'{url}?v={digest}' if digest else url
@@ -0,0 +1,135 @@
+import hashlib
+
+from asgiref.sync import sync_to_async
+from django.db.models import Count, Max, Sum
+from django.utils import timezone
+
+from .models import ProjectLedger
+from .reference_data import reference_data
+
+
+STAMP_AGGREGATES = {
+    'count': Count('project_id'),
+    'last': Max('project_id'),
+    'versions': Sum('version'),
+    'updated': Max('updated_at'),
+}
+
+
+def _ledger_versions(request):
+    return request.__dict__.setdefault('_ledger_versions', {})
+
+
+def _version_queryset(project_id):
+    try:
+        return ProjectLedger.objects.filter(project_id=int(project_id)).values_list('version', flat=True)
+    except (TypeError, ValueError):
+        return None
+
+
+def _format_stamp(stamp):
+    updated = stamp['updated'].isoformat() if stamp['updated'] else ''
+    return f"all.{stamp['count']}.{stamp['last']}.{stamp['versions']}.{updated}"
+
+
+def project_version(request, project_id):
+    """
+    ProjectLedger.version of a project, or None if it has no ledger. Read at
+    most once per request so views can reuse the lookup their ETag made.
+    """
+    versions = _ledger_versions(request)
+    if project_id not in versions:
+        queryset = _version_queryset(project_id)
+        versions[project_id] = None if queryset is None else queryset.first()
+    return versions[project_id]
+
+
+async def aproject_version(request, project_id):
+    versions = _ledger_versions(request)
+    if project_id not in versions:
+        queryset = _version_queryset(project_id)
+        versions[project_id] = None if queryset is None else await queryset.afirst()
+    return versions[project_id]
+
+
+def data_stamp(request, project_id=None):
+    """
+    Cheap change stamp for project, payment and expense data.
+
+    Every write to a project or to its payments and expenses bumps that
+    project's ProjectLedger.version, so one project's stamp is its ledger
+    version and the stamp for all projects aggregates the ledger table (one
+    row per project): row count and highest id catch creates and deletes,
+    the version sum and latest update catch everything else.
+    """
+    if project_id is not None:
+        return f'p{project_id}.{project_version(request, project_id)}'
+    return _format_stamp(ProjectLedger.objects.order_by().aggregate(**STAMP_AGGREGATES))
+
+
+async def adata_stamp(request, project_id=None):
+    if project_id is not None:
+        return f'p{project_id}.{await aproject_version(request, project_id)}'
+    return _format_stamp(await ProjectLedger.objects.order_by().aaggregate(**STAMP_AGGREGATES))
+
+
+def make_etag(request, *parts):
+    """
+    Strong ETag over the given stamps plus the request path and query string,
+    so each filter, page and cursor gets its own tag.
+    """
+    key = '|'.join([request.path, request.META.get('QUERY_STRING', ''), *map(str, parts)])
+    return '"' + hashlib.sha1(key.encode()).hexdigest() + '"'
+
+
+def project_list_etag(request, *args, **kwargs):
+    return make_etag(request, data_stamp(request))
+
+
+def portfolio_etag(request, *args, **kwargs):
+    return make_etag(request, data_stamp(request))
+
+
+def payment_list_etag(request, *args, **kwargs):
+    return make_etag(request, data_stamp(request, request.GET.get('project_id') or None))
+
+
+def project_payments_etag(request, project_id, *args, **kwargs):
+    return make_etag(request, data_stamp(request, project_id))
+
+
+def expense_list_etag(request, *args, **kwargs):
+    # Expense rows embed work type and material item names
+    return make_etag(request, data_stamp(request, request.GET.get('project_id') or None), reference_data.snapshot().version)
+
+
+def report_etag(request, project_id, *args, **kwargs):
+    # Reports are relative to today, so the tag changes at midnight
+    return make_etag(request, data_stamp(request, project_id), timezone.now().date())
+
+
+# Async counterparts, for the views in construction.async_views
+
+async def aproject_list_etag(request, *args, **kwargs):
+    return make_etag(request, await adata_stamp(request))
+
+
+async def apayment_list_etag(request, *args, **kwargs):
+    return make_etag(request, await adata_stamp(request, request.GET.get('project_id') or None))
+
+
+async def aproject_payments_etag(request, project_id, *args, **kwargs):
+    return make_etag(request, await adata_stamp(request, project_id))
+
+
+async def aexpense_list_etag(request, *args, **kwargs):
+    snapshot = await sync_to_async(reference_data.snapshot)()
+    return make_etag(request, await adata_stamp(request, request.GET.get('project_id') or None), snapshot.version)
+
+
+async def areport_etag(request, project_id, *args, **kwargs):
+    return make_etag(request, await adata_stamp(request, project_id), timezone.now().date())
+
+
+async def areference_data_etag(request, *args, **kwargs):
+    return (await sync_to_async(reference_data.snapshot)()).etag
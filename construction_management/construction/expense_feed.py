@@ -0,0 +1,98 @@
+from django.db import connection
+from django.db.models import DecimalField, F, IntegerField, CharField, Value
+
+# Columns shared by both expense tables, followed by annotations present in
+# both projections under the same names and in the same order: UNION pairs
+# columns by position, and values() puts model fields before annotations.
+FEED_FIELDS = ['id', 'project_id', 'date', 'created_at', 'total_amount', 'description']
+
+# expense_type breaks ties between a manpower and a material row with equal ids
+FEED_ORDERING = ('-date', '-created_at', 'expense_type', 'id')
+
+AMOUNT = DecimalField(max_digits=15, decimal_places=2)
+
+
+def manpower_projection():
+    return {
+        'expense_type': Value('manpower', output_field=CharField()),
+        'project_name': F('project__name'),
+        'work_type_ref': F('work_type_id'),
+        'work_type_name': F('work_type__name'),
+        'people': F('number_of_people'),
+        'person_cost': F('per_person_cost'),
+        'item_ref': Value(None, output_field=IntegerField()),
+        'item_label': Value(None, output_field=CharField()),
+        'custom_name': Value(None, output_field=CharField()),
+        'item_quantity': Value(None, output_field=AMOUNT),
+        'unit_cost': Value(None, output_field=AMOUNT),
+    }
+
+
+def material_projection():
+    return {
+        'expense_type': Value('material', output_field=CharField()),
+        'project_name': F('project__name'),
+        'work_type_ref': Value(None, output_field=IntegerField()),
+        'work_type_name': Value(None, output_field=CharField()),
+        'people': Value(None, output_field=IntegerField()),
+        'person_cost': Value(None, output_field=AMOUNT),
+        'item_ref': F('item_id'),
+        'item_label': F('item__display_name'),
+        'custom_name': F('custom_item_name'),
+        'item_quantity': F('quantity'),
+        'unit_cost': F('per_unit_cost'),
+    }
+
+
+class ExpenseFeed:
+    """
+    Manpower and material expenses as one stream of dicts, read with a
+    single UNION ALL query.
+
+    Supports the subset of the QuerySet API that KeysetPagination and list
+    views use: order_by(), filter(), slicing and iteration, including async
+    for. Filters are applied to each branch before the UNION, and on
+    backends that allow it each branch is ordered and limited too, so a page
+    only reads a page's worth of rows from each table.
+    """
+
+    def __init__(self, manpower, material, ordering=()):
+        self.manpower = manpower
+        self.material = material
+        self.ordering = tuple(ordering)
+        self._result_cache = None
+
+    @classmethod
+    def from_querysets(cls, manpower, material):
+        return cls(
+            manpower.order_by().values(*FEED_FIELDS, **manpower_projection()),
+            material.order_by().values(*FEED_FIELDS, **material_projection()),
+        )
+
+    def order_by(self, *ordering):
+        return ExpenseFeed(self.manpower, self.material, ordering)
+
+    def filter(self, *args, **kwargs):
+        return ExpenseFeed(self.manpower.filter(*args, **kwargs), self.material.filter(*args, **kwargs), self.ordering)
+
+    def _query(self, limit=None):
+        manpower, material = self.manpower, self.material
+        if limit is not None and connection.features.supports_slicing_ordering_in_compound:
+            manpower = manpower.order_by(*self.ordering)[:limit]
+            material = material.order_by(*self.ordering)[:limit]
+        union = manpower.union(material, all=True)
+        return union.order_by(*self.ordering) if self.ordering else union
+
+    def __getitem__(self, index):
+        if isinstance(index, slice) and not index.step and (index.start or 0) >= 0 and index.stop is not None:
+            # A lazy QuerySet, so async views can iterate it with async for
+            return self._query(limit=index.stop)[index]
+        return list(self)[index]
+
+    def __aiter__(self):
+        return aiter(self._query())
+
+    def __iter__(self):
+        if self._result_cache is None:
+            self._result_cache = list(self._query())
+        return iter(self._result_cache)
@@ -0,0 +1,247 @@
+import csv
+import io
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Project, ManpowerExpense, MaterialExpense, LaborWorkType, MaterialItem, ProjectLedger
+
+CENT = Decimal('0.01')
+MAX_AMOUNT = Decimal('9999999999999.99')
+# Largest value every backend stores in a PositiveIntegerField
+MAX_PEOPLE = 2147483647
+CUSTOM_ITEM_NAME_LENGTH = MaterialExpense._meta.get_field('custom_item_name').max_length
+
+
+class FundsCheckFailed(Exception):
+    pass
+
+
+def read_csv_rows(uploaded_file):
+    """Yield one dict per data row of a CSV upload with a header line."""
+    text = io.TextIOWrapper(uploaded_file.file, encoding='utf-8-sig', newline='')
+    for row in csv.DictReader(text):
+        yield {key.strip(): (value or '').strip() for key, value in row.items() if key}
+
+
+def _blank(value):
+    return value is None or value == ''
+
+
+def _parse_id(value):
+    if _blank(value):
+        return None
+    return int(value)
+
+
+def _parse_count(value):
+    # int() would truncate 2.7 and accept True
+    if isinstance(value, bool):
+        raise TypeError
+    if isinstance(value, float):
+        if not value.is_integer():
+            raise ValueError
+        return int(value)
+    return int(value)
+
+
+def _parse_amount(value):
+    amount = Decimal(str(value))
+    if not amount.is_finite() or amount < CENT or amount > MAX_AMOUNT:
+        raise ValueError
+    if amount != amount.quantize(CENT):
+        raise ValueError
+    return amount
+
+
+def _parse_date(value):
+    if _blank(value):
+        return timezone.now().date()
+    return datetime.strptime(str(value), '%Y-%m-%d').date()
+
+
+class ExpenseImport:
+    """
+    Validates a batch of mixed manpower/material expense rows in one pass and
+    writes them with bulk_create. Reference rows (projects, work types and
+    material items) are fetched with one query per table, and funds are
+    reserved once per project for the batch total.
+
+    With atomic=True any error rejects the whole batch; otherwise valid rows
+    are written and the rest are reported back with their row numbers.
+    """
+
+    def __init__(self, rows, atomic=True):
+        self.rows = list(rows)
+        self.atomic = atomic
+        self.errors = {}
+        self.created = 0
+
+    def _resolve(self, model, field, **filters):
+        ids = set()
+        for row in self.rows:
+            if not isinstance(row, dict):
+                continue
+            try:
+                value = _parse_id(row.get(field))
+            except (TypeError, ValueError):
+                continue
+            if value is not None:
+                ids.add(value)
+        return model.objects.filter(**filters).in_bulk(ids)
+
+    def _build(self, row, projects, work_types, items):
+        errors = {}
+        expense_type = row.get('type')
+        if expense_type not in ('manpower', 'material'):
+            return None, {'type': 'Expense type must be "manpower" or "material"'}
+
+        try:
+            project = projects.get(_parse_id(row.get('project')))
+        except (TypeError, ValueError):
+            project = None
+        if project is None:
+            errors['project'] = 'Project not found'
+
+        try:
+            expense_date = _parse_date(row.get('date'))
+        except (TypeError, ValueError):
+            errors['date'] = 'Date must be in YYYY-MM-DD format'
+
+        description = row.get('description') or ''
+        if not isinstance(description, str):
+            errors['description'] = 'Description must be text'
+
+        if expense_type == 'manpower':
+            try:
+                number_of_people = _parse_count(row.get('number_of_people'))
+                if number_of_people < 1:
+                    raise ValueError
+            except (TypeError, ValueError):
+                errors['number_of_people'] = 'Number of people must be a whole number greater than 0'
+            else:
+                if number_of_people > MAX_PEOPLE:
+                    errors['number_of_people'] = f'Number of people cannot exceed {MAX_PEOPLE}'
+            try:
+                per_person_cost = _parse_amount(row.get('per_person_cost'))
+            except (TypeError, ValueError, InvalidOperation):
+                errors['per_person_cost'] = 'Per person cost must be greater than 0'
+            work_type = None
+            try:
+                work_type_id = _parse_id(row.get('work_type'))
+            except (TypeError, ValueError):
+                work_type_id = -1
+            if work_type_id is not None:
+                work_type = work_types.get(work_type_id)
+                if work_type is None:
+                    errors['work_type'] = 'Invalid work type'
+            if errors:
+                return None, errors
+            expense = ManpowerExpense(
+                project=project, work_type=work_type, date=expense_date,
+                number_of_people=number_of_people, per_person_cost=per_person_cost,
+                total_amount=number_of_people * per_person_cost, description=description,
+            )
+        else:
+            try:
+                item = items.get(_parse_id(row.get('item')))
+            except (TypeError, ValueError):
+                item = None
+            if item is None:
+                errors['item'] = 'Invalid material item'
+            custom_item_name = row.get('custom_item_name') or None
+            if item is not None and item.name == 'others' and not custom_item_name:
+                errors['custom_item_name'] = 'Custom item name is required when "Others" is selected'
+            elif custom_item_name and len(custom_item_name) > CUSTOM_ITEM_NAME_LENGTH:
+                errors['custom_item_name'] = f'Custom item name cannot be longer than {CUSTOM_ITEM_NAME_LENGTH} characters'
+            try:
+                per_unit_cost = _parse_amount(row.get('per_unit_cost'))
+            except (TypeError, ValueError, InvalidOperation):
+                errors['per_unit_cost'] = 'Per unit cost must be greater than 0'
+            try:
+                quantity = _parse_amount(row.get('quantity'))
+            except (TypeError, ValueError, InvalidOperation):
+                errors['quantity'] = 'Quantity must be greater than 0'
+            if errors:
+                return None, errors
+            expense = MaterialExpense(
+                project=project, item=item, custom_item_name=custom_item_name, date=expense_date,
+                per_unit_cost=per_unit_cost, quantity=quantity,
+                total_amount=(per_unit_cost * quantity).quantize(CENT), description=description,
+            )
+
+        if expense.total_amount > MAX_AMOUNT:
+            return None, {'total_amount': 'Total amount is too large'}
+        if expense.total_amount > project.budget:
+            return None, {'total_amount': 'Total amount cannot exceed project budget'}
+        return expense, None
+
+    def _reserve(self, project_id, expenses):
+        manpower = [e for e in expenses if isinstance(e, ManpowerExpense)]
+        material = [e for e in expenses if isinstance(e, MaterialExpense)]
+        amount = sum((e.total_amount for e in expenses), Decimal('0'))
+        deltas = {
+            'total_manpower': sum((e.total_amount for e in manpower), Decimal('0')),
+            'total_material': sum((e.total_amount for e in material), Decimal('0')),
+            'manpower_count': len(manpower),
+            'material_count': len(material),
+        }
+        # Payments are capped at the budget, so covering the batch with
+        # payments also keeps total expenses within the budget
+        if ProjectLedger.reserve_funds(project_id, amount, **deltas):
+            return None
+        if ProjectLedger.for_project(project_id).available_funds <= 0:
+            return 'No funds available for expenses.'
+        return 'Your funds are not sufficient to add these expenses.'
+
+    def run(self):
+        projects = self._resolve(Project, 'project')
+        work_types = self._resolve(LaborWorkType, 'work_type')
+        # Inactive items are hidden from the item list and cannot be used
+        items = self._resolve(MaterialItem, 'item', is_active=True)
+
+        by_project = defaultdict(list)
+        for number, row in enumerate(self.rows, start=1):
+            if not isinstance(row, dict):
+                self.errors[number] = {'row': 'Each row must be an object'}
+                continue
+            expense, errors = self._build(row, projects, work_types, items)
+            if errors:
+                self.errors[number] = errors
+            else:
+                by_project[expense.project_id].append((number, expense))
+
+        if self.atomic and self.errors:
+            return self
+
+        try:
+            with transaction.atomic():
+                to_create = []
+                # Lock ledgers in a fixed order so concurrent batches cannot deadlock
+                for project_id in sorted(by_project):
+                    numbered = by_project[project_id]
+                    message = self._reserve(project_id, [expense for _, expense in numbered])
+                    if message:
+                        for number, _ in numbered:
+                            self.errors[number] = {'total_amount': message}
+                        if self.atomic:
+                            raise FundsCheckFailed
+                        continue
+                    to_create.extend(expense for _, expense in numbered)
+
+                ManpowerExpense.objects.bulk_create(
+                    [e for e in to_create if isinstance(e, ManpowerExpense)], batch_size=500
+                )
+                MaterialExpense.objects.bulk_create(
+                    [e for e in to_create if isinstance(e, MaterialExpense)], batch_size=500
+                )
+                self.created = len(to_create)
+        except FundsCheckFailed:
+            self.created = 0
+        return self
+
+    def error_list(self):
+        return [{'row': number, 'errors': self.errors[number]} for number in sorted(self.errors)]
@@ -0,0 +1,98 @@
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F
+from django.http import StreamingHttpResponse
+
+from .pagination import keyset_filter
+
+DEFAULT_CHUNK_SIZE = 2000
+MAX_CHUNK_SIZE = 10000
+
+EXPENSE_EXPORT_FIELDS = {
+    'manpower': (
+        ['id', 'project_id', 'date', 'number_of_people', 'per_person_cost', 'total_amount', 'description', 'created_at'],
+        {'project_name': F('project__name'), 'work_type_name': F('work_type__name')},
+    ),
+    'material': (
+        ['id', 'project_id', 'date', 'custom_item_name', 'per_unit_cost', 'quantity', 'total_amount',
+         'description', 'created_at'],
+        {'project_name': F('project__name'), 'item_name': F('item__name'), 'item_display': F('item__display_name')},
+    ),
+}
+
+PAYMENT_EXPORT_FIELDS = (
+    ['id', 'project_id', 'payment_date', 'payment_type', 'amount', 'description', 'created_at'],
+    {'project_name': F('project__name')},
+)
+
+
+class Echo:
+    """A file-like object that hands back what csv.writer writes to it."""
+
+    def write(self, value):
+        return value
+
+
+def iter_rows(queryset, ordering, fields, expressions, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yield values() dicts for every row of queryset in ordering.
+
+    Rows are read in keyset batches of chunk_size, each batch seeking past
+    the last row of the previous one. Only one batch is held in memory, even
+    on MySQL, where mysqlclient buffers whole result sets client-side and
+    .iterator() alone would not keep memory flat.
+    """
+    names = [field.lstrip('-') for field in ordering]
+    # Ordering columns that are not exported (e.g. search_rank) are still
+    # read, to seek from, and dropped from the rows handed out
+    extra = [name for name in names if name not in fields and name not in expressions]
+    queryset = queryset.order_by(*ordering).values(*fields, *extra, **expressions)
+    position = None
+    while True:
+        batch = queryset if position is None else queryset.filter(keyset_filter(ordering, position))
+        rows = list(batch[:chunk_size])
+        if rows:
+            position = [rows[-1][name] for name in names]
+        for row in rows:
+            for name in extra:
+                del row[name]
+            yield row
+        if len(rows) < chunk_size:
+            return
+
+
+# Spreadsheets treat text cells starting with these as formulas
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _csv_cell(value):
+    # Quote user-entered text (descriptions, names) that would otherwise run
+    # as a formula when the export is opened in a spreadsheet
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def _csv_stream(rows, columns):
+    writer = csv.writer(Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow([_csv_cell(row[column]) for column in columns])
+
+
+def _ndjson_stream(rows):
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder) + '\n'
+
+
+def export_response(rows, columns, filename, output='csv'):
+    if output == 'ndjson':
+        response = StreamingHttpResponse(_ndjson_stream(rows), content_type='application/x-ndjson')
+        extension = 'ndjson'
+    else:
+        response = StreamingHttpResponse(_csv_stream(rows, columns), content_type='text/csv')
+        extension = 'csv'
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{extension}"'
+    return response
@@ -0,0 +1,261 @@
+"""
+Load generation against a locally started server: a small asyncio HTTP/1.1
+client (keep-alive, Content-Length and chunked bodies) and a helper that
+runs the app under uvicorn (ASGI) or Django's threaded WSGI server in a
+subprocess. Used by the benchmark_async, benchmark_downloads and loadtest
+commands.
+"""
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+
+class HTTPConnection:
+    """One keep-alive HTTP/1.1 connection."""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def open(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except ConnectionError:
+                pass
+            self.reader = self.writer = None
+
+    async def request(self, method, path, headers=None, body=b'', discard_body=False):
+        """
+        Send a request and return (status, headers, body), reconnecting if
+        needed. With discard_body the body is read and dropped in chunks and
+        its length is returned instead.
+        """
+        if self.writer is None:
+            await self.open()
+        lines = [f'{method} {path} HTTP/1.1', f'Host: {self.host}:{self.port}', f'Content-Length: {len(body)}']
+        lines += [f'{name}: {value}' for name, value in (headers or {}).items()]
+        self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError('Server closed the connection')
+        status = int(status_line.split()[1])
+        response_headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+
+        if method == 'HEAD' or status in (204, 304):
+            content = b''
+        elif response_headers.get('transfer-encoding', '').lower() == 'chunked':
+            content = await self._read_chunked(discard_body)
+        else:
+            content = await self._read(int(response_headers.get('content-length', 0)), discard_body)
+        if discard_body and isinstance(content, bytes):
+            content = len(content)
+        if response_headers.get('connection', '').lower() == 'close':
+            await self.close()
+        return status, response_headers, content
+
+    async def _read(self, size, discard):
+        if not discard:
+            return await self.reader.readexactly(size)
+        remaining = size
+        while remaining:
+            remaining -= len(await self.reader.readexactly(min(remaining, 256 * 1024)))
+        return size
+
+    async def _read_chunked(self, discard=False):
+        chunks = []
+        total = 0
+        while True:
+            size = int((await self.reader.readline()).split(b';')[0], 16)
+            if size == 0:
+                # Trailers, if any, end with a blank line
+                while (await self.reader.readline()) not in (b'\r\n', b''):
+                    pass
+                return total if discard else b''.join(chunks)
+            chunk = await self._read(size, discard)
+            if discard:
+                total += chunk
+            else:
+                chunks.append(chunk)
+            await self.reader.readline()
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class LoadResult:
+    """Latencies and statuses of a run; statuses >= error_status are errors."""
+
+    def __init__(self, error_status=500):
+        self.error_status = error_status
+        self.latencies = []
+        self.errors = 0
+        self.statuses = {}
+        self.elapsed = 0
+
+    def record(self, status, latency):
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        if status >= self.error_status:
+            self.errors += 1
+        else:
+            self.latencies.append(latency)
+
+    def summary(self):
+        latencies = sorted(self.latencies)
+        requests = len(latencies) + self.errors
+        return {
+            'requests': requests,
+            'errors': self.errors,
+            'error_rate': round(self.errors / requests, 4) if requests else 0,
+            'throughput': round(requests / self.elapsed, 1) if self.elapsed else 0,
+            'mean_ms': round(statistics.fmean(latencies) * 1000, 1) if latencies else 0,
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 1),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 1),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 1),
+            'statuses': self.statuses,
+        }
+
+
+async def run_load(host, port, next_request, concurrency, duration):
+    """
+    Drive the server with `concurrency` clients for `duration` seconds. Each
+    client sends next_request() -> (method, path) back to back on its own
+    connection. Connection failures count as errors.
+    """
+    result = LoadResult()
+    deadline = time.perf_counter() + duration
+
+    async def client():
+        connection = HTTPConnection(host, port)
+        try:
+            while time.perf_counter() < deadline:
+                method, path = next_request()
+                start = time.perf_counter()
+                try:
+                    status, _, _ = await connection.request(method, path)
+                except (ConnectionError, asyncio.IncompleteReadError, ValueError, IndexError):
+                    await connection.close()
+                    status = 599
+                result.record(status, time.perf_counter() - start)
+        finally:
+            await connection.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+def free_port(host='127.0.0.1'):
+    with socket.socket() as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+
+
+class ServerProcess:
+    """
+    `with Server(env={...}) as server:` runs the project in a server
+    subprocess until the block exits. Subclasses give the command line.
+    """
+    name = 'server'
+    # Where the server's stdout and stderr go; None leaves them on ours
+    output = None
+
+    def __init__(self, host='127.0.0.1', port=None, env=None, startup_timeout=30):
+        self.host = host
+        self.port = port or free_port(host)
+        self.env = env or {}
+        self.startup_timeout = startup_timeout
+        self.process = None
+
+    def command(self):
+        raise NotImplementedError
+
+    def __enter__(self):
+        env = {**os.environ, **self.env}
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, [os.getcwd(), env.get('PYTHONPATH')]))
+        self.process = subprocess.Popen(self.command(), env=env, stdout=self.output, stderr=self.output)
+        deadline = time.monotonic() + self.startup_timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f'{self.name} exited with status {self.process.returncode}')
+            try:
+                with socket.create_connection((self.host, self.port), timeout=0.5):
+                    return self
+            except OSError:
+                time.sleep(0.2)
+        self.__exit__(None, None, None)
+        raise RuntimeError(f'{self.name} did not start within {self.startup_timeout}s')
+
+    def memory(self):
+        """
+        Resident and peak resident memory of the server process in bytes
+        (Linux only). With workers=1 that process also serves the requests.
+        """
+        values = {}
+        with open(f'/proc/{self.process.pid}/status') as status:
+            for line in status:
+                name, _, value = line.partition(':')
+                if name in ('VmRSS', 'VmHWM'):
+                    values[name] = int(value.split()[0]) * 1024
+        return {'rss': values['VmRSS'], 'peak': values['VmHWM']}
+
+    def __exit__(self, *exc_info):
+        if self.process is not None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+            self.process = None
+
+
+class UvicornServer(ServerProcess):
+    """The project's ASGI application under uvicorn."""
+    name = 'uvicorn'
+
+    def __init__(self, app='construction_management.asgi:application', workers=1, **kwargs):
+        super().__init__(**kwargs)
+        self.app = app
+        self.workers = workers
+
+    def command(self):
+        return [sys.executable, '-m', 'uvicorn', self.app, '--host', self.host, '--port', str(self.port),
+                '--workers', str(self.workers), '--no-access-log', '--log-level', 'warning']
+
+
+class WSGIServer(ServerProcess):
+    """
+    The project's WSGI application under Django's own server (runserver
+    without the autoreloader): one process, a thread per connection. Its
+    output is dropped, as it logs every request.
+    """
+    name = 'runserver'
+    output = subprocess.DEVNULL
+
+    def command(self):
+        return [sys.executable, '-m', 'django', 'runserver', f'{self.host}:{self.port}',
+                '--noreload', '--nostatic', '--skip-checks']
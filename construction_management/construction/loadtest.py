@@ -0,0 +1,290 @@
+"""
+Mixed-traffic load test against a running server (see the loadtest
+command). Simulated site supervisors open the projects page, list expenses,
+record manpower and material expenses and payments, and read reports, each
+request picked at random by weight. Client n draws from its own random
+stream seeded with f'{seed}:{n}', so a given seed replays the same sequence
+of requests on every run.
+"""
+import asyncio
+import json
+import math
+import random
+import re
+import time
+from urllib.parse import urlencode
+
+from django.utils import timezone
+
+from .http_load import HTTPConnection, LoadResult
+from .models import LaborWorkType, ManpowerExpense, MaterialExpense, MaterialItem, Payment, Project
+
+SERVER_TIMING_DB = re.compile(r'(?:^|,)\s*db;(?:[^,]*;)?dur=([\d.]+)')
+
+
+def get(path, **query):
+    return lambda rng, ctx: ('GET', path + ('?' + urlencode(query) if query else ''), None)
+
+
+def list_expenses(rng, ctx):
+    query = {'type': rng.choice(['manpower', 'material', 'all']), 'project_id': rng.choice(ctx['projects'])}
+    return 'GET', '/api/expenses/?' + urlencode(query), None
+
+
+def create_manpower(rng, ctx):
+    people = rng.randint(2, 12)
+    cost = rng.choice([450, 600, 750, 900])
+    return 'POST', '/api/expenses/', {
+        'type': 'manpower', 'project': rng.choice(ctx['projects']), 'work_type': rng.choice(ctx['work_types']),
+        'date': ctx['today'], 'number_of_people': people, 'per_person_cost': str(cost),
+        'total_amount': str(people * cost), 'description': 'Load test crew',
+    }
+
+
+def create_material(rng, ctx):
+    return 'POST', '/api/expenses/', {
+        'type': 'material', 'project': rng.choice(ctx['projects']), 'item': rng.choice(ctx['items']),
+        'date': ctx['today'], 'quantity': str(rng.randint(1, 40)), 'per_unit_cost': str(rng.choice([35, 120, 420])),
+        'description': 'Load test delivery',
+    }
+
+
+def create_payment(rng, ctx):
+    return 'POST', '/api/payments/', {
+        'project': rng.choice(ctx['projects']), 'amount': str(rng.randrange(1000, 20000, 500)),
+        'payment_date': ctx['today'], 'payment_type': rng.choice(['Advance', 'Installment']),
+    }
+
+
+def report(time_range):
+    return lambda rng, ctx: (
+        'GET', f'/api/reports/{rng.choice(ctx["projects"])}/?' + urlencode({'time_range': time_range}), None,
+    )
+
+
+# name -> (default weight, request(rng, ctx) -> (method, path, JSON body or None))
+SCENARIOS = {
+    'projects-page': (5, get('/projects/')),
+    'projects-list': (10, get('/api/projects/')),
+    'expenses-list': (25, list_expenses),
+    'create-manpower': (12, create_manpower),
+    'create-material': (8, create_material),
+    'create-payment': (4, create_payment),
+    'report-month': (6, report('month')),
+    'report-quarter': (4, report('quarter')),
+    'report-year': (4, report('year')),
+}
+
+# Rows the write scenarios create, removed again after a run
+CREATED_MODELS = {
+    'create-manpower': ManpowerExpense,
+    'create-material': MaterialExpense,
+    'create-payment': Payment,
+}
+
+
+def load_context(projects=20):
+    """
+    Ids the scenarios draw from: the projects with the most budget left, so
+    the payments and expenses they post are not refused for lack of funds.
+    """
+    return {
+        'projects': list(
+            Project.objects.order_by('-remaining_amount', 'pk').values_list('pk', flat=True)[:projects]
+        ),
+        'work_types': list(LaborWorkType.objects.order_by('pk').values_list('pk', flat=True)),
+        'items': list(
+            MaterialItem.objects.filter(is_active=True).exclude(name='others').order_by('pk')
+            .values_list('pk', flat=True)
+        ),
+        'today': timezone.localdate().isoformat(),
+    }
+
+
+class LoadProfile:
+    """
+    How many clients are active `elapsed` seconds into a run:
+    'constant' all of them throughout; 'ramp' adds them evenly over ramp_up
+    seconds (half the run by default) and then holds; 'step' adds them in
+    `steps` equal stages; 'spike' runs a fifth of them, all of them for the
+    middle fifth of the run, then a fifth again.
+    """
+    KINDS = ('constant', 'ramp', 'step', 'spike')
+
+    def __init__(self, kind, concurrency, duration, ramp_up=None, steps=4):
+        if kind not in self.KINDS:
+            raise ValueError(f'Unknown profile {kind!r}')
+        self.kind = kind
+        self.concurrency = concurrency
+        self.duration = duration
+        self.ramp_up = ramp_up or duration / 2
+        self.steps = max(1, steps)
+
+    def clients_at(self, elapsed):
+        if self.kind == 'ramp':
+            return max(1, min(self.concurrency, math.ceil(self.concurrency * elapsed / self.ramp_up)))
+        if self.kind == 'step':
+            stage = min(self.steps - 1, int(elapsed * self.steps / self.duration))
+            return max(1, math.ceil(self.concurrency * (stage + 1) / self.steps))
+        if self.kind == 'spike' and not 0.4 <= elapsed / self.duration < 0.6:
+            return max(1, self.concurrency // 5)
+        return self.concurrency
+
+    def time_at_levels(self, samples=1000):
+        """{clients: seconds the profile spends with that many clients active}."""
+        step = self.duration / samples
+        levels = {}
+        for sample in range(samples):
+            clients = self.clients_at((sample + 0.5) * step)
+            levels[clients] = levels.get(clients, 0) + step
+        return levels
+
+
+class ScenarioResult(LoadResult):
+    """A LoadResult plus the query totals the server reported (X-DB-Queries, Server-Timing)."""
+
+    def __init__(self):
+        super().__init__(error_status=400)
+        self.queries = 0
+        self.db_time = 0.0
+        self.counted = 0
+
+    def record(self, status, latency, headers=None):
+        super().record(status, latency)
+        if headers and 'x-db-queries' in headers:
+            self.counted += 1
+            self.queries += int(headers['x-db-queries'])
+            match = SERVER_TIMING_DB.search(headers.get('server-timing', ''))
+            if match:
+                self.db_time += float(match.group(1)) / 1000
+
+    def summary(self):
+        summary = super().summary()
+        if self.counted:
+            summary['queries'] = self.queries
+            summary['queries_per_request'] = round(self.queries / self.counted, 1)
+            summary['db_ms_per_request'] = round(self.db_time * 1000 / self.counted, 2)
+        return summary
+
+
+class MixedLoad:
+    """
+    One run of the weighted mix. After run(): `results` per scenario,
+    `levels` per number of active clients, `total`, and `created`, a list
+    of (scenario, id) for every row the run added.
+    """
+
+    def __init__(self, host, port, ctx, profile, weights=None, seed=42, think_time=0, csrf_cookie='csrftoken'):
+        self.host = host
+        self.port = port
+        self.ctx = ctx
+        self.profile = profile
+        weights = {name: weight for name, (weight, _) in SCENARIOS.items()} if weights is None else weights
+        self.weights = {name: weight for name, weight in weights.items() if weight > 0}
+        if not self.weights:
+            raise ValueError('Every scenario has weight 0')
+        self.seed = seed
+        self.think_time = think_time
+        self.csrf_cookie = csrf_cookie
+        self.headers = {}
+        self.results = {name: ScenarioResult() for name in self.weights}
+        self.levels = {}
+        self.total = ScenarioResult()
+        self.created = []
+
+    async def run(self):
+        await self.fetch_csrf_token()
+        await self.warm_up()
+        start = time.perf_counter()
+        await asyncio.gather(*(self.client(index, start) for index in range(self.profile.concurrency)))
+        elapsed = time.perf_counter() - start
+        for result in [self.total, *self.results.values()]:
+            result.elapsed = elapsed
+        # Throughput at each level is over the time spent at that level
+        scale = elapsed / self.profile.duration
+        for clients, seconds in self.profile.time_at_levels().items():
+            if clients in self.levels:
+                self.levels[clients].elapsed = seconds * scale
+        return self
+
+    async def fetch_csrf_token(self):
+        """Open the projects page once for the CSRF cookie the POSTs need, as a browser would."""
+        connection = HTTPConnection(self.host, self.port)
+        try:
+            status, headers, _ = await connection.request('GET', '/projects/')
+        finally:
+            await connection.close()
+        match = re.search(rf'{re.escape(self.csrf_cookie)}=([^;]+)', headers.get('set-cookie', ''))
+        if status != 200 or not match:
+            raise RuntimeError(f'GET /projects/ returned {status} without a CSRF cookie')
+        self.headers = {'Cookie': f'{self.csrf_cookie}={match.group(1)}', 'X-CSRFToken': match.group(1)}
+
+    async def warm_up(self):
+        """One untimed request per scenario, to load code paths and caches."""
+        rng = random.Random(f'{self.seed}:warm-up')
+        connection = HTTPConnection(self.host, self.port)
+        try:
+            for name in self.weights:
+                await self.send(connection, name, rng)
+        finally:
+            await connection.close()
+
+    async def send(self, connection, name, rng):
+        method, path, payload = SCENARIOS[name][1](rng, self.ctx)
+        headers = dict(self.headers)
+        body = b''
+        if payload is not None:
+            headers['Content-Type'] = 'application/json'
+            body = json.dumps(payload).encode()
+        start = time.perf_counter()
+        try:
+            status, response_headers, content = await connection.request(method, path, headers, body)
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError, IndexError):
+            await connection.close()
+            status, response_headers, content = 599, {}, b''
+        latency = time.perf_counter() - start
+        if status == 201 and name in CREATED_MODELS:
+            self.created.append((name, json.loads(content)['id']))
+        return status, latency, response_headers
+
+    async def client(self, index, start):
+        rng = random.Random(f'{self.seed}:{index}')
+        names = list(self.weights)
+        cumulative = list(self.total_weights(names))
+        connection = HTTPConnection(self.host, self.port)
+        try:
+            while (elapsed := time.perf_counter() - start) < self.profile.duration:
+                active = self.profile.clients_at(elapsed)
+                if index >= active:
+                    await connection.close()
+                    await asyncio.sleep(0.05)
+                    continue
+                name = rng.choices(names, cum_weights=cumulative)[0]
+                status, latency, headers = await self.send(connection, name, rng)
+                self.results[name].record(status, latency, headers)
+                self.total.record(status, latency, headers)
+                self.levels.setdefault(active, ScenarioResult()).record(status, latency, headers)
+                if self.think_time:
+                    await asyncio.sleep(rng.expovariate(1 / self.think_time))
+        finally:
+            await connection.close()
+
+    def total_weights(self, names):
+        running = 0
+        for name in names:
+            running += self.weights[name]
+            yield running
+
+
+def delete_created(created):
+    """Delete the rows a run created, through the models so ledgers and project totals follow."""
+    ids = {}
+    for name, pk in created:
+        ids.setdefault(CREATED_MODELS[name], []).append(pk)
+    deleted = 0
+    # Expenses before payments, so no project's funds go negative midway
+    for model in (ManpowerExpense, MaterialExpense, Payment):
+        for row in model.objects.filter(pk__in=ids.get(model, [])).select_related('project'):
+            row.delete()
+            deleted += 1
+    return deleted
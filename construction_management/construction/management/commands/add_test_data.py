@@ -1,42 +1,54 @@
 from django.core.management.base import BaseCommand
-from construction.models import Project, NewLandExpense, NewManpowerExpense, NewMaterialExpense
+from django.db import transaction
+from construction.models import (
+    LaborWorkType, ManpowerExpense, MaterialExpense, MaterialItem, Payment, Project, create_default_material_items,
+)
 from datetime import date
+from decimal import Decimal
 
 class Command(BaseCommand):
-    help = 'Add test data to the database'
+    help = 'Add a test project with a payment and an expense of each kind (see seed_scale for bulk data)'
 
     def handle(self, *args, **options):
-        # Create a test project
-        project = Project.objects.create(
-            name='Test Project',
-            land_details='Test Land',
-            land_address='Test Address',
-            budget=1000000,
-            status='Planned'
-        )
-        self.stdout.write(self.style.SUCCESS('Created test project'))
+        create_default_material_items()
+        work_type, _ = LaborWorkType.objects.get_or_create(name='construction')
 
-        # Create test expenses
-        NewLandExpense.objects.create(
-            project=project,
-            date=date.today(),
-            amount=100000,
-            land_id='LAND001'
-        )
-        self.stdout.write(self.style.SUCCESS('Created land expense'))
+        with transaction.atomic():
+            # Create a test project
+            project = Project.objects.create(
+                name='Test Project',
+                land_details='Test Land',
+                land_address='Test Address',
+                budget=Decimal('1000000'),
+                status='Active'
+            )
+            self.stdout.write(self.style.SUCCESS(f'Created test project {project.project_id}'))
 
-        NewManpowerExpense.objects.create(
-            project=project,
-            date=date.today(),
-            amount=50000,
-            manpower_id='MAN001'
-        )
-        self.stdout.write(self.style.SUCCESS('Created manpower expense'))
+            Payment.objects.create(
+                project=project,
+                amount=Decimal('200000'),
+                payment_date=date.today(),
+                payment_type='Advance'
+            )
+            self.stdout.write(self.style.SUCCESS('Created advance payment'))
 
-        NewMaterialExpense.objects.create(
-            project=project,
-            date=date.today(),
-            amount=75000,
-            material_name='Cement'
-        )
-        self.stdout.write(self.style.SUCCESS('Created material expense')) 
\ No newline at end of file
+            ManpowerExpense.objects.create(
+                project=project,
+                work_type=work_type,
+                date=date.today(),
+                number_of_people=10,
+                per_person_cost=Decimal('800'),
+                description='Foundation crew'
+            )
+            self.stdout.write(self.style.SUCCESS('Created manpower expense'))
+
+            MaterialExpense.objects.create(
+                project=project,
+                date=date.today(),
+                item=MaterialItem.objects.get(name='cement'),
+                quantity=Decimal('100'),
+                per_unit_cost=Decimal('400'),
+                total_amount=Decimal('40000'),
+                description='Cement for foundation'
+            )
+            self.stdout.write(self.style.SUCCESS('Created material expense'))
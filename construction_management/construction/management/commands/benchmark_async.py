@@ -0,0 +1,69 @@
+import asyncio
+import itertools
+import os
+import random
+
+from django.core.management.base import BaseCommand, CommandError
+from construction.http_load import UvicornServer, run_load
+from construction.models import Project
+
+ENDPOINTS = {
+    'projects': lambda pk: '/api/projects/',
+    'payments': lambda pk: f'/api/payments/?project_id={pk}',
+    'expenses': lambda pk: f'/api/expenses/?type=manpower&project_id={pk}',
+    'report': lambda pk: f'/api/reports/{pk}/?time_range=year',
+    'project-payments': lambda pk: f'/api/projects/{pk}/payments/',
+    'material-items': lambda pk: '/api/material-items/',
+}
+
+
+class Command(BaseCommand):
+    help = 'Compares read API throughput under uvicorn with the sync views and with ASYNC_READ_VIEWS'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=50, help='Simultaneous clients')
+        parser.add_argument('--duration', type=float, default=10, help='Seconds per run')
+        parser.add_argument('--workers', type=int, default=1, help='uvicorn worker processes')
+        parser.add_argument('--endpoints', nargs='+', choices=sorted(ENDPOINTS), default=sorted(ENDPOINTS))
+        parser.add_argument('--projects', type=int, default=20, help='Spread requests over this many projects')
+        parser.add_argument('--no-report-cache', action='store_true',
+                            help='Compute every report instead of serving cached payloads')
+
+    def handle(self, *args, **options):
+        if 'DJANGO_SETTINGS_MODULE' not in os.environ:
+            raise CommandError('DJANGO_SETTINGS_MODULE must be set so the server uses the same database')
+        project_ids = list(Project.objects.order_by('-created_at').values_list('id', flat=True)[:options['projects']])
+        if not project_ids:
+            raise CommandError('No projects to read; run seed_scale or add_test_data first')
+
+        rng = random.Random(0)
+        paths = [
+            ENDPOINTS[name](pk) for name, pk in itertools.product(options['endpoints'], project_ids)
+        ]
+
+        def next_request():
+            return 'GET', rng.choice(paths)
+
+        env = {'REPORT_CACHE_TIMEOUT': '0'} if options['no_report_cache'] else {}
+        results = {}
+        for mode, async_views in (('sync', False), ('async', True)):
+            server_env = {**env, 'ASYNC_READ_VIEWS': str(async_views)}
+            with UvicornServer(workers=options['workers'], env=server_env) as server:
+                # Warm up caches and connections before measuring
+                asyncio.run(run_load(server.host, server.port, next_request, options['concurrency'], 1))
+                result = asyncio.run(run_load(
+                    server.host, server.port, next_request, options['concurrency'], options['duration']
+                ))
+            results[mode] = result.summary()
+
+        self.stdout.write(
+            f'{"views":<8}{"req/s":>10}{"mean ms":>10}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}{"errors":>8}'
+        )
+        for mode, summary in results.items():
+            self.stdout.write(
+                f'{mode:<8}{summary["throughput"]:>10}{summary["mean_ms"]:>10}{summary["p50_ms"]:>10}'
+                f'{summary["p95_ms"]:>10}{summary["p99_ms"]:>10}{summary["errors"]:>8}'
+            )
+        if results['sync']['throughput']:
+            speedup = results['async']['throughput'] / results['sync']['throughput']
+            self.stdout.write(f'async/sync throughput: {speedup:.2f}x')
@@ -0,0 +1,121 @@
+import asyncio
+import random
+import sys
+import tempfile
+import time
+from datetime import date
+from importlib import import_module
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+from construction.http_load import HTTPConnection, UvicornServer
+from construction.models import Payment, Project
+
+MB = 1024 * 1024
+
+
+class Command(BaseCommand):
+    help = ('Downloads a large payment file concurrently (whole and in ranges) from uvicorn '
+            'and fails if the worker\'s memory grows with the file size')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size-mb', type=int, default=64, help='Size of the receipt to serve')
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--rounds', type=int, default=4, help='Downloads per client')
+        parser.add_argument('--max-growth-mb', type=float, default=32,
+                            help='Fail if peak worker memory grows by more than this')
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark payment and its file')
+
+    def handle(self, *args, **options):
+        if not sys.platform.startswith('linux'):
+            raise CommandError('Worker memory is read from /proc; run this on Linux')
+        size = options['size_mb'] * MB
+        payment = self.create_payment(size)
+        # Receipts are only served to logged-in users
+        user = User.objects.create_user(f'download-benchmark-{payment.pk}')
+        session = self.create_session(user)
+        headers = {'Cookie': f'{settings.SESSION_COOKIE_NAME}={session.session_key}'}
+        try:
+            with UvicornServer() as server:
+                url = f'/api/payments/{payment.pk}/file/'
+                # One download to load the app and settle the baseline
+                asyncio.run(self.download(server, url, headers, size, 1, 1))
+                before = server.memory()
+                start = time.perf_counter()
+                transferred = asyncio.run(
+                    self.download(server, url, headers, size, options['concurrency'], options['rounds'])
+                )
+                elapsed = time.perf_counter() - start
+                after = server.memory()
+        finally:
+            session.delete()
+            user.delete()
+            if not options['keep']:
+                payment.delete()
+                payment.project.delete()
+
+        growth = (after['peak'] - before['peak']) / MB
+        self.stdout.write(
+            f'Served {transferred / MB:.0f} MB to {options["concurrency"]} clients in {elapsed:.1f}s '
+            f'({transferred / MB / elapsed:.0f} MB/s)'
+        )
+        self.stdout.write(
+            f'Worker RSS {before["rss"] / MB:.1f} -> {after["rss"] / MB:.1f} MB, '
+            f'peak {before["peak"] / MB:.1f} -> {after["peak"] / MB:.1f} MB (+{growth:.1f} MB)'
+        )
+        if growth > options['max_growth_mb']:
+            raise CommandError(f'Peak worker memory grew by {growth:.1f} MB serving a {options["size_mb"]} MB file')
+        self.stdout.write(self.style.SUCCESS('Worker memory stayed flat'))
+
+    def create_payment(self, size):
+        project = Project.objects.create(
+            name='Download benchmark', land_details='-', land_address='-', budget=Decimal('1000000'),
+        )
+        rng = random.Random(0)
+        with tempfile.TemporaryFile() as receipt:
+            for _ in range(size // MB):
+                receipt.write(rng.randbytes(MB))
+            receipt.write(rng.randbytes(size % MB))
+            receipt.seek(0)
+            payment = Payment(
+                project=project, amount=Decimal('1'), payment_date=date.today(), payment_type='Advance',
+                payment_file=File(receipt, name='large-receipt.pdf'),
+            )
+            payment.save()
+        return payment
+
+    def create_session(self, user):
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = 'django.contrib.auth.backends.ModelBackend'
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.create()
+        return session
+
+    async def download(self, server, url, session_headers, size, concurrency, rounds):
+        async def client(seed):
+            rng = random.Random(seed)
+            connection = HTTPConnection(server.host, server.port)
+            transferred = 0
+            try:
+                for round_number in range(rounds):
+                    headers = dict(session_headers)
+                    expected = size
+                    if round_number % 2:
+                        # Every other request resumes from a random offset
+                        offset = rng.randrange(size)
+                        headers['Range'] = f'bytes={offset}-'
+                        expected = size - offset
+                    status, _, length = await connection.request('GET', url, headers, discard_body=True)
+                    if status not in (200, 206) or length != expected:
+                        raise CommandError(f'GET {url} {headers}: status {status}, {length} of {expected} bytes')
+                    transferred += length
+            finally:
+                await connection.close()
+            return transferred
+
+        return sum(await asyncio.gather(*(client(seed) for seed in range(concurrency))))
@@ -0,0 +1,92 @@
+import random
+import statistics
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from construction.models import ManpowerExpense, MaterialExpense, MaterialItem, Project, ProjectLedger
+from construction.search import expense_search
+
+WORDS = [
+    'foundation', 'plastering', 'wiring', 'plumbing', 'roofing', 'tiling', 'painting', 'excavation',
+    'scaffolding', 'shuttering', 'curing', 'masonry', 'waterproofing', 'flooring', 'welding', 'polishing',
+    'ground', 'first', 'second', 'floor', 'kitchen', 'bathroom', 'terrace', 'staircase', 'compound', 'wall',
+    'labour', 'overtime', 'advance', 'delivery', 'transport', 'extra', 'repair', 'rework', 'site', 'north',
+]
+RARE_WORDS = ['marble', 'chimney', 'skylight', 'gazebo']
+
+
+class Command(BaseCommand):
+    help = 'Compares expense search latency using the full-text index against icontains'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0,
+                            help='First add this many synthetic expenses (half manpower, half material)')
+        parser.add_argument('--terms', nargs='+', default=['wiring', 'plast', 'kitchen floor', 'marble'],
+                            help='Search strings to time')
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--page-size', type=int, default=50)
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            self.seed(options['seed'])
+        if not expense_search.is_available():
+            raise CommandError('No full-text index on this database; run rebuild_search_index first')
+
+        self.stdout.write(f'{"model":<16}{"search":<16}{"fulltext ms":>12}{"icontains ms":>14}{"rows":>8}')
+        for model in (ManpowerExpense, MaterialExpense):
+            for text in options['terms']:
+                base = model.objects.order_by('-date', '-created_at', 'id')
+                fulltext = expense_search.filter(base, text)
+                fallback = expense_search.fallback_filter(base, text)
+                page = slice(0, options['page_size'] + 1)
+                fulltext_ms, rows = self.time(lambda: list(fulltext[page].values_list('id', flat=True)), options['repeat'])
+                fallback_ms, fallback_rows = self.time(lambda: list(fallback[page].values_list('id', flat=True)), options['repeat'])
+                self.stdout.write(
+                    f'{model.__name__:<16}{text:<16}{fulltext_ms:>12.1f}{fallback_ms:>14.1f}{len(rows):>8}'
+                    + ('' if len(rows) == len(fallback_rows) else f'  (icontains: {len(fallback_rows)})')
+                )
+
+    @staticmethod
+    def time(query, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = query()
+            timings.append((time.perf_counter() - start) * 1000)
+        return statistics.median(timings), result
+
+    def seed(self, count, batch_size=5000):
+        rng = random.Random(42)
+        items = list(MaterialItem.objects.all()) or [MaterialItem.objects.create(name='cement', display_name='Cement')]
+        project = Project.objects.create(
+            name='Search benchmark', land_details='-', land_address='-', budget=Decimal('1000000000'),
+        )
+
+        def description():
+            words = rng.sample(WORDS, 4)
+            if rng.random() < 0.001:
+                words.append(rng.choice(RARE_WORDS))
+            return ' '.join(words)
+
+        start = date.today() - timedelta(days=3650)
+        for offset in range(0, count, batch_size):
+            size = min(batch_size, count - offset)
+            with transaction.atomic():
+                ManpowerExpense.objects.bulk_create([
+                    ManpowerExpense(
+                        project=project, date=start + timedelta(days=rng.randrange(3650)), number_of_people=1,
+                        per_person_cost=Decimal('1'), total_amount=Decimal('1'), description=description(),
+                    ) for _ in range(size // 2)
+                ])
+                MaterialExpense.objects.bulk_create([
+                    MaterialExpense(
+                        project=project, item=rng.choice(items), date=start + timedelta(days=rng.randrange(3650)),
+                        per_unit_cost=Decimal('1'), quantity=Decimal('1'), total_amount=Decimal('1'),
+                        description=description(),
+                    ) for _ in range(size - size // 2)
+                ])
+            self.stdout.write(f'Seeded {offset + size}/{count}')
+        ProjectLedger.rebuild(project.pk)
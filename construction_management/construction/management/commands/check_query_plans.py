@@ -0,0 +1,88 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from construction.models import Project
+
+# Reference tables are a handful of rows and are fine to scan
+SMALL_TABLES = {'construction_laborworktype', 'construction_materialitem'}
+
+
+def endpoint_urls(project_id):
+    return [
+        '/api/projects/',
+        '/api/payments/',
+        f'/api/payments/?project_id={project_id}',
+        '/api/expenses/?type=manpower',
+        f'/api/expenses/?type=manpower&project_id={project_id}&start_date=2000-01-01&end_date=2100-01-01',
+        f'/api/expenses/?type=material&project_id={project_id}',
+        f'/api/expenses/summary/?project_id={project_id}',
+        f'/api/reports/{project_id}/?time_range=month',
+        f'/api/reports/{project_id}/?time_range=year',
+        '/api/portfolio/summary/',
+    ]
+
+
+def full_table_scans(sql):
+    """Return the tables a SELECT reads without using any index."""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            scans = []
+            for row in cursor.fetchall():
+                detail = row[-1]
+                if detail.startswith('SCAN ') and 'USING' not in detail:
+                    table = detail.split()[1]
+                    if table != 'CONSTANT':
+                        scans.append(table)
+            return scans
+        if connection.vendor == 'mysql':
+            cursor.execute('EXPLAIN ' + sql)
+            columns = [column[0] for column in cursor.description]
+            rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+            return [row['table'] for row in rows if row['type'] == 'ALL']
+        if connection.vendor == 'postgresql':
+            cursor.execute('EXPLAIN ' + sql)
+            return [
+                line.split(' on ')[1].split()[0]
+                for (line,) in cursor.fetchall() if 'Seq Scan on ' in line
+            ]
+    raise CommandError(f'EXPLAIN is not supported for the {connection.vendor} backend')
+
+
+class Command(BaseCommand):
+    help = 'Runs EXPLAIN on the SQL each API endpoint generates and fails on full table scans'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--project', type=int,
+                            help='Project id used in per-project endpoints (defaults to the newest project)')
+
+    def handle(self, *args, **options):
+        project_id = options['project'] or Project.objects.values_list('id', flat=True).first()
+        if project_id is None:
+            raise CommandError('No projects found; seed the database first')
+
+        failures = []
+        client = Client()
+        with override_settings(ALLOWED_HOSTS=list(settings.ALLOWED_HOSTS) + ['testserver']):
+            for url in endpoint_urls(project_id):
+                with CaptureQueriesContext(connection) as ctx:
+                    response = client.get(url)
+                if response.status_code != 200:
+                    raise CommandError(f'{url} returned {response.status_code}')
+
+                scanned = set()
+                for query in ctx.captured_queries:
+                    if not query['sql'].lstrip().upper().startswith('SELECT'):
+                        continue
+                    scanned.update(table for table in full_table_scans(query['sql']) if table not in SMALL_TABLES)
+
+                if scanned:
+                    failures.append(url)
+                    self.stdout.write(self.style.ERROR(f'FULL SCAN {url}: {", ".join(sorted(scanned))}'))
+                else:
+                    self.stdout.write(self.style.SUCCESS(f'OK {url} ({len(ctx.captured_queries)} queries)'))
+
+        if failures:
+            raise CommandError(f'{len(failures)} endpoint(s) do full table scans')
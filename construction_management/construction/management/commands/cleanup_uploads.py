@@ -0,0 +1,51 @@
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from construction.models import UploadSession
+from construction.storage import payment_file_storage
+from construction.uploads import UPLOAD_DIR, discard_session
+
+
+class Command(BaseCommand):
+    help = ('Deletes resumable upload sessions that have been idle too long, with their '
+            'part files, and releases files that were uploaded but never attached to a payment')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=float,
+                            default=getattr(settings, 'CHUNKED_UPLOAD_EXPIRY_HOURS', 24),
+                            help='Delete sessions not written to for this many hours')
+        parser.add_argument('--dry-run', action='store_true', help='Only list what would be deleted')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options['hours'])
+        stale = UploadSession.objects.filter(updated_at__lt=cutoff).order_by('updated_at')
+
+        deleted = 0
+        freed = 0
+        for session in stale.iterator():
+            self.stdout.write(f'{session.pk} {session}, idle since {session.updated_at:%Y-%m-%d %H:%M}')
+            if not options['dry_run']:
+                freed += discard_session(session)
+            deleted += 1
+
+        # Part files left without a session, e.g. by a crash while starting one
+        orphans = 0
+        directory = payment_file_storage.path(UPLOAD_DIR)
+        if os.path.isdir(directory):
+            known = {f'{pk}.part' for pk in UploadSession.objects.values_list('pk', flat=True)}
+            for entry in os.scandir(directory):
+                if entry.name in known or entry.stat().st_mtime > cutoff.timestamp() or not entry.is_file():
+                    continue
+                orphans += 1
+                if not options['dry_run']:
+                    freed += entry.stat().st_size
+                    os.remove(entry.path)
+
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {deleted} upload sessions idle for over {options["hours"]:g} hours and '
+            f'{orphans} orphaned part files; freed {freed:,} bytes of partial uploads'
+        ))
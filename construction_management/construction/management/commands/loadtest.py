@@ -0,0 +1,125 @@
+import asyncio
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from construction.http_load import UvicornServer, WSGIServer
+from construction.loadtest import SCENARIOS, LoadProfile, MixedLoad, delete_created, load_context
+
+
+def parse_mix(values):
+    weights = {name: weight for name, (weight, _) in SCENARIOS.items()}
+    for value in values or []:
+        name, _, weight = value.partition('=')
+        if name not in SCENARIOS or not weight.isdigit():
+            raise CommandError(f'--mix takes NAME=WEIGHT with NAME one of {", ".join(SCENARIOS)}; got {value!r}')
+        weights[name] = int(weight)
+    return weights
+
+
+class Command(BaseCommand):
+    help = ('Starts the app under uvicorn (ASGI) or Django\'s threaded WSGI server and replays a weighted mix '
+            'of page views, expense and payment posts and reports, then reports throughput, latency '
+            'percentiles, error rate and database queries per scenario. It writes expenses and payments '
+            'to the configured database and deletes them afterwards unless --keep-data is given; run it '
+            'against a database seeded with seed_scale.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--server', choices=['asgi', 'wsgi'], default='asgi')
+        parser.add_argument('--workers', type=int, default=1, help='uvicorn worker processes (ASGI)')
+        parser.add_argument('--async-views', action='store_true', help='Serve reads with ASYNC_READ_VIEWS (ASGI)')
+        parser.add_argument('--concurrency', type=int, default=20, help='Simultaneous clients at peak')
+        parser.add_argument('--duration', type=float, default=30, help='Seconds to run')
+        parser.add_argument('--profile', choices=LoadProfile.KINDS, default='constant',
+                            help='How clients join: all at once, ramp, step or spike')
+        parser.add_argument('--ramp-up', type=float, help='Seconds to reach full concurrency (ramp profile)')
+        parser.add_argument('--steps', type=int, default=4, help='Stages of the step profile')
+        parser.add_argument('--think-time', type=float, default=0,
+                            help='Mean seconds a client pauses between requests (0: back to back)')
+        parser.add_argument('--seed', type=int, default=42, help='Same seed, same request sequence')
+        parser.add_argument('--projects', type=int, default=20, help='Spread requests over this many projects')
+        parser.add_argument('--mix', nargs='+', metavar='NAME=WEIGHT',
+                            help=f'Override scenario weights; scenarios: {", ".join(SCENARIOS)}')
+        parser.add_argument('--json', help='Also write the results to this file')
+        parser.add_argument('--keep-data', action='store_true', help='Keep the rows the run created')
+
+    def handle(self, *args, **options):
+        if 'DJANGO_SETTINGS_MODULE' not in os.environ:
+            raise CommandError('DJANGO_SETTINGS_MODULE must be set so the server uses the same database')
+        if options['async_views'] and options['server'] != 'asgi':
+            raise CommandError('--async-views needs --server asgi')
+        if options['workers'] != 1 and options['server'] != 'asgi':
+            raise CommandError('The WSGI server runs one process; --workers needs --server asgi')
+        weights = parse_mix(options['mix'])
+        ctx = load_context(options['projects'])
+        if not ctx['projects'] or not ctx['work_types'] or not ctx['items']:
+            raise CommandError('Nothing to load test against; run seed_scale first')
+        profile = LoadProfile(
+            options['profile'], options['concurrency'], options['duration'], options['ramp_up'], options['steps'],
+        )
+
+        env = {'QUERY_STATS_HEADERS': 'True', 'ASYNC_READ_VIEWS': str(options['async_views'])}
+        if options['server'] == 'asgi':
+            server = UvicornServer(workers=options['workers'], env=env)
+        else:
+            server = WSGIServer(env=env)
+        load = None
+        try:
+            with server:
+                load = MixedLoad(
+                    server.host, server.port, ctx, profile, weights, seed=options['seed'],
+                    think_time=options['think_time'], csrf_cookie=settings.CSRF_COOKIE_NAME,
+                )
+                asyncio.run(load.run())
+        except (RuntimeError, ValueError, ConnectionError) as e:
+            raise CommandError(str(e))
+        finally:
+            if load is not None and not options['keep_data']:
+                delete_created(load.created)
+
+        self.report(load, options)
+
+    def report(self, load, options):
+        self.stdout.write(
+            f'{options["server"]} server, {options["workers"]} worker(s), {options["profile"]} profile up to '
+            f'{options["concurrency"]} clients for {options["duration"]:g}s, seed {options["seed"]}'
+        )
+        self.write_table('scenario', {name: result.summary() for name, result in load.results.items()},
+                         load.total.summary())
+        if options['profile'] != 'constant':
+            self.stdout.write('')
+            self.write_table('clients', {level: load.levels[level].summary() for level in sorted(load.levels)})
+
+        if options['json']:
+            with open(options['json'], 'w') as output:
+                json.dump({
+                    'options': {key: options[key] for key in (
+                        'server', 'workers', 'async_views', 'concurrency', 'duration', 'profile', 'ramp_up',
+                        'steps', 'think_time', 'seed', 'projects',
+                    )},
+                    'weights': load.weights,
+                    'scenarios': {name: result.summary() for name, result in load.results.items()},
+                    'levels': {str(level): result.summary() for level, result in sorted(load.levels.items())},
+                    'total': load.total.summary(),
+                }, output, indent=2)
+                output.write('\n')
+
+    def write_table(self, label, rows, total=None):
+        self.stdout.write(
+            f'{label:<16}{"requests":>9}{"req/s":>8}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"errors":>8}'
+            f'{"queries":>9}{"q/req":>7}{"db ms":>7}'
+        )
+        for name, summary in [*rows.items(), *([('total', total)] if total else [])]:
+            self.stdout.write(
+                f'{name:<16}{summary["requests"]:>9}{summary["throughput"]:>8}{summary["p50_ms"]:>9}'
+                f'{summary["p95_ms"]:>9}{summary["p99_ms"]:>9}{summary["error_rate"]:>8.1%}'
+                f'{summary.get("queries", "-"):>9}{summary.get("queries_per_request", "-"):>7}'
+                f'{summary.get("db_ms_per_request", "-"):>7}'
+            )
+        if total:
+            errors = {status: count for status, count in total['statuses'].items() if status >= 400}
+            if errors:
+                self.stdout.write('error statuses: ' + ', '.join(
+                    f'{status} x{count}' for status, count in sorted(errors.items())
+                ))
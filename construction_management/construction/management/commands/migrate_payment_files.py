@@ -0,0 +1,97 @@
+import hashlib
+
+from django.core.files import File
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum
+from construction.models import Payment, ProjectLedger, StoredFile
+from construction.storage import CHUNK_SIZE, content_name, payment_file_storage
+
+
+def format_bytes(size):
+    return f'{size:,} bytes'
+
+
+class Command(BaseCommand):
+    help = ('Moves payment files into content-addressed storage, recounts references '
+            'and deletes unreferenced files, reporting the bytes reclaimed')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report how many bytes deduplication would reclaim')
+
+    def handle(self, *args, **options):
+        storage = payment_file_storage
+        stored_bytes = StoredFile.objects.aggregate(total=Sum('size'))['total'] or 0
+
+        # Payments whose file is not in content-addressed storage yet
+        legacy = {}
+        for pk, project_id, name in (
+            Payment.objects.exclude(payment_file__isnull=True).exclude(payment_file='')
+            .exclude(payment_file__in=StoredFile.objects.values('name'))
+            .values_list('pk', 'project_id', 'payment_file')
+        ):
+            legacy.setdefault(name, []).append((pk, project_id))
+
+        legacy_bytes = 0
+        new_names = {}
+        for name, payments in legacy.items():
+            if not storage.exists(name):
+                self.stdout.write(self.style.WARNING(f'Missing file {name} (payments {[pk for pk, _ in payments]})'))
+                continue
+            legacy_bytes += storage.size(name)
+            if options['dry_run']:
+                new_names[self.content_name_of(name)] = storage.size(name)
+                continue
+
+            with storage.open(name) as legacy_file:
+                new_name = storage.save(name, File(legacy_file, name=name))
+            with transaction.atomic():
+                Payment.objects.filter(pk__in=[pk for pk, _ in payments]).update(payment_file=new_name)
+                # The file URL in payment responses changed
+                for project_id in {project_id for _, project_id in payments}:
+                    ProjectLedger.bump_version(project_id)
+            storage.delete(name)
+            self.stdout.write(f'{name} -> {new_name}')
+
+        if options['dry_run']:
+            existing = set(StoredFile.objects.filter(name__in=list(new_names)).values_list('name', flat=True))
+            after = stored_bytes + sum(size for new_name, size in new_names.items() if new_name not in existing)
+            self.stdout.write(self.style.SUCCESS(
+                f'{len(legacy)} legacy files, {format_bytes(legacy_bytes)}; '
+                f'would reclaim {format_bytes(stored_bytes + legacy_bytes - after)}'
+            ))
+            return
+
+        recounted = self.recount()
+        collected = StoredFile.collect()
+        after = StoredFile.objects.aggregate(total=Sum('size'))['total'] or 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Moved {len(legacy)} legacy files ({format_bytes(legacy_bytes)}), fixed {recounted} reference '
+            f'counts, deleted {format_bytes(collected)} of unreferenced files. '
+            f'Reclaimed {format_bytes(stored_bytes + legacy_bytes - after)}; '
+            f'{StoredFile.objects.count()} files, {format_bytes(after)} stored.'
+        ))
+
+    @staticmethod
+    def content_name_of(name):
+        digest = hashlib.sha256()
+        with payment_file_storage.open(name) as legacy_file:
+            for chunk in legacy_file.chunks(CHUNK_SIZE):
+                digest.update(chunk)
+        return content_name(name, digest.hexdigest())
+
+    @staticmethod
+    def recount():
+        """Set every StoredFile's ref_count to the number of payments using it."""
+        counts = dict(
+            Payment.objects.filter(payment_file__in=StoredFile.objects.values('name'))
+            .order_by().values_list('payment_file').annotate(count=Count('id'))
+        )
+        fixed = 0
+        for stored in StoredFile.objects.only('pk', 'name', 'ref_count').iterator():
+            expected = counts.get(stored.name, 0)
+            if stored.ref_count != expected:
+                StoredFile.objects.filter(pk=stored.pk).update(ref_count=expected)
+                fixed += 1
+        return fixed
@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+from construction.models import ProjectLedger
+
+class Command(BaseCommand):
+    help = 'Rebuilds project ledger totals from payment and expense rows and reports drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--project', type=int, action='append', dest='projects',
+                            help='Only rebuild the ledger of this project id (repeatable)')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report drift without writing any changes')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        project_ids = options['projects']
+        batch_size = options['batch_size']
+
+        with transaction.atomic():
+            totals = ProjectLedger.compute_totals(project_ids)
+            existing = ProjectLedger.objects.select_for_update().in_bulk(list(totals))
+
+            missing = []
+            drifted = []
+            for project_id, expected in totals.items():
+                ledger = existing.get(project_id)
+                if ledger is None:
+                    missing.append(ProjectLedger(project_id=project_id, **expected))
+                    continue
+                changes = {
+                    field: (getattr(ledger, field), value)
+                    for field, value in expected.items()
+                    if getattr(ledger, field) != value
+                }
+                if changes:
+                    for field, (old, new) in changes.items():
+                        self.stdout.write(self.style.WARNING(
+                            f'Project {project_id}: {field} is {old}, expected {new}'
+                        ))
+                        setattr(ledger, field, new)
+                    drifted.append(ledger)
+
+            if not options['dry_run']:
+                ProjectLedger.objects.bulk_create(missing, batch_size=batch_size)
+                ProjectLedger.objects.bulk_update(drifted, ProjectLedger.TOTAL_FIELDS, batch_size=batch_size)
+                # Corrected totals invalidate any cached reports
+                ProjectLedger.objects.filter(pk__in=[ledger.pk for ledger in drifted]).update(version=F('version') + 1)
+
+        action = 'Found' if options['dry_run'] else 'Fixed'
+        self.stdout.write(self.style.SUCCESS(
+            f'Checked {len(totals)} ledgers. {action} {len(drifted)} drifted and {len(missing)} missing.'
+        ))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError
+from construction.search import expense_search
+
+class Command(BaseCommand):
+    help = 'Creates the full-text search index for expenses if missing and rebuilds its contents'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--drop', action='store_true',
+                            help='Remove the index instead; searches fall back to icontains')
+
+    def handle(self, *args, **options):
+        try:
+            if options['drop']:
+                expense_search.uninstall()
+                self.stdout.write(self.style.SUCCESS('Dropped the expense search index.'))
+                return
+            expense_search.install()
+        except DatabaseError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS('Expense search index is up to date.'))
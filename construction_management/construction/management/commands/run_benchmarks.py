@@ -0,0 +1,96 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+from construction import benchmarks
+from construction.search import expense_search
+
+
+class Command(BaseCommand):
+    help = ('Seeds each benchmark dataset into a throwaway test database, measures every API scenario '
+            '(median/p95 latency, queries, peak memory) and fails on regressions against the JSON baseline')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--datasets', nargs='+', choices=list(benchmarks.DATASETS),
+                            default=list(benchmarks.DATASETS))
+        parser.add_argument('--scenarios', nargs='+', choices=list(benchmarks.SCENARIOS),
+                            default=list(benchmarks.SCENARIOS))
+        parser.add_argument('--iterations', type=int, default=20, help='Timed requests per round')
+        parser.add_argument('--rounds', type=int, default=3, help='Rounds per scenario; the best one counts')
+        parser.add_argument('--baseline', default=benchmarks.BASELINE_PATH)
+        parser.add_argument('--update-baseline', action='store_true',
+                            help='Write these results as the new baseline instead of comparing')
+        parser.add_argument('--output', help='Also write the results as JSON to this path')
+        parser.add_argument('--threshold', type=float, default=0.5,
+                            help='Allowed relative growth of median and p95 latency (0.5 = 50%%)')
+        parser.add_argument('--memory-threshold', type=float, default=0.2,
+                            help='Allowed relative growth of peak allocated memory')
+        parser.add_argument('--query-threshold', type=int, default=0, help='Allowed extra queries per request')
+        parser.add_argument('--min-delta-ms', type=float, default=2.0,
+                            help='Latency changes smaller than this are noise, whatever the ratio')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if not options['update_baseline']:
+            baseline = benchmarks.load_baseline(options['baseline'])
+            if baseline is None:
+                raise CommandError(f'No baseline at {options["baseline"]}; run with --update-baseline first')
+
+        results = {
+            'environment': benchmarks.environment(),
+            'iterations': options['iterations'],
+            'rounds': options['rounds'],
+            'datasets': {},
+        }
+        setup_test_environment()
+        try:
+            for dataset in options['datasets']:
+                results['datasets'][dataset] = self.run_dataset(dataset, options)
+        finally:
+            teardown_test_environment()
+
+        if options['output']:
+            benchmarks.save_results(results, options['output'])
+        if options['update_baseline']:
+            # Keep the datasets and scenarios that were not re-run
+            previous = (benchmarks.load_baseline(options['baseline']) or {}).get('datasets', {})
+            for dataset, scenarios in previous.items():
+                results['datasets'][dataset] = {**scenarios, **results['datasets'].get(dataset, {})}
+            benchmarks.save_results(results, options['baseline'])
+            self.stdout.write(self.style.SUCCESS(f'Wrote baseline {options["baseline"]}'))
+            return
+
+        if baseline.get('environment') != results['environment']:
+            self.stdout.write(self.style.WARNING(
+                f'Baseline was recorded on {baseline.get("environment")}; latencies may not be comparable'
+            ))
+        regressions = benchmarks.compare(
+            baseline, results, threshold=options['threshold'], memory_threshold=options['memory_threshold'],
+            query_threshold=options['query_threshold'], min_delta_ms=options['min_delta_ms'],
+        )
+        if regressions:
+            raise CommandError('Benchmark regressions:\n  ' + '\n  '.join(regressions))
+        self.stdout.write(self.style.SUCCESS('No regressions against the baseline'))
+
+    def run_dataset(self, dataset, options):
+        self.stdout.write(f'Seeding {dataset} dataset {benchmarks.DATASETS[dataset]}')
+        old_config = setup_databases(verbosity=0, interactive=False, aliases={'default'}, serialized_aliases=set())
+        try:
+            if expense_search.index is not None:
+                expense_search.install()
+            benchmarks.seed_dataset(dataset)
+            ctx = benchmarks.benchmark_context()
+            self.stdout.write(f'{"scenario":<22}{"median ms":>11}{"p95 ms":>9}{"queries":>9}{"peak KB":>10}')
+            results = {}
+            for name in options['scenarios']:
+                try:
+                    metrics = benchmarks.measure(name, ctx, iterations=options['iterations'], rounds=options['rounds'])
+                except benchmarks.BenchmarkError as e:
+                    raise CommandError(str(e))
+                results[name] = metrics
+                self.stdout.write(
+                    f'{name:<22}{metrics["median_ms"]:>11}{metrics["p95_ms"]:>9}'
+                    f'{metrics["queries"]:>9}{metrics["peak_kb"]:>10}'
+                )
+            return results
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            expense_search.reset()
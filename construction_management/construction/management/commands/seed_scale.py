@@ -0,0 +1,45 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from construction.seeding import ScaleSeeder
+
+
+class Command(BaseCommand):
+    help = ('Bulk-generates projects, manpower/material expenses and payments with a fixed seed, '
+            'keeping payments within budgets and expenses within payments')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--projects', type=int, default=100)
+        parser.add_argument('--expenses', type=int, default=100000, help='Manpower and material expenses in total')
+        parser.add_argument('--payments', type=int, default=10000)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--material-share', type=float, default=0.4,
+                            help='Fraction of expenses that are material expenses')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Processes generating and inserting rows; the data is the same for any number')
+        parser.add_argument('--years', type=int, default=3, help='How far back project histories start')
+        parser.add_argument('--end-date', type=date.fromisoformat,
+                            help='Latest date generated (YYYY-MM-DD, default today); fix it for identical data across days')
+
+    def handle(self, *args, **options):
+        if options['projects'] <= 0:
+            raise CommandError('--projects must be at least 1')
+        if not 0 <= options['material_share'] <= 1:
+            raise CommandError('--material-share must be between 0 and 1')
+        try:
+            seeder = ScaleSeeder(
+                options['projects'], options['expenses'], options['payments'], seed=options['seed'],
+                material_share=options['material_share'], batch_size=options['batch_size'],
+                end_date=options['end_date'], years=options['years'], workers=options['workers'],
+                log=self.stdout.write,
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        inserted = seeder.run()
+        total = sum(inserted.values())
+        self.stdout.write(self.style.SUCCESS(
+            f'Inserted {total:,} rows in {seeder.elapsed:.1f}s ({total / seeder.elapsed:,.0f} rows/s): '
+            + ', '.join(f'{count:,} {label}' for label, count in inserted.items())
+        ))
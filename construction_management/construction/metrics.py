@@ -0,0 +1,283 @@
+"""
+Per-view request metrics in Prometheus text format (see metrics_middleware
+and the /metrics view).
+
+Each process counts into a dict under a lock. With METRICS_DIR set, a
+background thread writes the process's totals to a file of its own in
+METRICS_DIR (<pid>-<random id>.json, so a worker that gets a reused pid
+never replaces an exited worker's file) every METRICS_FLUSH_INTERVAL
+seconds, and /metrics adds up every file in the directory, so whichever
+worker answers the scrape reports the whole server. As Prometheus counters
+must not go down, the totals of workers that have exited are kept: each
+scrape folds the files of dead pids into exited.json and removes them. The
+directory must be local to the host, as pids are checked with kill(pid, 0).
+"""
+import atexit
+import fcntl
+import glob
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from bisect import bisect_left
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (100, 1000, 10_000, 100_000, 1_000_000, 10_000_000)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+# name -> (type, help, buckets for histograms)
+FAMILIES = {
+    'http_requests_total': ('counter', 'Requests by view, method and status.', None),
+    'http_request_duration_seconds': ('histogram', 'Time to produce the response.', DURATION_BUCKETS),
+    'http_response_size_bytes': ('histogram', 'Response body size, where known up front.', SIZE_BUCKETS),
+    'db_queries_per_request': ('histogram', 'Database queries a request ran.', QUERY_BUCKETS),
+    'db_query_duration_seconds_total': ('counter', 'Time spent in database queries.', None),
+}
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+EXITED_FILE = 'exited.json'
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def read_samples(path):
+    with open(path) as samples:
+        return json.load(samples)
+
+
+def add_samples(totals, rows):
+    for name, labels, value in rows:
+        key = (name, tuple(labels))
+        totals[key] = totals.get(key, 0) + value
+
+
+def write_atomically(directory, name, data):
+    descriptor, temporary = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(descriptor, 'w') as output:
+            json.dump(data, output)
+        os.replace(temporary, os.path.join(directory, name))
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+class MetricsRegistry:
+    """
+    Counters keyed by (name, labels). A histogram observation adds to its
+    one bucket (the index of the first bound it fits under), to _sum and to
+    _count; buckets are made cumulative when rendered.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}
+        self.pid = os.getpid()
+        self.file_name = self._file_name()
+        self.dirty = False
+        self.flusher = None
+
+    def _file_name(self):
+        return f'{self.pid}-{uuid.uuid4().hex}.json'
+
+    def inc(self, name, labels, value=1):
+        with self.lock:
+            self._check_fork()
+            key = (name, labels)
+            self.samples[key] = self.samples.get(key, 0) + value
+            self.dirty = True
+        self._start_flusher()
+
+    def observe(self, name, labels, value):
+        buckets = FAMILIES[name][2]
+        with self.lock:
+            self._check_fork()
+            for key, amount in (
+                ((name + '_bucket', labels + (bisect_left(buckets, value),)), 1),
+                ((name + '_sum', labels), value),
+                ((name + '_count', labels), 1),
+            ):
+                self.samples[key] = self.samples.get(key, 0) + amount
+            self.dirty = True
+        self._start_flusher()
+
+    def _check_fork(self):
+        # A forked worker starts from its parent's counts; those are the
+        # parent's to report
+        if self.pid != os.getpid():
+            self.pid = os.getpid()
+            self.file_name = self._file_name()
+            self.samples = {}
+            self.flusher = None
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.samples)
+
+    # Sharing between processes
+
+    def directory(self):
+        return getattr(settings, 'METRICS_DIR', '')
+
+    def _start_flusher(self):
+        if self.flusher is None and self.directory():
+            with self.lock:
+                if self.flusher is not None:
+                    return
+                self.flusher = threading.Thread(target=self._flush_periodically, name='metrics-flush', daemon=True)
+            self.flusher.start()
+            atexit.register(self.flush)
+
+    def _flush_periodically(self):
+        interval = getattr(settings, 'METRICS_FLUSH_INTERVAL', 1.0)
+        while self.flusher is threading.current_thread():
+            time.sleep(interval)
+            try:
+                self.flush()
+            except OSError as e:
+                logger.error(f"Error writing metrics to {self.directory()}: {str(e)}")
+
+    def flush(self):
+        """Write this process's totals to its file, atomically."""
+        directory = self.directory()
+        if not directory:
+            return
+        with self.lock:
+            if not self.dirty:
+                return
+            samples = [[name, list(labels), value] for (name, labels), value in self.samples.items()]
+            self.dirty = False
+            file_name = self.file_name
+        os.makedirs(directory, exist_ok=True)
+        write_atomically(directory, file_name, samples)
+
+    def fold_exited(self, directory):
+        """
+        Add the files of processes that are gone into EXITED_FILE and delete
+        them; the caller holds the directory lock. The files folded in are
+        listed there until they are deleted, so a crash between the two
+        steps never counts one twice. Returns the exited data:
+        {'samples': [...], 'folded': [file names]}.
+        """
+        try:
+            exited = read_samples(os.path.join(directory, EXITED_FILE))
+        except FileNotFoundError:
+            exited = {'samples': [], 'folded': []}
+        folded = [name for name in exited['folded'] if os.path.exists(os.path.join(directory, name))]
+        totals = {}
+        add_samples(totals, exited['samples'])
+        dead = []
+        for path in glob.glob(os.path.join(directory, '[0-9]*-*.json')):
+            name = os.path.basename(path)
+            if name in folded or pid_alive(int(name.split('-', 1)[0])):
+                continue
+            try:
+                add_samples(totals, read_samples(path))
+            except (OSError, ValueError) as e:
+                logger.error(f"Error reading metrics from {path}: {str(e)}")
+                continue
+            dead.append(name)
+        if dead or folded != exited['folded']:
+            exited = {
+                'samples': [[name, list(labels), value] for (name, labels), value in totals.items()],
+                'folded': folded + dead,
+            }
+            write_atomically(directory, EXITED_FILE, exited)
+            for name in dead:
+                os.unlink(os.path.join(directory, name))
+        return exited
+
+    def collect(self):
+        """Totals across every process sharing METRICS_DIR (just this one without it)."""
+        directory = self.directory()
+        if not directory:
+            return self.snapshot()
+        self.flush()
+        os.makedirs(directory, exist_ok=True)
+        # Scrapes take turns, so none sees a file after another has folded it in
+        with open(os.path.join(directory, '.lock'), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            exited = self.fold_exited(directory)
+            totals = {}
+            add_samples(totals, exited['samples'])
+            for path in glob.glob(os.path.join(directory, '[0-9]*-*.json')):
+                if os.path.basename(path) in exited['folded']:
+                    continue
+                try:
+                    add_samples(totals, read_samples(path))
+                except (OSError, ValueError) as e:
+                    logger.error(f"Error reading metrics from {path}: {str(e)}")
+        return totals
+
+
+registry = MetricsRegistry()
+
+REQUEST_LABELS = ('view', 'method')
+
+
+def record_request(view, method, status, duration, size, queries, db_time):
+    labels = (view, method)
+    registry.inc('http_requests_total', labels + (str(status),))
+    registry.observe('http_request_duration_seconds', labels, duration)
+    if size is not None:
+        registry.observe('http_response_size_bytes', labels, size)
+    if queries is not None:
+        registry.observe('db_queries_per_request', labels, queries)
+        registry.inc('db_query_duration_seconds_total', labels, db_time)
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_labels(names, values):
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in zip(names, values)) + '}'
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(samples=None):
+    """The samples (default: registry.collect()) in Prometheus text format."""
+    samples = registry.collect() if samples is None else samples
+    lines = []
+    for family, (kind, help_text, buckets) in FAMILIES.items():
+        lines += [f'# HELP {family} {help_text}', f'# TYPE {family} {kind}']
+        if kind == 'counter':
+            names = REQUEST_LABELS + ('status',) if family == 'http_requests_total' else REQUEST_LABELS
+            for (name, labels), value in sorted(samples.items()):
+                if name == family:
+                    lines.append(f'{family}{format_labels(names, labels)} {format_value(value)}')
+            continue
+
+        series = sorted({labels for (name, labels) in samples if name == family + '_count'})
+        for labels in series:
+            cumulative = 0
+            for index, bound in enumerate(buckets + (float('inf'),)):
+                cumulative += samples.get((family + '_bucket', labels + (index,)), 0)
+                le = '+Inf' if bound == float('inf') else format_value(bound)
+                lines.append(
+                    f'{family}_bucket{format_labels(REQUEST_LABELS + ("le",), labels + (le,))} {cumulative}'
+                )
+            lines.append(f'{family}_sum{format_labels(REQUEST_LABELS, labels)} '
+                         f'{format_value(samples[(family + "_sum", labels)])}')
+            lines.append(f'{family}_count{format_labels(REQUEST_LABELS, labels)} '
+                         f'{samples[(family + "_count", labels)]}')
+    return '\n'.join(lines) + '\n'
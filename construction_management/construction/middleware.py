@@ -0,0 +1,107 @@
+import time
+
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.decorators import sync_and_async_middleware
+
+from .metrics import record_request
+from .profiling import profile_request, requested_mode
+from .query_stats import collect
+
+METRIC_METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+
+def add_query_headers(response, stats):
+    response['X-DB-Queries'] = stats.count
+    response['Server-Timing'] = f'db;dur={stats.duration * 1000:.2f}'
+
+
+@sync_and_async_middleware
+def query_stats_middleware(get_response):
+    """
+    With QUERY_STATS_HEADERS on, reports the queries each request ran in an
+    X-DB-Queries header and their time in Server-Timing (see the loadtest
+    command). Off by default: it tells anyone how the database is queried.
+    """
+    if not getattr(settings, 'QUERY_STATS_HEADERS', False):
+        raise MiddlewareNotUsed
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            with collect(request) as stats:
+                response = await get_response(request)
+            add_query_headers(response, stats)
+            return response
+    else:
+        def middleware(request):
+            with collect(request) as stats:
+                response = get_response(request)
+            add_query_headers(response, stats)
+            return response
+    return middleware
+
+
+def record_metrics(request, response, duration, stats):
+    match = getattr(request, 'resolver_match', None)
+    # Label by route, never by raw path, to keep the number of series bounded
+    view = match.view_name if match is not None else 'unmatched'
+    method = request.method if request.method in METRIC_METHODS else 'other'
+    if response.streaming:
+        size = int(response['Content-Length']) if response.has_header('Content-Length') else None
+    else:
+        size = len(response.content)
+    record_request(view, method, response.status_code, duration, size, stats.count, stats.duration)
+
+
+@sync_and_async_middleware
+def metrics_middleware(get_response):
+    """Request count, latency, response size and database use per view (construction.metrics)."""
+    if not getattr(settings, 'METRICS_ENABLED', True):
+        raise MiddlewareNotUsed
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            start = time.perf_counter()
+            with collect(request) as stats:
+                response = await get_response(request)
+            record_metrics(request, response, time.perf_counter() - start, stats)
+            return response
+    else:
+        def middleware(request):
+            start = time.perf_counter()
+            with collect(request) as stats:
+                response = get_response(request)
+            record_metrics(request, response, time.perf_counter() - start, stats)
+            return response
+    return middleware
+
+
+@sync_and_async_middleware
+def profiling_middleware(get_response):
+    """
+    Profiles the rest of the request when a staff user asks for it
+    (construction.profiling). Other requests only pay for a look at one
+    header and one query parameter.
+    """
+    if not getattr(settings, 'REQUEST_PROFILING', False):
+        raise MiddlewareNotUsed
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            mode = requested_mode(request)
+            if mode is None or not (await request.auser()).is_staff:
+                return await get_response(request)
+            # cProfile sees one thread. Run the chain from a worker thread;
+            # the sync views and middleware in it are then called back on
+            # that same thread (thread_sensitive), under the profiler.
+            return await sync_to_async(profile_request)(
+                lambda: async_to_sync(get_response)(request), request, mode,
+            )
+    else:
+        def middleware(request):
+            mode = requested_mode(request)
+            if mode is None or not request.user.is_staff:
+                return get_response(request)
+            return profile_request(lambda: get_response(request), request, mode)
+    return middleware
@@ -0,0 +1,50 @@
+# Generated by Django 5.0 on 2026-10-18 03:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Sum, Count
+
+
+def populate_project_ledgers(apps, schema_editor):
+    Project = apps.get_model('construction', 'Project')
+    ProjectLedger = apps.get_model('construction', 'ProjectLedger')
+    Payment = apps.get_model('construction', 'Payment')
+    ManpowerExpense = apps.get_model('construction', 'ManpowerExpense')
+    MaterialExpense = apps.get_model('construction', 'MaterialExpense')
+
+    ledgers = {
+        project_id: ProjectLedger(project_id=project_id)
+        for project_id in Project.objects.values_list('id', flat=True)
+    }
+    for row in Payment.objects.order_by().values('project_id').annotate(total=Sum('amount')):
+        ledgers[row['project_id']].total_payments = row['total'] or 0
+    for row in ManpowerExpense.objects.order_by().values('project_id').annotate(total=Sum('total_amount'), count=Count('id')):
+        ledgers[row['project_id']].total_manpower = row['total'] or 0
+        ledgers[row['project_id']].manpower_count = row['count']
+    for row in MaterialExpense.objects.order_by().values('project_id').annotate(total=Sum('total_amount'), count=Count('id')):
+        ledgers[row['project_id']].total_material = row['total'] or 0
+        ledgers[row['project_id']].material_count = row['count']
+    ProjectLedger.objects.bulk_create(ledgers.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('construction', '0010_merge_20250617_2358'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProjectLedger',
+            fields=[
+                ('project', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='ledger', serialize=False, to='construction.project')),
+                ('total_payments', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('total_manpower', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('total_material', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('manpower_count', models.IntegerField(default=0)),
+                ('material_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(populate_project_ledgers, migrations.RunPython.noop),
+    ]
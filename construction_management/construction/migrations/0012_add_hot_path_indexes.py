@@ -0,0 +1,45 @@
+# Generated by Django 5.0 on 2026-10-18 03:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('construction', '0011_projectledger'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='manpowerexpense',
+            index=models.Index(fields=['project', 'date', 'created_at'], name='manpower_project_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='manpowerexpense',
+            index=models.Index(fields=['date', 'created_at'], name='manpower_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='materialexpense',
+            index=models.Index(fields=['project', 'date', 'created_at'], name='material_project_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='materialexpense',
+            index=models.Index(fields=['date', 'created_at'], name='material_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['project', 'payment_date', 'payment_type'], name='payment_project_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['payment_date'], name='payment_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['created_at'], name='project_created_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['status'], name='project_status_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.0 on 2026-10-18 03:20
+
+import re
+
+from django.db import migrations, models
+
+
+def seed_project_id_sequence(apps, schema_editor):
+    Project = apps.get_model('construction', 'Project')
+    IdSequence = apps.get_model('construction', 'IdSequence')
+    pattern = re.compile(r'^ID-(\d+)$')
+    numbers = (
+        int(match.group(1))
+        for match in map(pattern.match, Project.objects.values_list('project_id', flat=True).iterator())
+        if match
+    )
+    IdSequence.objects.update_or_create(name='project_id', defaults={'last_value': max(numbers, default=0)})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('construction', '0012_add_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('last_value', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(seed_project_id_sequence, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0 on 2026-10-18 03:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('construction', '0013_idsequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='projectledger',
+            name='version',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0 on 2026-10-18 04:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('construction', '0014_projectledger_version'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='projectledger',
+            index=models.Index(fields=['updated_at', 'version', 'project'], name='ledger_stamp_idx'),
+        ),
+    ]
@@ -0,0 +1,96 @@
+# Generated by Django 5.0 on 2026-10-18 04:10
+
+from django.db import migrations
+
+# (table, indexed columns), as of this migration
+SEARCH_COLUMNS = [
+    ('construction_manpowerexpense', ['description']),
+    ('construction_materialexpense', ['description', 'custom_item_name']),
+    ('construction_materialitem', ['display_name']),
+]
+
+
+def sqlite_install(cursor):
+    for table, columns in SEARCH_COLUMNS:
+        fts = f'{table}_fts'
+        column_list = ', '.join(columns)
+        new_values = ', '.join(f'new.{column}' for column in columns)
+        old_values = ', '.join(f'old.{column}' for column in columns)
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+            f"{column_list}, content='{table}', content_rowid='id', tokenize='unicode61')"
+        )
+        cursor.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+            f"INSERT INTO {fts}(rowid, {column_list}) VALUES (new.id, {new_values}); END"
+        )
+        cursor.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+            f"INSERT INTO {fts}({fts}, rowid, {column_list}) VALUES ('delete', old.id, {old_values}); END"
+        )
+        cursor.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE ON {table} BEGIN "
+            f"INSERT INTO {fts}({fts}, rowid, {column_list}) VALUES ('delete', old.id, {old_values}); "
+            f"INSERT INTO {fts}(rowid, {column_list}) VALUES (new.id, {new_values}); END"
+        )
+        cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def sqlite_uninstall(cursor):
+    for table, columns in SEARCH_COLUMNS:
+        fts = f'{table}_fts'
+        for suffix in ('ai', 'ad', 'au'):
+            cursor.execute(f'DROP TRIGGER IF EXISTS {fts}_{suffix}')
+        cursor.execute(f'DROP TABLE IF EXISTS {fts}')
+
+
+def mysql_index_exists(cursor, table):
+    cursor.execute(
+        "SELECT COUNT(*) FROM information_schema.STATISTICS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s",
+        [table, f'{table}_ft'],
+    )
+    return cursor.fetchone()[0] > 0
+
+
+def mysql_install(cursor):
+    for table, columns in SEARCH_COLUMNS:
+        if not mysql_index_exists(cursor, table):
+            cursor.execute(f'ALTER TABLE {table} ADD FULLTEXT INDEX {table}_ft ({", ".join(columns)})')
+
+
+def mysql_uninstall(cursor):
+    for table, columns in SEARCH_COLUMNS:
+        if mysql_index_exists(cursor, table):
+            cursor.execute(f'ALTER TABLE {table} DROP INDEX {table}_ft')
+
+
+INSTALL = {'sqlite': sqlite_install, 'mysql': mysql_install}
+UNINSTALL = {'sqlite': sqlite_uninstall, 'mysql': mysql_uninstall}
+
+
+def install_search_index(apps, schema_editor):
+    install = INSTALL.get(schema_editor.connection.vendor)
+    if install is None:
+        # No full-text support; searches keep using icontains
+        return
+    with schema_editor.connection.cursor() as cursor:
+        install(cursor)
+
+
+def uninstall_search_index(apps, schema_editor):
+    uninstall = UNINSTALL.get(schema_editor.connection.vendor)
+    if uninstall is not None:
+        with schema_editor.connection.cursor() as cursor:
+            uninstall(cursor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('construction', '0015_projectledger_stamp_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search_index, uninstall_search_index),
+    ]
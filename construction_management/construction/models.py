@@ -4,9 +4,11 @@ from decimal import Decimal
 from django.utils import timezone
 import uuid
 from django.core.exceptions import ValidationError
-import random
-import string
-from django.db.models import Sum
+from django.db import transaction
+from django.db.models import Sum, Count, F
+from django.db.models.functions import Round
+
+from .storage import get_payment_file_storage, payment_file_storage
 
 class LaborWorkType(models.Model):
     WORK_TYPES = [
@@ -64,33 +66,119 @@ class Project(models.Model):
     def save(self, *args, **kwargs):
         # Only auto-generate project_id for new projects
         if not self.pk and not self.project_id:  # Check if this is a new project
-            # Get the last project ID
-            last_project = Project.objects.exclude(project_id='ID-0000').order_by('-project_id').first()
-            if last_project:
-                # Extract the number from the last project ID and increment
-                last_id = last_project.project_id[3:]  # Get part after 'ID-'
-                try:
-                    # Try to parse as number first
-                    last_number = int(last_id)
-                    new_number = last_number + 1
-                    self.project_id = f"ID-{new_number:04d}"
-                except ValueError:
-                    # If not a number, generate a new alphanumeric ID
-                    chars = string.ascii_uppercase + string.digits
-                    new_id = ''.join(random.choices(chars, k=4))
-                    self.project_id = f"ID-{new_id}"
-            else:
-                self.project_id = "ID-0001"
+            from .sequences import allocate_project_id
+            self.project_id = allocate_project_id()
         
         # Calculate remaining amount before saving
         self.remaining_amount = self.budget - self.total_paid
         self.full_clean()  # Run validation
-        super().save(*args, **kwargs)
+        is_new = self.pk is None
+        with transaction.atomic():
+            if not is_new:
+                # The ledger row is locked before the project, as payments do
+                ProjectLedger.bump_version(self.pk)
+            super().save(*args, **kwargs)
+            if is_new:
+                ProjectLedger.objects.create(project=self)
+
+    def apply_payment(self, amount):
+        """
+        Add amount (negative when a payment is removed) to total_paid with a
+        single conditional UPDATE, so concurrent payments never lose updates.
+        """
+        projects = Project.objects.filter(pk=self.pk)
+        if amount > 0:
+            projects = projects.filter(total_paid__lte=F('budget') - amount)
+        else:
+            projects = projects.filter(total_paid__gte=-amount)
+        # Rounded because SQLite keeps decimals as floats, which would drift
+        # over many updates and fail the check above; exact elsewhere
+        updated = projects.update(
+            total_paid=Round(F('total_paid') + amount, 2),
+            remaining_amount=Round(F('remaining_amount') - amount, 2),
+            updated_at=timezone.now(),
+        )
+        if not updated:
+            if amount > 0:
+                raise ValidationError({'total_paid': 'Total paid amount cannot exceed budget'})
+            raise ValidationError({'total_paid': 'Total paid amount cannot be negative'})
+        self.total_paid += amount
+        self.remaining_amount -= amount
 
     class Meta:
         ordering = ['-created_at']
-
-class ManpowerExpense(models.Model):
+        indexes = [
+            models.Index(fields=['created_at'], name='project_created_at_idx'),
+            models.Index(fields=['status'], name='project_status_idx'),
+        ]
+
+class InsufficientFundsError(ValidationError):
+    """Raised when an expense would spend more than a project has been paid."""
+
+class LedgerEntryMixin:
+    """
+    Keeps ProjectLedger running totals in step with the rows of a model.
+    Every insert, update and delete adjusts the project's ledger row with
+    F() expressions in the same transaction as the write itself. The ledger
+    is written first so that the row lock it takes serializes concurrent
+    writes per project; anything else a write locks (see _ledger_applied)
+    is locked after it. Deletes, including queryset and cascade deletes,
+    go through the pre_delete handler in construction.signals.
+    """
+    ledger_amount_field = 'total_amount'
+    ledger_total_field = None
+    ledger_count_field = None
+    # Expenses reserve funds: the ledger update only succeeds while payments cover them
+    ledger_reserves_funds = False
+
+    def _ledger_deltas(self, amount, count):
+        deltas = {self.ledger_total_field: amount}
+        if self.ledger_count_field:
+            deltas[self.ledger_count_field] = count
+        return deltas
+
+    def _apply_ledger(self, project_id, amount, count):
+        deltas = self._ledger_deltas(amount, count)
+        if self.ledger_reserves_funds and amount > 0:
+            if not ProjectLedger.reserve_funds(project_id, amount, **deltas):
+                if ProjectLedger.for_project(project_id).available_funds <= 0:
+                    raise InsufficientFundsError('No funds available for expenses.')
+                raise InsufficientFundsError('Your funds are not sufficient to add this expense.')
+        else:
+            ProjectLedger.apply_delta(project_id, **deltas)
+
+    def _ledger_applied(self, changes):
+        """
+        Called with the (project_id, amount, count) changes once they are on
+        the ledger, before the row itself is written.
+        """
+
+    def _save_with_ledger(self, *args, **kwargs):
+        with transaction.atomic():
+            previous = None
+            if self.pk is not None:
+                previous = type(self).objects.filter(pk=self.pk).values_list(
+                    'project_id', self.ledger_amount_field
+                ).first()
+            amount = getattr(self, self.ledger_amount_field)
+            if previous and previous[0] == self.project_id:
+                changes = [(self.project_id, amount - previous[1], 0)]
+            else:
+                changes = [(previous[0], -previous[1], -1)] if previous else []
+                changes.append((self.project_id, amount, 1))
+            for change in changes:
+                self._apply_ledger(*change)
+            self._ledger_applied(changes)
+            super().save(*args, **kwargs)
+
+    def remove_from_ledger(self):
+        """Take the row off its project's ledger; run just before it is deleted."""
+        changes = [(self.project_id, -getattr(self, self.ledger_amount_field), -1)]
+        for change in changes:
+            self._apply_ledger(*change)
+        self._ledger_applied(changes)
+
+class ManpowerExpense(LedgerEntryMixin, models.Model):
     project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='manpower_expenses')
     work_type = models.ForeignKey(LaborWorkType, on_delete=models.PROTECT, related_name='manpower_expenses', null=True, blank=True)
     date = models.DateField(default=timezone.now)
@@ -105,16 +193,24 @@ class ManpowerExpense(models.Model):
         if self.total_amount > self.project.budget:
             raise ValidationError({'total_amount': 'Total amount cannot exceed project budget'})
 
+    ledger_total_field = 'total_manpower'
+    ledger_count_field = 'manpower_count'
+    ledger_reserves_funds = True
+
     def save(self, *args, **kwargs):
         self.total_amount = self.number_of_people * self.per_person_cost
         self.full_clean()
-        super().save(*args, **kwargs)
+        self._save_with_ledger(*args, **kwargs)
 
     def __str__(self):
         return f"Manpower Expense - {self.project.name} - {self.date}"
 
     class Meta:
         ordering = ['-date']
+        indexes = [
+            models.Index(fields=['project', 'date', 'created_at'], name='manpower_project_date_idx'),
+            models.Index(fields=['date', 'created_at'], name='manpower_date_idx'),
+        ]
 
 class MaterialItem(models.Model):
     name = models.CharField(max_length=100, unique=True)
@@ -152,7 +248,7 @@ def create_default_material_items():
             defaults={'display_name': name}
         )
 
-class MaterialExpense(models.Model):
+class MaterialExpense(LedgerEntryMixin, models.Model):
     project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='material_expenses')
     date = models.DateField(default=timezone.now)
     item = models.ForeignKey(MaterialItem, on_delete=models.PROTECT, related_name='expenses')
@@ -169,21 +265,23 @@ class MaterialExpense(models.Model):
             raise ValidationError({'custom_item_name': 'Custom item name is required when "Others" is selected'})
         
         # Calculate total amount
-        self.total_amount = self.per_unit_cost * self.quantity
+        self.total_amount = (self.per_unit_cost * self.quantity).quantize(Decimal('0.01'))
         
         # Check if total amount exceeds project budget
-        total_expenses = (
-            ManpowerExpense.objects.filter(project=self.project).aggregate(total=Sum('total_amount'))['total'] or 0
-        ) + (
-            MaterialExpense.objects.filter(project=self.project).exclude(id=self.id).aggregate(total=Sum('total_amount'))['total'] or 0
-        )
+        total_expenses = ProjectLedger.for_project(self.project).total_expenses
+        if self.pk:
+            total_expenses -= MaterialExpense.objects.filter(pk=self.pk).values_list('total_amount', flat=True).first() or 0
         
         if total_expenses + self.total_amount > self.project.budget:
             raise ValidationError({'total_amount': 'Total expenses would exceed project budget'})
 
+    ledger_total_field = 'total_material'
+    ledger_count_field = 'material_count'
+    ledger_reserves_funds = True
+
     def save(self, *args, **kwargs):
         self.full_clean()
-        super().save(*args, **kwargs)
+        self._save_with_ledger(*args, **kwargs)
 
     def __str__(self):
         item_name = self.custom_item_name if self.custom_item_name else self.item.display_name
@@ -191,8 +289,95 @@ class MaterialExpense(models.Model):
 
     class Meta:
         ordering = ['-date']
+        indexes = [
+            models.Index(fields=['project', 'date', 'created_at'], name='material_project_date_idx'),
+            models.Index(fields=['date', 'created_at'], name='material_date_idx'),
+        ]
+
+class StoredFile(models.Model):
+    """
+    A file in content-addressed storage (see construction.storage) and the
+    number of rows that point at it. Payments uploading identical bytes
+    share one file; it is deleted when the last of them lets go.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    sha256 = models.CharField(max_length=64, db_index=True)
+    size = models.PositiveBigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    @classmethod
+    def acquire(cls, name, sha256, size):
+        """Take a reference on name, creating its row; locks the row until commit."""
+        with transaction.atomic():
+            stored, created = cls.objects.select_for_update().get_or_create(
+                name=name, defaults={'sha256': sha256, 'size': size, 'ref_count': 1}
+            )
+            if not created:
+                cls.objects.filter(pk=stored.pk).update(ref_count=F('ref_count') + 1)
+        return stored
+
+    @classmethod
+    def release(cls, name):
+        """Drop a reference on name; the file is collected after commit if it was the last."""
+        if name and cls.objects.filter(name=name, ref_count__gt=0).update(ref_count=F('ref_count') - 1):
+            transaction.on_commit(lambda: cls.collect(name))
+
+    @classmethod
+    def collect(cls, name=None):
+        """Delete unreferenced files (only name, if given); returns the bytes reclaimed."""
+        unreferenced = cls.objects.filter(ref_count=0)
+        if name is not None:
+            unreferenced = unreferenced.filter(name=name)
+        reclaimed = 0
+        for pk in list(unreferenced.values_list('pk', flat=True)):
+            with transaction.atomic():
+                # Re-check under the lock: an upload may have just taken a reference
+                stored = cls.objects.select_for_update().filter(pk=pk, ref_count=0).first()
+                if stored is None:
+                    continue
+                stored.delete()
+                payment_file_storage.delete(stored.name)
+                reclaimed += stored.size
+        return reclaimed
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count} refs)"
+
+
+class UploadSession(models.Model):
+    """
+    A resumable upload of one file (see construction.uploads): chunks are
+    written at their offsets into a part file until `received` reaches
+    `size`, then the checksum is verified and the file moves into payment
+    file storage as `stored_name`, holding a StoredFile reference until a
+    payment takes it over.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('complete', 'Complete'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    sha256 = models.CharField(max_length=64)
+    received = models.PositiveBigIntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    stored_name = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['updated_at'], name='upload_session_updated_idx'),
+        ]
 
-class Payment(models.Model):
+    def __str__(self):
+        return f"{self.filename} ({self.received}/{self.size} bytes, {self.status})"
+
+
+class Payment(LedgerEntryMixin, models.Model):
     PAYMENT_TYPES = [
         ('Advance', 'Advance Payment'),
         ('Installment', 'Installment Payment'),
@@ -204,7 +389,7 @@ class Payment(models.Model):
     payment_date = models.DateField(default=timezone.now)
     payment_type = models.CharField(max_length=20, choices=PAYMENT_TYPES)
     description = models.TextField(blank=True, null=True)
-    payment_file = models.FileField(upload_to='payment_files/', blank=True, null=True)
+    payment_file = models.FileField(upload_to='payment_files/', storage=get_payment_file_storage, blank=True, null=True)
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -214,23 +399,161 @@ class Payment(models.Model):
         if self.amount > self.project.budget:
             raise ValidationError({'amount': 'Payment amount cannot exceed project budget'})
 
+    ledger_amount_field = 'amount'
+    ledger_total_field = 'total_payments'
+
+    def _ledger_applied(self, changes):
+        # Project.total_paid follows the same changes as the ledger, after it
+        for project_id, amount, _ in changes:
+            if amount:
+                project = self.project if project_id == self.project_id else Project.objects.get(pk=project_id)
+                project.apply_payment(amount)
+
     def save(self, *args, **kwargs):
         self.full_clean()
-        # Update project's total_paid when a payment is saved
-        if not self.pk:  # Only on creation
-            self.project.total_paid += self.amount
-            self.project.save()
-        super().save(*args, **kwargs)
-
-    def delete(self, *args, **kwargs):
-        # Update project's total_paid when a payment is deleted
-        self.project.total_paid -= self.amount
-        self.project.save()
-        super().delete(*args, **kwargs)
+        with transaction.atomic():
+            previous_file = None
+            if self.pk:
+                previous_file = Payment.objects.filter(pk=self.pk).values_list('payment_file', flat=True).first()
+            # Saving a new upload takes a reference on its stored file, so
+            # the one it replaces (even if it has the same content) lets go
+            uploading = bool(self.payment_file) and not self.payment_file._committed
+            self._save_with_ledger(*args, **kwargs)
+            if previous_file and (uploading or previous_file != self.payment_file.name):
+                StoredFile.release(previous_file)
 
     def __str__(self):
         return f"{self.payment_type} - {self.amount} ({self.project.name})"
 
     class Meta:
         ordering = ['-payment_date']
+        indexes = [
+            models.Index(fields=['project', 'payment_date', 'payment_type'], name='payment_project_date_idx'),
+            models.Index(fields=['payment_date'], name='payment_date_idx'),
+        ]
+
+class ProjectLedger(models.Model):
+    """
+    Running totals per project, maintained incrementally by LedgerEntryMixin
+    so that funds checks never have to scan a project's full history.
+    """
+    project = models.OneToOneField(Project, on_delete=models.CASCADE, primary_key=True, related_name='ledger')
+    total_payments = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    total_manpower = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    total_material = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    manpower_count = models.IntegerField(default=0)
+    material_count = models.IntegerField(default=0)
+    # Bumped on every write to the project or its payments/expenses; used to key cached reports
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    TOTAL_FIELDS = ['total_payments', 'total_manpower', 'total_material', 'manpower_count', 'material_count']
+
+    class Meta:
+        indexes = [
+            # Covers the change stamp aggregate behind the list endpoints' ETags
+            models.Index(fields=['updated_at', 'version', 'project'], name='ledger_stamp_idx'),
+        ]
+
+    @property
+    def total_expenses(self):
+        return self.total_manpower + self.total_material
+
+    @property
+    def available_funds(self):
+        return max(self.total_payments - self.total_expenses, 0)
+
+    @classmethod
+    def for_project(cls, project):
+        project_id = getattr(project, 'pk', project)
+        try:
+            return cls.objects.get(project_id=project_id)
+        except cls.DoesNotExist:
+            return cls.rebuild(project_id)
+
+    @classmethod
+    def _update_totals(cls, project_id, deltas, **conditions):
+        updates = {field: F(field) + value for field, value in deltas.items() if value}
+        # Any write may change a report (e.g. an edited date), so always bump the version
+        updates['version'] = F('version') + 1
+        updates['updated_at'] = timezone.now()
+        queryset = cls.objects.filter(project_id=project_id, **conditions)
+        if queryset.update(**updates):
+            return True
+        if cls.objects.filter(project_id=project_id).exists():
+            return False
+        # No ledger row yet: derive it from the rows written so far, then retry
+        cls.rebuild(project_id)
+        return bool(queryset.update(**updates))
+
+    @classmethod
+    def bump_version(cls, project_id):
+        cls._update_totals(project_id, {})
+
+    @classmethod
+    def apply_delta(cls, project_id, **deltas):
+        cls._update_totals(project_id, deltas)
+
+    @classmethod
+    def reserve_funds(cls, project_id, amount, **deltas):
+        """
+        Apply deltas only if the project's payments still cover its expenses
+        plus amount. The check and the update are a single conditional UPDATE,
+        so concurrent reservations for the same project queue on its row lock
+        and can never overspend, while other projects are not blocked.
+        """
+        return cls._update_totals(
+            project_id, deltas,
+            total_payments__gte=F('total_manpower') + F('total_material') + amount,
+        )
+
+    @classmethod
+    def compute_totals(cls, project_ids=None):
+        """Compute ledger totals from the raw rows with one grouped query per table."""
+        projects = Project.objects.all()
+        if project_ids is not None:
+            projects = projects.filter(id__in=project_ids)
+        totals = {
+            project_id: {
+                'total_payments': Decimal('0'),
+                'total_manpower': Decimal('0'),
+                'total_material': Decimal('0'),
+                'manpower_count': 0,
+                'material_count': 0,
+            }
+            for project_id in projects.values_list('id', flat=True)
+        }
+
+        def grouped(queryset, amount_field):
+            if project_ids is not None:
+                queryset = queryset.filter(project_id__in=project_ids)
+            return queryset.order_by().values('project_id').annotate(total=Sum(amount_field), count=Count('id'))
+
+        for row in grouped(Payment.objects.all(), 'amount'):
+            totals[row['project_id']]['total_payments'] = row['total'] or 0
+        for row in grouped(ManpowerExpense.objects.all(), 'total_amount'):
+            totals[row['project_id']]['total_manpower'] = row['total'] or 0
+            totals[row['project_id']]['manpower_count'] = row['count']
+        for row in grouped(MaterialExpense.objects.all(), 'total_amount'):
+            totals[row['project_id']]['total_material'] = row['total'] or 0
+            totals[row['project_id']]['material_count'] = row['count']
+        return totals
+
+    @classmethod
+    def rebuild(cls, project_id):
+        totals = cls.compute_totals([project_id]).get(project_id, {})
+        ledger, _ = cls.objects.update_or_create(project_id=project_id, defaults=totals)
+        return ledger
+
+    def __str__(self):
+        return f"Ledger - {self.project_id}"
+
+class IdSequence(models.Model):
+    """A named counter used to hand out ids such as Project.project_id."""
+    name = models.CharField(max_length=50, unique=True)
+    last_value = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} = {self.last_value}"
 
@@ -0,0 +1,101 @@
+from decimal import Decimal
+
+from django.db.models import F, IntegerField, Value
+from django.db.models.functions import Coalesce
+
+from .models import Project
+
+CENT = Decimal('0.01')
+
+
+def _amount(value):
+    # Ledger totals are NULL for projects without a ledger row; SQLite also
+    # hands back amounts with float noise, so quantize to cents
+    return (value or Decimal(0)).quantize(CENT)
+
+
+def _count(field):
+    return Coalesce(F(field), Value(0), output_field=IntegerField())
+
+
+def _utilization(spent, budget):
+    return round(float(spent / budget * 100), 2) if budget > 0 else 0
+
+
+def build_portfolio_summary():
+    """
+    Build the payload for /api/portfolio/summary/ in a single query.
+
+    Per-project paid and spent figures come from ProjectLedger, joined onto
+    each project, so the cost does not grow with the number of expense or
+    payment rows; portfolio totals are summed from the same rows. Amounts
+    are Decimals, rendered as strings like the API's serializers do.
+    """
+    rows = (
+        Project.objects
+        .order_by('-created_at', 'id')
+        .values_list(
+            'id', 'project_id', 'name', 'status',
+            'budget', 'ledger__total_payments', 'ledger__total_manpower', 'ledger__total_material',
+            _count('ledger__manpower_count'), _count('ledger__material_count'),
+        )
+    )
+
+    projects = []
+    totals = {
+        'budget': Decimal(0), 'paid': Decimal(0), 'manpower': Decimal(0), 'material': Decimal(0),
+        'available_funds': Decimal(0), 'manpower_count': 0, 'material_count': 0,
+    }
+    status_counts = {status: 0 for status, _ in Project.STATUS_CHOICES}
+    for pk, project_id, name, project_status, budget, paid, manpower, material, manpower_count, material_count in rows:
+        budget, paid, manpower, material = map(_amount, (budget, paid, manpower, material))
+        spent = manpower + material
+        available_funds = max(paid - spent, Decimal(0))
+        projects.append({
+            'id': pk,
+            'project_id': project_id,
+            'name': name,
+            'status': project_status,
+            'budget': budget,
+            'paid': paid,
+            'manpower': manpower,
+            'material': material,
+            'spent': spent,
+            'available_funds': available_funds,
+            'due_payments': budget - paid,
+            'budget_utilization': _utilization(spent, budget),
+            'manpower_count': manpower_count,
+            'material_count': material_count,
+        })
+
+        totals['budget'] += budget
+        totals['paid'] += paid
+        totals['manpower'] += manpower
+        totals['material'] += material
+        totals['available_funds'] += available_funds
+        totals['manpower_count'] += manpower_count
+        totals['material_count'] += material_count
+        status_counts[project_status] = status_counts.get(project_status, 0) + 1
+
+    spent = totals['manpower'] + totals['material']
+    return {
+        'project_count': len(projects),
+        'status_counts': status_counts,
+        'totals': {
+            'budget': totals['budget'],
+            'paid': totals['paid'],
+            'spent': {
+                'manpower': totals['manpower'],
+                'material': totals['material'],
+                'total': spent,
+            },
+            'available_funds': totals['available_funds'],
+            'due_payments': totals['budget'] - totals['paid'],
+            'budget_utilization': _utilization(spent, totals['budget']),
+            'expense_counts': {
+                'manpower': totals['manpower_count'],
+                'material': totals['material_count'],
+            },
+        },
+        'projects': projects,
+    }
@@ -0,0 +1,227 @@
+"""
+On-demand profiling of single requests for staff users (see
+profiling_middleware). A staff user adds ?profile=1 (or an X-Profile: 1
+header) and the request runs under cProfile while every query it makes is
+timed. The profile keeps the hottest functions, a breakdown of time by
+layer (DRF serialization and validation, model full_clean, the ORM, the
+database) and the SQL timeline. It is stored under the id the response
+carries in X-Profile-Id and read back from /api/profiles/<id>/; with
+?profile=inline the profile is returned in place of the response.
+"""
+import cProfile
+import json
+import logging
+import marshal
+import os
+import pstats
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.http import JsonResponse
+from django.utils import timezone
+
+from .query_stats import collect
+
+logger = logging.getLogger(__name__)
+
+STDLIB = os.path.dirname(os.__file__) + os.sep
+MAX_SQL_LENGTH = 500
+HOT_FUNCTIONS = 30
+
+# layer -> (file path suffix, function) pairs whose cumulative time it is.
+# Layers nest (full_clean runs queries), so they do not add up to the total.
+LAYERS = {
+    'drf_serialization': [('rest_framework/serializers.py', 'data')],
+    'drf_validation': [('rest_framework/serializers.py', 'is_valid')],
+    'model_full_clean': [('django/db/models/base.py', 'full_clean')],
+    'orm': [('django/db/models/sql/compiler.py', 'execute_sql'), ('django/db/models/query.py', '_fetch_all')],
+    'database': [('django/db/backends/utils.py', '_execute')],
+    'rendering': [('rest_framework/renderers.py', 'render'), ('django/template/base.py', 'render')],
+}
+
+
+def requested_mode(request):
+    """'store' or 'inline' when the request asks to be profiled, else None. Cheap: no user lookup."""
+    value = request.META.get('HTTP_X_PROFILE') or request.GET.get('profile')
+    if not value or value == '0':
+        return None
+    return 'inline' if value == 'inline' else 'store'
+
+
+def function_label(key):
+    filename, lineno, name = key
+    if filename == '~':
+        # Built-ins, e.g. <method 'execute' of 'sqlite3.Cursor' objects>
+        return name
+    for marker in ('site-packages' + os.sep, str(settings.BASE_DIR) + os.sep, STDLIB):
+        if marker in filename:
+            filename = filename.split(marker, 1)[1]
+            break
+    return f'{filename}:{lineno}({name})'
+
+
+def hot_functions(stats, index, limit=HOT_FUNCTIONS):
+    """Top functions by own time (index 2) or cumulative time (index 3)."""
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][index], reverse=True)[:limit]
+    return [{
+        'function': function_label(key),
+        'calls': calls,
+        'own_ms': round(own * 1000, 2),
+        'cumulative_ms': round(cumulative * 1000, 2),
+    } for key, (_, calls, own, cumulative, _) in rows]
+
+
+def layer_breakdown(stats):
+    breakdown = {}
+    for layer, functions in LAYERS.items():
+        seconds = 0
+        for (filename, _, name), (_, _, _, cumulative, _) in stats.stats.items():
+            # Where one marker calls another (_fetch_all -> execute_sql) the
+            # outer one already includes the inner, so take the largest
+            if any(filename.endswith(suffix) and name == function for suffix, function in functions):
+                seconds = max(seconds, cumulative)
+        breakdown[layer] = round(seconds * 1000, 2)
+    return breakdown
+
+
+def profile_request(call, request, mode):
+    """Run call() -> response under the profiler and store or return the profile."""
+    with collect(request) as query_stats:
+        # Another middleware may already be collecting for this request
+        outer_timeline = query_stats.timeline
+        query_stats.timeline = []
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        profiler.enable()
+        try:
+            response = call()
+        finally:
+            profiler.disable()
+            elapsed = time.perf_counter() - started
+            timeline = query_stats.timeline
+            query_stats.timeline = outer_timeline
+
+    stats = pstats.Stats(profiler)
+    match = getattr(request, 'resolver_match', None)
+    profile = {
+        'id': uuid.uuid4().hex,
+        'time': timezone.now().isoformat(),
+        'method': request.method,
+        'path': request.get_full_path(),
+        'view': match.view_name if match else None,
+        'status': response.status_code,
+        'duration_ms': round(elapsed * 1000, 2),
+        'layers': layer_breakdown(stats),
+        'sql': {
+            'count': len(timeline),
+            'time_ms': round(sum(duration for _, duration, _ in timeline) * 1000, 2),
+            'timeline': [{
+                'start_ms': round((start - started) * 1000, 2),
+                'duration_ms': round(duration * 1000, 2),
+                'sql': sql if len(sql) <= MAX_SQL_LENGTH else sql[:MAX_SQL_LENGTH] + '...',
+            } for start, duration, sql in timeline],
+        },
+        'hot_functions': {
+            'by_own_time': hot_functions(stats, 2),
+            'by_cumulative_time': hot_functions(stats, 3),
+        },
+    }
+    profile_store.add(profile, marshal.dumps(stats.stats))
+
+    if mode == 'inline':
+        return JsonResponse(profile)
+    response['X-Profile-Id'] = profile['id']
+    return response
+
+
+class ProfileStore:
+    """
+    The last REQUEST_PROFILE_LOG_SIZE profiles of this process; with
+    REQUEST_PROFILE_DIR set, also files there (<id>.json and the raw
+    pstats in <id>.prof), so any worker can serve any profile.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.profiles = OrderedDict()
+
+    @property
+    def size(self):
+        return getattr(settings, 'REQUEST_PROFILE_LOG_SIZE', 20)
+
+    def directory(self):
+        return getattr(settings, 'REQUEST_PROFILE_DIR', '')
+
+    def add(self, profile, raw):
+        with self.lock:
+            self.profiles[profile['id']] = (profile, raw)
+            while len(self.profiles) > self.size:
+                self.profiles.popitem(last=False)
+        directory = self.directory()
+        if directory:
+            try:
+                self.write(directory, profile, raw)
+            except OSError as e:
+                logger.error(f"Error writing profile to {directory}: {str(e)}")
+
+    def write(self, directory, profile, raw):
+        os.makedirs(directory, exist_ok=True)
+        base = os.path.join(directory, profile['id'])
+        with open(base + '.prof', 'wb') as output:
+            output.write(raw)
+        with open(base + '.json', 'w') as output:
+            json.dump(profile, output)
+        # Keep the newest profiles only
+        names = sorted(
+            (name for name in os.listdir(directory) if name.endswith('.json')),
+            key=lambda name: os.stat(os.path.join(directory, name)).st_mtime_ns, reverse=True,
+        )
+        for name in names[self.size:]:
+            for extension in ('.json', '.prof'):
+                try:
+                    os.unlink(os.path.join(directory, name[:-5] + extension))
+                except FileNotFoundError:
+                    pass
+
+    def get(self, profile_id):
+        """(profile, raw pstats) or None."""
+        with self.lock:
+            if profile_id in self.profiles:
+                return self.profiles[profile_id]
+        directory = self.directory()
+        if not directory:
+            return None
+        base = os.path.join(directory, profile_id)
+        try:
+            with open(base + '.json') as profile, open(base + '.prof', 'rb') as raw:
+                return json.load(profile), raw.read()
+        except FileNotFoundError:
+            return None
+
+    def recent(self):
+        """Profiles, newest first, without their detail."""
+        directory = self.directory()
+        if directory and os.path.isdir(directory):
+            profiles = []
+            for name in os.listdir(directory):
+                if name.endswith('.json'):
+                    try:
+                        with open(os.path.join(directory, name)) as profile:
+                            profiles.append(json.load(profile))
+                    except (OSError, ValueError):
+                        continue
+        else:
+            with self.lock:
+                profiles = [profile for profile, _ in self.profiles.values()]
+        profiles.sort(key=lambda profile: profile['time'], reverse=True)
+        return [
+            {key: value for key, value in profile.items() if key not in ('sql', 'hot_functions')}
+            | {'sql_count': profile['sql']['count'], 'sql_time_ms': profile['sql']['time_ms']}
+            for profile in profiles
+        ]
+
+
+profile_store = ProfileStore()
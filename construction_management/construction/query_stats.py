@@ -0,0 +1,66 @@
+"""
+Per-request database query counts and time, for the query stats headers
+and the request metrics (construction.middleware). Each connection gets an
+execute wrapper (installed when it connects) that adds to the QueryStats of
+the request being served. The stats live in a context variable, so queries
+run from sync_to_async worker threads, which copy the context, count too.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_current = ContextVar('query_stats', default=None)
+
+
+class QueryStats:
+    __slots__ = ('count', 'duration', 'request', 'timeline')
+
+    def __init__(self, request=None):
+        self.count = 0
+        self.duration = 0.0
+        self.request = request
+        # A list to get (start, duration, sql) for every query (see construction.profiling)
+        self.timeline = None
+
+
+def current():
+    """The QueryStats being collected, or None outside a request."""
+    return _current.get()
+
+
+def count_queries(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - start
+        stats.count += 1
+        stats.duration += elapsed
+        if stats.timeline is not None:
+            stats.timeline.append((start, elapsed, sql))
+
+
+def install(sender, connection, **kwargs):
+    """connection_created receiver."""
+    if count_queries not in connection.execute_wrappers:
+        # First, so it stays put when a `with connection.execute_wrapper()`
+        # block that was open when the connection was made pops its own
+        connection.execute_wrappers.insert(0, count_queries)
+
+
+@contextmanager
+def collect(request=None):
+    """Count the queries run inside the block; nested blocks share the outer count."""
+    stats = _current.get()
+    if stats is not None:
+        yield stats
+        return
+    stats = QueryStats(request)
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
@@ -0,0 +1,143 @@
+import logging
+import threading
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+
+from .models import IdSequence, LaborWorkType, MaterialItem
+from .sequences import SequenceAllocator
+
+logger = logging.getLogger(__name__)
+
+REFERENCE_DATA_SEQUENCE = 'reference_data'
+
+
+class ReferenceSnapshot:
+    """An immutable copy of the MaterialItem and LaborWorkType tables."""
+
+    def __init__(self, version):
+        from .serializers import LaborWorkTypeSerializer, MaterialItemSerializer
+
+        self.version = version
+        items = list(MaterialItem.objects.all())
+        work_types = list(LaborWorkType.objects.all())
+        self.material_items = {item.id: item for item in items}
+        self.material_items_by_name = {item.name: item for item in items}
+        self.work_types = {work_type.id: work_type for work_type in work_types}
+        self.work_types_by_name = {work_type.name: work_type for work_type in work_types}
+        self.material_items_data = MaterialItemSerializer([item for item in items if item.is_active], many=True).data
+        self.work_types_data = LaborWorkTypeSerializer(work_types, many=True).data
+
+    @property
+    def etag(self):
+        return f'"reference-{self.version}"'
+
+
+class ReferenceDataCache:
+    """
+    Per-process cache of the material item and labour work type tables.
+
+    Writes to either table bump a version stamp kept in IdSequence (see
+    construction.signals). Each process re-reads the stamp at most every
+    REFERENCE_DATA_VERSION_TTL seconds and reloads both tables when it has
+    changed, so other workers pick up edits within that window while the
+    writing process sees them immediately.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._checked_at = 0
+        self._version = SequenceAllocator(REFERENCE_DATA_SEQUENCE)
+
+    def _stored_version(self):
+        return IdSequence.objects.filter(name=REFERENCE_DATA_SEQUENCE).values_list('last_value', flat=True).first() or 0
+
+    def snapshot(self):
+        ttl = getattr(settings, 'REFERENCE_DATA_VERSION_TTL', 5)
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - self._checked_at < ttl:
+            return snapshot
+        with self._lock:
+            version = self._stored_version()
+            if self._snapshot is None or self._snapshot.version != version:
+                self._snapshot = ReferenceSnapshot(version)
+            self._checked_at = time.monotonic()
+            return self._snapshot
+
+    def invalidate(self):
+        """Bump the shared version and drop this process's copy."""
+        self._version.next_value()
+        self.clear()
+        transaction.on_commit(self.clear)
+
+    def clear(self):
+        with self._lock:
+            self._snapshot = None
+
+    def get_material_item(self, item_id):
+        try:
+            item = self.snapshot().material_items.get(int(item_id))
+        except (TypeError, ValueError):
+            return None
+        if item is None:
+            # Created on another worker since our last reload
+            item = MaterialItem.objects.filter(id=item_id).first()
+        return item
+
+    def get_material_item_by_name(self, name):
+        item = self.snapshot().material_items_by_name.get(name)
+        if item is None:
+            item = MaterialItem.objects.filter(name=name).first()
+        return item
+
+    def get_work_type(self, work_type_id):
+        try:
+            work_type = self.snapshot().work_types.get(int(work_type_id))
+        except (TypeError, ValueError):
+            return None
+        if work_type is None:
+            work_type = LaborWorkType.objects.filter(id=work_type_id).first()
+        return work_type
+
+    def get_work_type_by_name(self, name):
+        work_type = self.snapshot().work_types_by_name.get(name)
+        if work_type is None:
+            work_type = LaborWorkType.objects.filter(name=name).first()
+        return work_type
+
+    def warm(self):
+        try:
+            self.snapshot()
+        except DatabaseError as e:
+            # Tables may not exist yet, e.g. before the first migrate
+            logger.warning(f"Could not warm reference data cache: {str(e)}")
+
+    def warm_in_background(self):
+        def run():
+            # Wait for app loading to finish before touching the database
+            deadline = time.monotonic() + 30
+            while not apps.ready and time.monotonic() < deadline:
+                time.sleep(0.05)
+            try:
+                self.warm()
+            finally:
+                # This thread's connection would otherwise stay open until the server exits
+                connection.close()
+
+        threading.Thread(target=run, name='reference-data-warmup', daemon=True).start()
+
+
+reference_data = ReferenceDataCache()
+
+
+def warm_on_startup():
+    """
+    Fill the cache in the background when a server starts. Called from the
+    WSGI and ASGI entrypoints (runserver loads the WSGI one), so management
+    commands and scripts that only set up Django never warm it.
+    """
+    if getattr(settings, 'REFERENCE_DATA_WARM_ON_STARTUP', True):
+        reference_data.warm_in_background()
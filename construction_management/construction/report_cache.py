@@ -0,0 +1,193 @@
+import asyncio
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+REPORT_CACHE_ALIAS = 'reports'
+
+
+class ReportCache:
+    """
+    Cache for /api/reports/ payloads.
+
+    Keys include the project's ledger version, which every write to the
+    project or its payments and expenses bumps, so a cached report is never
+    served after the data behind it changed; stale entries simply expire.
+    They also include the current date, because time ranges are relative to
+    today.
+
+    Misses are single-flight: one caller computes while concurrent callers
+    for the same key wait for its result. A per-key lock covers threads in
+    this process and a cache.add() lock covers other processes sharing a
+    file-based cache. Per-key locks are refcounted and dropped when their
+    last user is done, so a later caller never gets a second lock for a key
+    while someone still holds or waits on the first.
+    """
+
+    def __init__(self, alias=REPORT_CACHE_ALIAS):
+        self.alias = alias
+        self._locks = {}
+        self._async_locks = {}
+        self._locks_guard = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'waits': 0}
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    @staticmethod
+    def make_key(project_id, time_range, version, today):
+        return f'report:{project_id}:{time_range}:{version}:{today.isoformat()}'
+
+    def _count(self, name):
+        with self._stats_lock:
+            self._stats[name] += 1
+
+    def _use_lock(self, locks, key, factory):
+        # Entries are [lock, users]
+        with self._locks_guard:
+            entry = locks.get(key)
+            if entry is None:
+                entry = locks[key] = [factory(), 0]
+            entry[1] += 1
+            return entry[0]
+
+    def _unuse_lock(self, locks, key):
+        with self._locks_guard:
+            entry = locks[key]
+            entry[1] -= 1
+            if entry[1] == 0:
+                del locks[key]
+
+    def _key_lock(self, key):
+        return self._use_lock(self._locks, key, threading.Lock)
+
+    def _release_key_lock(self, key):
+        self._unuse_lock(self._locks, key)
+
+    def _async_key_lock(self, key):
+        return self._use_lock(self._async_locks, key, asyncio.Lock)
+
+    def _release_async_key_lock(self, key):
+        self._unuse_lock(self._async_locks, key)
+
+    def _wait_for(self, key, timeout):
+        """Poll for a value another process is computing; None if it gave up."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            value = self.cache.get(key)
+            if value is not None:
+                return value
+            if self.cache.get(f'{key}:lock') is None:
+                return None
+        return None
+
+    def get_or_compute(self, key, compute):
+        """Return (value, hit) for key, calling compute() at most once per burst."""
+        value = self.cache.get(key)
+        if value is not None:
+            self._count('hits')
+            return value, True
+
+        timeout = getattr(settings, 'REPORT_CACHE_TIMEOUT', 86400)
+        lock_timeout = getattr(settings, 'REPORT_CACHE_LOCK_TIMEOUT', 30)
+        key_lock = self._key_lock(key)
+        try:
+            if not key_lock.acquire(blocking=False):
+                # Another thread here is computing the same report
+                self._count('waits')
+                key_lock.acquire()
+            try:
+                value = self.cache.get(key)
+                if value is not None:
+                    self._count('hits')
+                    return value, True
+
+                lock_key = f'{key}:lock'
+                if not self.cache.add(lock_key, 1, lock_timeout):
+                    self._count('waits')
+                    value = self._wait_for(key, lock_timeout)
+                    if value is not None:
+                        self._count('hits')
+                        return value, True
+
+                self._count('misses')
+                try:
+                    value = compute()
+                    self.cache.set(key, value, timeout)
+                finally:
+                    self.cache.delete(lock_key)
+                return value, False
+            finally:
+                key_lock.release()
+        finally:
+            self._release_key_lock(key)
+
+    async def _await_for(self, key, timeout):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+            value = await self.cache.aget(key)
+            if value is not None:
+                return value
+            if await self.cache.aget(f'{key}:lock') is None:
+                return None
+        return None
+
+    async def aget_or_compute(self, key, compute):
+        """get_or_compute() for async views; compute is a coroutine function."""
+        value = await self.cache.aget(key)
+        if value is not None:
+            self._count('hits')
+            return value, True
+
+        timeout = getattr(settings, 'REPORT_CACHE_TIMEOUT', 86400)
+        lock_timeout = getattr(settings, 'REPORT_CACHE_LOCK_TIMEOUT', 30)
+        key_lock = self._async_key_lock(key)
+        if key_lock.locked():
+            # Another task in this process is computing the same report
+            self._count('waits')
+        try:
+            async with key_lock:
+                value = await self.cache.aget(key)
+                if value is not None:
+                    self._count('hits')
+                    return value, True
+
+                lock_key = f'{key}:lock'
+                if not await self.cache.aadd(lock_key, 1, lock_timeout):
+                    self._count('waits')
+                    value = await self._await_for(key, lock_timeout)
+                    if value is not None:
+                        self._count('hits')
+                        return value, True
+
+                self._count('misses')
+                try:
+                    value = await compute()
+                    await self.cache.aset(key, value, timeout)
+                finally:
+                    await self.cache.adelete(lock_key)
+                return value, False
+        finally:
+            self._release_async_key_lock(key)
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0
+        stats['backend'] = settings.CACHES[self.alias]['BACKEND']
+        return stats
+
+    def reset_stats(self):
+        with self._stats_lock:
+            for name in self._stats:
+                self._stats[name] = 0
+
+
+report_cache = ReportCache()
@@ -0,0 +1,187 @@
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Sum, Q
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .async_db import run_in_parallel
+from .models import ManpowerExpense, MaterialExpense, Payment
+
+PAYMENT_TYPES = ['Advance', 'Installment', 'Full']
+TIME_RANGES = ['month', 'quarter', 'year']
+
+
+def get_report_start_date(time_range, today):
+    if time_range == 'month':
+        return today.replace(day=1)
+    elif time_range == 'quarter':
+        current_quarter = (today.month - 1) // 3
+        return today.replace(month=current_quarter * 3 + 1, day=1)
+    # year
+    return today.replace(month=1, day=1)
+
+
+def _monthly_totals(queryset, date_field, amount_field):
+    # One grouped query per table: {first day of month: total}
+    rows = (
+        queryset
+        .annotate(month=TruncMonth(date_field))
+        .order_by()
+        .values('month')
+        .annotate(total=Sum(amount_field))
+    )
+    return {row['month']: row['total'] or 0 for row in rows}
+
+
+def report_queries(project_id, start_date, today):
+    """
+    The queries behind a report, as callables keyed by name. None depends on
+    another's result, so they can run in any order or concurrently.
+    """
+    in_range = Q(date__gte=start_date, date__lte=today)
+    payment_in_range = Q(payment_date__gte=start_date, payment_date__lte=today)
+
+    payment_aggregates = {
+        'overall': Sum('amount'),
+        'filtered': Sum('amount', filter=payment_in_range),
+    }
+    for payment_type in PAYMENT_TYPES:
+        payment_aggregates[payment_type] = Sum(
+            'amount', filter=payment_in_range & Q(payment_type=payment_type)
+        )
+
+    return {
+        'manpower': lambda: ManpowerExpense.objects.filter(project_id=project_id).aggregate(
+            overall=Sum('total_amount'),
+            filtered=Sum('total_amount', filter=in_range),
+        ),
+        'material': lambda: MaterialExpense.objects.filter(project_id=project_id).aggregate(
+            overall=Sum('total_amount'),
+            filtered=Sum('total_amount', filter=in_range),
+        ),
+        'payments': lambda: Payment.objects.filter(project_id=project_id).aggregate(**payment_aggregates),
+        # Monthly expense trend
+        'manpower_by_month': lambda: _monthly_totals(
+            ManpowerExpense.objects.filter(in_range, project_id=project_id), 'date', 'total_amount'
+        ),
+        'material_by_month': lambda: _monthly_totals(
+            MaterialExpense.objects.filter(in_range, project_id=project_id), 'date', 'total_amount'
+        ),
+        'payments_by_month': lambda: _monthly_totals(
+            Payment.objects.filter(payment_in_range, project_id=project_id), 'payment_date', 'amount'
+        ),
+    }
+
+
+def _run_queries(queries):
+    return {name: query() for name, query in queries.items()}
+
+
+def build_report_data(project, time_range='month', today=None):
+    """
+    Build the payload for /api/reports/<project_id>/ with a fixed number of
+    grouped queries, independent of how many months the time range spans.
+    """
+    if today is None:
+        today = timezone.now().date()
+    start_date = get_report_start_date(time_range, today)
+    results = _run_queries(report_queries(project.id, start_date, today))
+    return _report_payload(project, start_date, today, results)
+
+
+async def abuild_report_data(project, time_range='month', today=None):
+    """
+    build_report_data() for async views. With REPORT_PARALLEL_QUERIES the
+    queries run concurrently, each on its own connection.
+    """
+    if today is None:
+        today = timezone.now().date()
+    start_date = get_report_start_date(time_range, today)
+    queries = report_queries(project.id, start_date, today)
+    if getattr(settings, 'REPORT_PARALLEL_QUERIES', True):
+        results = dict(zip(queries, await run_in_parallel(*queries.values())))
+    else:
+        results = await sync_to_async(_run_queries)(queries)
+    return _report_payload(project, start_date, today, results)
+
+
+def _report_payload(project, start_date, today, results):
+    manpower = results['manpower']
+    material = results['material']
+    payments = results['payments']
+
+    # --- OVERALL STATS (not filtered by time) ---
+    overall_total_manpower = manpower['overall'] or 0
+    overall_total_material = material['overall'] or 0
+    overall_total_expenses = overall_total_manpower + overall_total_material
+    overall_total_payments = payments['overall'] or 0
+    overall_due_payments = project.budget - overall_total_payments
+    overall_available_funds = max(overall_total_payments - overall_total_expenses, 0)
+    overall_budget_utilization = (overall_total_expenses / project.budget * 100) if project.budget > 0 else 0
+
+    # --- FILTERED DATA (for charts) ---
+    total_manpower = manpower['filtered'] or 0
+    total_material = material['filtered'] or 0
+    total_expenses = total_manpower + total_material
+
+    expense_breakdown = {
+        'Manpower': total_manpower,
+        'Material': total_material
+    }
+    payment_breakdown = {
+        payment_type: payments[payment_type] or 0
+        for payment_type in PAYMENT_TYPES
+    }
+
+    total_payments = payments['filtered'] or 0
+    due_payments = project.budget - total_payments
+    available_funds = max(total_payments - total_expenses, 0)
+    budget_utilization = (total_expenses / project.budget * 100) if project.budget > 0 else 0
+
+    manpower_by_month = results['manpower_by_month']
+    material_by_month = results['material_by_month']
+    payments_by_month = results['payments_by_month']
+
+    monthly_expenses = []
+    monthly_payments = []
+    current_date = start_date
+    while current_date <= today:
+        label = current_date.strftime('%Y-%m')
+        monthly_expenses.append({
+            'date': label,
+            'amount': manpower_by_month.get(current_date, 0) + material_by_month.get(current_date, 0)
+        })
+        monthly_payments.append({
+            'date': label,
+            'amount': payments_by_month.get(current_date, 0)
+        })
+        current_date = (current_date.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+    return {
+        'project_name': project.name,
+        'budget': project.budget,
+        # --- OVERALL STATS ---
+        'overall': {
+            'total_expenses': overall_total_expenses,
+            'total_payments': overall_total_payments,
+            'available_funds': overall_available_funds,
+            'due_payments': overall_due_payments,
+            'budget_utilization': round(overall_budget_utilization, 2),
+        },
+        # --- FILTERED DATA (for charts) ---
+        'filtered': {
+            'total_expenses': total_expenses,
+            'total_payments': total_payments,
+            'available_funds': available_funds,
+            'due_payments': due_payments,
+            'budget_utilization': round(budget_utilization, 2),
+            'expense_breakdown': expense_breakdown,
+            'payment_breakdown': payment_breakdown,
+            'monthly_trend': {
+                'expenses': monthly_expenses,
+                'payments': monthly_payments
+            }
+        }
+    }
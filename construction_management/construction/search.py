@@ -0,0 +1,268 @@
+import logging
+import re
+
+from django.conf import settings
+from django.db import DatabaseError, connection
+from django.db.models import FloatField, Q
+from django.db.models.expressions import RawSQL
+
+from .models import ManpowerExpense, MaterialExpense, MaterialItem
+
+logger = logging.getLogger(__name__)
+
+# Indexed text columns per model
+SEARCH_COLUMNS = {
+    ManpowerExpense: ['description'],
+    MaterialExpense: ['description', 'custom_item_name'],
+    MaterialItem: ['display_name'],
+}
+
+WORD = re.compile(r'\w+')
+
+
+def search_terms(text):
+    return WORD.findall(text.lower())
+
+
+class SQLiteSearchIndex:
+    """
+    FTS5 external-content tables over the searched columns, kept in sync
+    with their source tables by triggers, so every write path (save(),
+    bulk_create(), update()) updates the index.
+    """
+    vendor = 'sqlite'
+    min_term_length = 1
+
+    @staticmethod
+    def index_table(model):
+        return f'{model._meta.db_table}_fts'
+
+    def exists(self, cursor):
+        cursor.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name IN (%s)"
+            % ', '.join('%s' for _ in SEARCH_COLUMNS),
+            [self.index_table(model) for model in SEARCH_COLUMNS],
+        )
+        return cursor.fetchone()[0] == len(SEARCH_COLUMNS)
+
+    def install(self, cursor):
+        for model, columns in SEARCH_COLUMNS.items():
+            table = model._meta.db_table
+            fts = self.index_table(model)
+            column_list = ', '.join(columns)
+            new_values = ', '.join(f'new.{column}' for column in columns)
+            old_values = ', '.join(f'old.{column}' for column in columns)
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+                f"{column_list}, content='{table}', content_rowid='id', tokenize='unicode61')"
+            )
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+                f"INSERT INTO {fts}(rowid, {column_list}) VALUES (new.id, {new_values}); END"
+            )
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+                f"INSERT INTO {fts}({fts}, rowid, {column_list}) VALUES ('delete', old.id, {old_values}); END"
+            )
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE ON {table} BEGIN "
+                f"INSERT INTO {fts}({fts}, rowid, {column_list}) VALUES ('delete', old.id, {old_values}); "
+                f"INSERT INTO {fts}(rowid, {column_list}) VALUES (new.id, {new_values}); END"
+            )
+
+    def rebuild(self, cursor):
+        for model in SEARCH_COLUMNS:
+            fts = self.index_table(model)
+            cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+    def uninstall(self, cursor):
+        for model in SEARCH_COLUMNS:
+            fts = self.index_table(model)
+            for suffix in ('ai', 'ad', 'au'):
+                cursor.execute(f'DROP TRIGGER IF EXISTS {fts}_{suffix}')
+            cursor.execute(f'DROP TABLE IF EXISTS {fts}')
+
+    @staticmethod
+    def query(terms):
+        # Every term must match, each as a prefix
+        return ' '.join('"%s"*' % term for term in terms)
+
+    def matching_ids(self, model, terms):
+        fts = self.index_table(model)
+        return RawSQL(f'SELECT rowid FROM {fts} WHERE {fts} MATCH %s', [self.query(terms)])
+
+    def rank(self, model, terms, id_column):
+        # bm25 rank is negative, lower is better; flip it so higher is better
+        fts = self.index_table(model)
+        return (
+            f'(SELECT -rank FROM {fts} WHERE {fts} MATCH %s AND rowid = {id_column})',
+            [self.query(terms)],
+        )
+
+
+class MySQLSearchIndex:
+    """
+    InnoDB FULLTEXT indexes on the searched columns; InnoDB maintains them
+    on every write.
+    """
+    vendor = 'mysql'
+    # Default innodb_ft_min_token_size; shorter words are not indexed
+    min_term_length = 3
+
+    @staticmethod
+    def index_name(model):
+        return f'{model._meta.db_table}_ft'
+
+    def exists(self, cursor):
+        cursor.execute(
+            "SELECT COUNT(DISTINCT INDEX_NAME) FROM information_schema.STATISTICS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND INDEX_TYPE = 'FULLTEXT' AND INDEX_NAME IN (%s)"
+            % ', '.join('%s' for _ in SEARCH_COLUMNS),
+            [self.index_name(model) for model in SEARCH_COLUMNS],
+        )
+        return cursor.fetchone()[0] == len(SEARCH_COLUMNS)
+
+    def install(self, cursor):
+        if self.exists(cursor):
+            return
+        for model, columns in SEARCH_COLUMNS.items():
+            cursor.execute(
+                f'ALTER TABLE {model._meta.db_table} ADD FULLTEXT INDEX {self.index_name(model)} ({", ".join(columns)})'
+            )
+
+    def rebuild(self, cursor):
+        for model in SEARCH_COLUMNS:
+            cursor.execute(f'OPTIMIZE TABLE {model._meta.db_table}')
+            cursor.fetchall()
+
+    def uninstall(self, cursor):
+        if not self.exists(cursor):
+            return
+        for model in SEARCH_COLUMNS:
+            cursor.execute(f'ALTER TABLE {model._meta.db_table} DROP INDEX {self.index_name(model)}')
+
+    @staticmethod
+    def query(terms):
+        return ' '.join('+%s*' % term for term in terms)
+
+    def matching_ids(self, model, terms):
+        columns = ', '.join(SEARCH_COLUMNS[model])
+        return RawSQL(
+            f'SELECT id FROM {model._meta.db_table} WHERE MATCH ({columns}) AGAINST (%s IN BOOLEAN MODE)',
+            [self.query(terms)],
+        )
+
+    def rank(self, model, terms, id_column):
+        table = model._meta.db_table
+        columns = ', '.join(SEARCH_COLUMNS[model])
+        return (
+            f'(SELECT MATCH ({columns}) AGAINST (%s IN BOOLEAN MODE) FROM {table} WHERE id = {id_column})',
+            [self.query(terms)],
+        )
+
+
+SEARCH_INDEXES = {index.vendor: index for index in (SQLiteSearchIndex(), MySQLSearchIndex())}
+
+
+class ExpenseSearch:
+    """
+    Full-text search over expense descriptions and item names, falling back
+    to icontains when the database has no full-text index (or it has not
+    been installed, see the rebuild_search_index command). Whether the index
+    exists is checked once per process.
+
+    The index matches the start of words, not substrings within them, so
+    'kitch' finds 'Kitchen' but 'itchen' does not. Searches containing a
+    word shorter than the index's min_term_length use icontains instead.
+    """
+
+    def __init__(self):
+        self._available = {}
+
+    @property
+    def index(self):
+        return SEARCH_INDEXES.get(connection.vendor)
+
+    def is_available(self):
+        if getattr(settings, 'EXPENSE_SEARCH_BACKEND', 'fulltext') != 'fulltext' or self.index is None:
+            return False
+        if connection.alias not in self._available:
+            try:
+                with connection.cursor() as cursor:
+                    self._available[connection.alias] = self.index.exists(cursor)
+            except DatabaseError as e:
+                logger.warning(f"Could not check for the search index: {str(e)}")
+                return False
+        return self._available[connection.alias]
+
+    def reset(self):
+        self._available.clear()
+
+    def install(self, rebuild=True):
+        index = self.index
+        if index is None:
+            raise DatabaseError(f'Full-text search is not supported on {connection.vendor}')
+        with connection.cursor() as cursor:
+            index.install(cursor)
+            if rebuild:
+                index.rebuild(cursor)
+        self.reset()
+
+    def uninstall(self):
+        if self.index is not None:
+            with connection.cursor() as cursor:
+                self.index.uninstall(cursor)
+        self.reset()
+
+    def _terms(self, text):
+        """Search terms if text can be answered from the index, else None."""
+        terms = search_terms(text)
+        if terms and self.is_available() and min(map(len, terms)) >= self.index.min_term_length:
+            return terms
+        return None
+
+    def filter(self, queryset, text, ranked=False):
+        """
+        Filter a ManpowerExpense or MaterialExpense queryset to rows matching
+        text. With ranked=True matching rows are also annotated with
+        search_rank (higher is more relevant) when the index answered.
+        """
+        terms = self._terms(text)
+        if terms is None:
+            return self.fallback_filter(queryset, text)
+
+        model = queryset.model
+        if model is MaterialExpense:
+            queryset = queryset.filter(
+                Q(id__in=self.index.matching_ids(MaterialExpense, terms)) |
+                Q(item_id__in=self.index.matching_ids(MaterialItem, terms))
+            )
+        else:
+            queryset = queryset.filter(id__in=self.index.matching_ids(ManpowerExpense, terms))
+        if ranked:
+            queryset = queryset.annotate(search_rank=self.rank_expression(model, terms))
+        return queryset
+
+    def rank_expression(self, model, terms):
+        table = connection.ops.quote_name(model._meta.db_table)
+        sql, params = self.index.rank(model, terms, f'{table}.{connection.ops.quote_name("id")}')
+        if model is MaterialExpense:
+            item_sql, item_params = self.index.rank(
+                MaterialItem, terms, f'{table}.{connection.ops.quote_name("item_id")}'
+            )
+            sql = f'COALESCE({sql}, 0) + COALESCE({item_sql}, 0)'
+            params = params + item_params
+        return RawSQL(sql, params, output_field=FloatField())
+
+    @staticmethod
+    def fallback_filter(queryset, text):
+        if queryset.model is MaterialExpense:
+            return queryset.filter(
+                Q(item__display_name__icontains=text) |
+                Q(custom_item_name__icontains=text) |
+                Q(description__icontains=text)
+            )
+        return queryset.filter(description__icontains=text)
+
+
+expense_search = ExpenseSearch()
@@ -0,0 +1,317 @@
+"""
+Deterministic bulk data at production scale (see the seed_scale command).
+
+Rows are generated from one seeded random.Random and written with
+bulk_create in batches, bypassing save()/full_clean() and the per-row ledger
+updates. Each project's rows come from a generator seeded with the run's seed
+and the project's position, so projects can be generated by several worker
+processes and the data does not depend on how many there are. The generator
+keeps the invariants those would enforce instead: every project's payments
+sum to its total_paid, which is within its budget; its expenses never exceed
+its payments; and its ProjectLedger row holds the exact totals and counts of
+what was inserted.
+"""
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+import django
+from django.db import DatabaseError, connections, transaction
+
+from .models import (
+    LaborWorkType, ManpowerExpense, MaterialExpense, MaterialItem, Payment, Project, ProjectLedger,
+    create_default_material_items,
+)
+from .search import expense_search
+from .sequences import allocate_project_ids
+
+PROJECT_KINDS = [
+    'Villa', 'Apartments', 'Commercial Plaza', 'Warehouse', 'School', 'Hospital', 'Office Complex',
+    'Shopping Mall', 'Hotel', 'Row Houses', 'Gated Community', 'Factory Shed',
+]
+LOCALITIES = [
+    'Green Valley', 'Tech City', 'Skyline Heights', 'Retail Hub', 'Corporate Park', 'Green Meadows',
+    'Lake View', 'Old Town', 'Industrial Zone', 'Hill Side',
+]
+CITIES = ['Hyderabad', 'Bangalore', 'Mumbai', 'Delhi', 'Chennai', 'Pune', 'Goa', 'Ahmedabad', 'Kolkata', 'Kochi']
+STATUSES = ['Active', 'Completed', 'On Hold', 'Cancelled']
+STATUS_WEIGHTS = [60, 20, 15, 5]
+PHASES = [
+    'site clearing', 'foundation', 'basement', 'columns', 'ground floor slab', 'first floor slab',
+    'brick work', 'plastering', 'flooring', 'electrical', 'plumbing', 'painting', 'finishing', 'compound wall',
+]
+CUSTOM_ITEMS = ['Scaffolding', 'Waterproofing', 'Glass', 'Hardware', 'Adhesive', 'Shuttering']
+
+# Mean expense amounts in rupees; a project's budget follows from its row counts
+MANPOWER_MEAN = 18000
+MATERIAL_MEAN = 45000
+PAYMENT_MEAN = 400000
+
+
+def spread(total, weights):
+    """Split total into integers proportional to weights (largest remainder first)."""
+    weight_sum = sum(weights)
+    if not total or not weight_sum:
+        return [0] * len(weights)
+    shares = [total * weight / weight_sum for weight in weights]
+    counts = [int(share) for share in shares]
+    by_remainder = sorted(range(len(weights)), key=lambda i: counts[i] - shares[i])
+    for i in by_remainder[:total - sum(counts)]:
+        counts[i] += 1
+    return counts
+
+
+def jittered(rng, total_cents, count, jitter=0.5):
+    """
+    count amounts in cents summing exactly to total_cents: the even share,
+    with pairs of amounts moved up and down by the same random step.
+    """
+    base, remainder = divmod(total_cents, count)
+    pairs, odd = divmod(count, 2)
+    for i in range(pairs):
+        step = int(base * rng.uniform(0, jitter))
+        yield base + step
+        yield base - step + (remainder if i == pairs - 1 and not odd else 0)
+    if odd:
+        yield base + remainder
+
+
+def cents(value):
+    return Decimal(value).scaleb(-2)
+
+
+class ScaleSeeder:
+    """
+    Generates `projects` projects with `expenses` manpower and material
+    expenses and `payments` payments between them. Row counts per project
+    follow a heavy-tailed distribution, as in production where a few large
+    sites account for most of the history. The same arguments and seed
+    always produce the same rows (for a given end_date).
+    """
+
+    def __init__(self, projects=0, expenses=0, payments=0, seed=42, material_share=0.4, batch_size=5000,
+                 end_date=None, years=3, workers=1, log=None):
+        if expenses and not payments:
+            raise ValueError('Expenses need payments to spend; pass payments > 0')
+        self.project_count = projects
+        self.expense_count = expenses
+        self.payment_count = payments
+        self.seed = seed
+        self.material_share = material_share
+        self.batch_size = batch_size
+        self.end_date = end_date or date.today()
+        self.years = years
+        self.workers = workers
+        self.log = log or (lambda message: None)
+        self.inserted = {'projects': 0, 'payments': 0, 'manpower': 0, 'material': 0, 'ledgers': 0}
+        self.buffers = {Payment: [], ManpowerExpense: [], MaterialExpense: []}
+
+    def run(self):
+        started = time.perf_counter()
+        search_index = expense_search.is_available()
+        if search_index:
+            # Maintaining the full-text index row by row is the slowest part of
+            # a bulk load; build it once at the end instead
+            expense_search.uninstall()
+        try:
+            create_default_material_items()
+            for name, _ in LaborWorkType.WORK_TYPES:
+                LaborWorkType.objects.get_or_create(name=name)
+            plans = self.plan_projects()
+            if self.workers > 1:
+                self.generate_in_workers(plans)
+            else:
+                self.generate(plans)
+        finally:
+            if search_index:
+                self.log('Rebuilding the expense search index')
+                try:
+                    expense_search.install()
+                except DatabaseError as e:
+                    self.log(f'Could not rebuild the search index ({e}); run rebuild_search_index')
+        self.elapsed = time.perf_counter() - started
+        return self.inserted
+
+    def plan_projects(self):
+        """Insert the projects; returns what generate() needs to fill each one."""
+        rng = random.Random(self.seed)
+        # Pareto weights: most projects are small, a few carry most rows
+        weights = [rng.paretovariate(1.2) for _ in range(self.project_count)]
+        payment_counts = spread(self.payment_count, weights)
+        # Only projects that received money can spend it
+        expense_counts = spread(
+            self.expense_count, [weight if paid else 0 for weight, paid in zip(weights, payment_counts)]
+        )
+        project_ids = allocate_project_ids(self.project_count)
+
+        plans = []
+        projects = []
+        for project_id, payment_count, expense_count in zip(project_ids, payment_counts, expense_counts):
+            status = rng.choices(STATUSES, STATUS_WEIGHTS)[0]
+            duration_months = rng.randint(6, 36)
+            start = self.end_date - timedelta(days=rng.randint(30, self.years * 365))
+            finish = min(start + timedelta(days=duration_months * 30), self.end_date)
+
+            expected_spend = expense_count * (
+                self.material_share * MATERIAL_MEAN + (1 - self.material_share) * MANPOWER_MEAN
+            )
+            if expense_count:
+                paid_cents = int(expected_spend * rng.uniform(1.05, 1.3) * 100)
+            else:
+                paid_cents = int(payment_count * PAYMENT_MEAN * rng.uniform(0.5, 1.5) * 100)
+            # Enough for every payment to be at least one rupee
+            paid_cents = max(paid_cents, payment_count * 100)
+            budget_rupees = paid_cents / 100 / (rng.uniform(0.9, 1.0) if status == 'Completed' else rng.uniform(0.4, 0.9))
+            budget = Decimal(max(int(-(-budget_rupees // 100000)) * 100000, 100000))
+
+            kind = rng.choice(PROJECT_KINDS)
+            locality, city = rng.choice(LOCALITIES), rng.choice(CITIES)
+            projects.append(Project(
+                project_id=project_id,
+                name=f'{locality} {kind}',
+                land_details=f'{rng.randrange(2, 60) * 1000} sq ft plot',
+                land_address=f'{rng.randint(1, 999)} {locality}, {city}',
+                budget=budget,
+                duration_months=duration_months,
+                status=status,
+                total_paid=cents(paid_cents),
+                remaining_amount=budget - cents(paid_cents),
+                created_at=timestamp(rng, start),
+            ))
+            plans.append([len(plans), None, status, payment_count, expense_count, paid_cents, start, finish])
+
+        for start in range(0, len(projects), self.batch_size):
+            self.write(Project, projects[start:start + self.batch_size], 'projects')
+        for plan, project in zip(plans, projects):
+            plan[1] = project.pk
+        return plans
+
+    def generate(self, plans):
+        """Insert the payments, expenses and ledger rows of the planned projects."""
+        self.work_type_ids = list(LaborWorkType.objects.order_by('pk').values_list('pk', flat=True))
+        self.items = list(MaterialItem.objects.filter(is_active=True).order_by('pk').values_list('pk', 'name'))
+        ledgers = []
+        for plan in plans:
+            ledgers.append(self.generate_project(*plan))
+            if len(ledgers) >= self.batch_size:
+                self.write(ProjectLedger, ledgers, 'ledgers')
+                ledgers = []
+        self.flush()
+        self.write(ProjectLedger, ledgers, 'ledgers')
+        return self.inserted
+
+    def generate_in_workers(self, plans):
+        # Balance the heavy tail: biggest projects first, each to the least loaded chunk
+        chunks = [[] for _ in range(self.workers * 4)]
+        loads = [0] * len(chunks)
+        for plan in sorted(plans, key=lambda plan: plan[3] + plan[4], reverse=True):
+            lightest = loads.index(min(loads))
+            chunks[lightest].append(plan)
+            loads[lightest] += plan[3] + plan[4] + 1
+        options = {'seed': self.seed, 'material_share': self.material_share, 'batch_size': self.batch_size}
+        # SQLite and MySQL connections must not be shared with child processes
+        connections.close_all()
+        with ProcessPoolExecutor(self.workers, initializer=django.setup) as executor:
+            futures = [executor.submit(generate_chunk, options, chunk) for chunk in chunks if chunk]
+            for future in as_completed(futures):
+                for label, count in future.result().items():
+                    self.inserted[label] += count
+                self.log(f'{sum(self.inserted.values()):,} rows')
+
+    def generate_project(self, index, project_pk, status, payment_count, expense_count, paid_cents, start, finish):
+        """Buffer a project's payments and expenses; returns its ledger row."""
+        rng = random.Random(f'{self.seed}:{index}')
+        span = (finish - start).days
+
+        for i, amount in enumerate(jittered(rng, paid_cents, payment_count) if payment_count else ()):
+            if i == 0:
+                payment_type, day = 'Advance', start
+            else:
+                payment_type = 'Full' if status == 'Completed' and i == payment_count - 1 else 'Installment'
+                day = start + timedelta(days=rng.randint(0, span))
+            self.add(Payment(
+                project_id=project_pk, amount=cents(amount), payment_date=day, payment_type=payment_type,
+                description=f'{payment_type} payment for {rng.choice(PHASES)}', created_at=timestamp(rng, day),
+            ))
+
+        manpower_cents = material_cents = manpower_count = material_count = 0
+        if expense_count:
+            # Spend less than was paid; rounding below only ever lowers amounts
+            spend_cents = int(paid_cents * rng.uniform(0.7, 0.95))
+            for target in jittered(rng, spend_cents, expense_count):
+                day = start + timedelta(days=rng.randint(0, span))
+                phase = rng.choice(PHASES)
+                if rng.random() < self.material_share:
+                    item_id, item_name = rng.choice(self.items)
+                    quantity = min(1 + int(rng.expovariate(1 / 40)), target)
+                    per_unit = target // quantity
+                    material_cents += per_unit * quantity
+                    material_count += 1
+                    self.add(MaterialExpense(
+                        project_id=project_pk, date=day, item_id=item_id,
+                        custom_item_name=rng.choice(CUSTOM_ITEMS) if item_name == 'others' else None,
+                        quantity=Decimal(quantity), per_unit_cost=cents(per_unit),
+                        total_amount=cents(per_unit * quantity),
+                        description=f'{item_name.title()} for {phase}', created_at=timestamp(rng, day),
+                    ))
+                else:
+                    people = min(1 + int(rng.expovariate(1 / 6)), 60, target)
+                    per_person = target // people
+                    manpower_cents += per_person * people
+                    manpower_count += 1
+                    self.add(ManpowerExpense(
+                        project_id=project_pk, work_type_id=rng.choice(self.work_type_ids), date=day,
+                        number_of_people=people, per_person_cost=cents(per_person),
+                        total_amount=cents(per_person * people),
+                        description=f'{phase.capitalize()} crew', created_at=timestamp(rng, day),
+                    ))
+
+        return ProjectLedger(
+            project_id=project_pk,
+            total_payments=cents(paid_cents),
+            total_manpower=cents(manpower_cents),
+            total_material=cents(material_cents),
+            manpower_count=manpower_count,
+            material_count=material_count,
+        )
+
+    def add(self, obj):
+        buffer = self.buffers[type(obj)]
+        buffer.append(obj)
+        if len(buffer) >= self.batch_size:
+            self.flush(type(obj))
+
+    def flush(self, model=None):
+        labels = {Payment: 'payments', ManpowerExpense: 'manpower', MaterialExpense: 'material'}
+        for buffered_model in ([model] if model else list(self.buffers)):
+            self.write(buffered_model, self.buffers[buffered_model], labels[buffered_model])
+            self.buffers[buffered_model] = []
+
+    def write(self, model, objs, label):
+        if not objs:
+            return
+        with transaction.atomic():
+            created = model.objects.bulk_create(objs, batch_size=self.batch_size)
+        self.inserted[label] += len(objs)
+        if label == 'projects' and created and created[0].pk is None:
+            # Backends that cannot return primary keys from a bulk insert
+            # (MySQL) leave them unset; look them up by the unique project_id
+            pks = dict(Project.objects.filter(project_id__in=[project.project_id for project in objs])
+                       .values_list('project_id', 'pk'))
+            for project in objs:
+                project.pk = pks[project.project_id]
+        total = sum(self.inserted.values())
+        if total // 100000 != (total - len(objs)) // 100000:
+            self.log(f'{total:,} rows')
+
+
+def timestamp(rng, day):
+    seconds = rng.randrange(8 * 3600, 19 * 3600)
+    return datetime(day.year, day.month, day.day, tzinfo=dt_timezone.utc) + timedelta(seconds=seconds)
+
+
+def generate_chunk(options, plans):
+    """Worker process entry point for ScaleSeeder.generate_in_workers."""
+    return ScaleSeeder(**options).generate(plans)
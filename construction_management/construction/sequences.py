@@ -0,0 +1,128 @@
+import re
+import threading
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+
+from .models import IdSequence, Project
+
+PROJECT_ID_SEQUENCE = 'project_id'
+PROJECT_ID_PATTERN = re.compile(r'^ID-(\d+)$')
+PROJECT_ID_LENGTH = Project._meta.get_field('project_id').max_length
+
+
+def highest_project_number():
+    """Largest numeric suffix among existing 'ID-<digits>' project ids."""
+    numbers = (
+        int(match.group(1))
+        for match in map(PROJECT_ID_PATTERN.match, Project.objects.values_list('project_id', flat=True).iterator())
+        if match
+    )
+    return max(numbers, default=0)
+
+
+class SequenceAllocator:
+    """
+    Hands out increasing numbers from an IdSequence row.
+
+    Each reservation is a single UPDATE ... SET last_value = last_value + n,
+    so it is O(1) and concurrent callers can never receive the same number.
+    With block_size > 1 a process reserves a block of numbers at once and
+    serves it from memory; numbers then stay unique but are not handed out in
+    strict order across processes. Blocks are only cached when reserved in
+    autocommit mode, so a rolled-back transaction cannot leave a cached block
+    that the database no longer knows about.
+
+    Like a database sequence, numbers are unique but not gapless: a number
+    whose row is never inserted (a failed save, an unused part of a block)
+    is not handed out again.
+    """
+
+    def __init__(self, name, initial_value=lambda: 0):
+        self.name = name
+        self.initial_value = initial_value
+        self._lock = threading.Lock()
+        self._next = self._end = None
+
+    def _reserve(self, size):
+        with transaction.atomic():
+            updated = IdSequence.objects.filter(name=self.name).update(last_value=F('last_value') + size)
+            if not updated:
+                try:
+                    with transaction.atomic():
+                        IdSequence.objects.create(name=self.name, last_value=self.initial_value() + size)
+                except IntegrityError:
+                    # Another worker created the row first
+                    IdSequence.objects.filter(name=self.name).update(last_value=F('last_value') + size)
+            last_value = IdSequence.objects.filter(name=self.name).values_list('last_value', flat=True).get()
+        return last_value - size + 1, last_value
+
+    def next_value(self, block_size=1):
+        with self._lock:
+            if self._next is not None and self._next <= self._end:
+                value = self._next
+                self._next += 1
+                return value
+            if block_size > 1 and not connection.in_atomic_block:
+                self._next, self._end = self._reserve(block_size)
+                value = self._next
+                self._next += 1
+                return value
+        return self._reserve(1)[0]
+
+    def reserve(self, size):
+        """Reserve size consecutive numbers for the caller; returns (first, last)."""
+        return self._reserve(size)
+
+    def reset(self):
+        with self._lock:
+            self._next = self._end = None
+
+
+project_id_allocator = SequenceAllocator(PROJECT_ID_SEQUENCE, highest_project_number)
+
+
+def format_project_id(number, width=None):
+    """
+    'ID-' plus the zero-padded number. Project.project_id holds 10
+    characters, so numbers (and PROJECT_ID_WIDTH) are limited to 7 digits.
+    """
+    width = width or getattr(settings, 'PROJECT_ID_WIDTH', 4)
+    project_id = f"ID-{number:0{width}d}"
+    if len(project_id) > PROJECT_ID_LENGTH:
+        raise ValueError(
+            f"Project id {project_id} is longer than {PROJECT_ID_LENGTH} characters; "
+            f"the project number or PROJECT_ID_WIDTH is too large"
+        )
+    return project_id
+
+
+def allocate_project_id():
+    """
+    Return the next free project id. Numbers already taken by a manually
+    entered project id are skipped. The number is reserved before the
+    project is inserted, so a save that fails leaves a gap in the ids.
+    """
+    block_size = getattr(settings, 'PROJECT_ID_BLOCK_SIZE', 1)
+    while True:
+        project_id = format_project_id(project_id_allocator.next_value(block_size))
+        if not Project.objects.filter(project_id=project_id).exists():
+            return project_id
+
+
+def allocate_project_ids(count):
+    """
+    Return count free project ids for a bulk insert, reserving them with
+    one sequence update (plus one per collision with manually entered ids).
+    """
+    project_ids = []
+    while len(project_ids) < count:
+        first, last = project_id_allocator.reserve(count - len(project_ids))
+        candidates = [format_project_id(number) for number in range(first, last + 1)]
+        taken = set()
+        for start in range(0, len(candidates), 500):
+            taken.update(Project.objects.filter(project_id__in=candidates[start:start + 500])
+                         .values_list('project_id', flat=True))
+        project_ids += [project_id for project_id in candidates if project_id not in taken]
+    return project_ids
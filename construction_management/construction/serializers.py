@@ -1,10 +1,37 @@
+from decimal import Decimal
 from rest_framework import serializers
-from .models import Project, ManpowerExpense, MaterialExpense, Payment, LaborWorkType, MaterialItem
+from django.conf import settings
+from django.db import transaction
+from .models import Project, ManpowerExpense, MaterialExpense, Payment, LaborWorkType, MaterialItem, ProjectLedger, UploadSession
+from .reference_data import reference_data
+from .downloads import payment_file_url
+from .uploads import claim_upload, start_session
 import logging
-from django.db.models import Sum
 
 logger = logging.getLogger(__name__)
 
+class CachedMaterialItemField(serializers.PrimaryKeyRelatedField):
+    """Resolves material item ids from the in-process reference data cache."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        item = reference_data.get_material_item(data)
+        if item is None:
+            self.fail('does_not_exist', pk_value=data)
+        return item
+
+class CachedWorkTypeField(serializers.PrimaryKeyRelatedField):
+    """Resolves labour work type ids from the in-process reference data cache."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        work_type = reference_data.get_work_type(data)
+        if work_type is None:
+            self.fail('does_not_exist', pk_value=data)
+        return work_type
+
 class ProjectSerializer(serializers.ModelSerializer):
     class Meta:
         model = Project
@@ -51,13 +78,34 @@ class ProjectSerializer(serializers.ModelSerializer):
                 raise serializers.ValidationError("Document must be smaller than 5MB.")
         return value
 
+class PaymentFileField(serializers.FileField):
+    """A payment file, rendered as its download endpoint instead of its MEDIA_URL."""
+
+    def to_representation(self, value):
+        if not value:
+            return None
+        url = payment_file_url(value.instance)
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request is not None else url
+
+
 class PaymentSerializer(serializers.ModelSerializer):
     project_name = serializers.CharField(source='project.name', read_only=True)
+    payment_file = PaymentFileField(required=False, allow_null=True)
+    payment_file_url = serializers.SerializerMethodField()
+    # A completed resumable upload (see construction.uploads) to use as payment_file
+    upload_id = serializers.UUIDField(write_only=True, required=False)
     
     class Meta:
         model = Payment
-        fields = ['id', 'project', 'project_name', 'amount', 'payment_date', 'payment_type', 'payment_file']
+        fields = ['id', 'project', 'project_name', 'amount', 'payment_date', 'payment_type', 'payment_file', 'payment_file_url', 'upload_id']
         read_only_fields = ['project_name']
+
+    def get_payment_file_url(self, payment):
+        # Download endpoint; the content digest in the URL lets clients cache it for good
+        if not payment.payment_file:
+            return None
+        return payment_file_url(payment)
     
     def validate_amount(self, value):
         if value <= 0:
@@ -67,9 +115,57 @@ class PaymentSerializer(serializers.ModelSerializer):
     def validate_payment_file(self, value):
         if value:
             if value.size > 5 * 1024 * 1024:  # 5MB limit
-                raise serializers.ValidationError("File size must be less than 5MB")
+                raise serializers.ValidationError("File size must be less than 5MB; upload larger files in chunks through /api/uploads/")
         return value
 
+    def validate_upload_id(self, value):
+        if not UploadSession.objects.filter(pk=value, status='complete').exists():
+            raise serializers.ValidationError("Upload not found or not complete")
+        return value
+
+    def validate(self, data):
+        if data.get('upload_id') and data.get('payment_file'):
+            raise serializers.ValidationError({'upload_id': 'Send either payment_file or upload_id, not both'})
+        return data
+
+    def create(self, validated_data):
+        upload_id = validated_data.pop('upload_id', None)
+        with transaction.atomic():
+            if upload_id:
+                validated_data['payment_file'] = claim_upload(upload_id)
+            return super().create(validated_data)
+
+    def update(self, instance, validated_data):
+        upload_id = validated_data.pop('upload_id', None)
+        with transaction.atomic():
+            if upload_id:
+                validated_data['payment_file'] = claim_upload(upload_id)
+            return super().update(instance, validated_data)
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    sha256 = serializers.RegexField(r'^[0-9a-fA-F]{64}$', error_messages={'invalid': 'Must be a hex SHA-256 digest'})
+    chunk_size = serializers.SerializerMethodField()
+
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'filename', 'size', 'sha256', 'received', 'status', 'chunk_size', 'created_at', 'updated_at']
+        read_only_fields = ['received', 'status', 'created_at', 'updated_at']
+
+    def get_chunk_size(self, session):
+        # Largest chunk a single PUT may carry
+        return getattr(settings, 'CHUNKED_UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024)
+
+    def validate_size(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("Size must be greater than zero")
+        max_size = getattr(settings, 'CHUNKED_UPLOAD_MAX_SIZE', 100 * 1024 * 1024)
+        if value > max_size:
+            raise serializers.ValidationError(f"File size must be at most {max_size} bytes")
+        return value
+
+    def create(self, validated_data):
+        return start_session(**validated_data)
+
 class LaborWorkTypeSerializer(serializers.ModelSerializer):
     name_display = serializers.CharField(source='get_name_display', read_only=True)
     
@@ -80,6 +176,7 @@ class LaborWorkTypeSerializer(serializers.ModelSerializer):
 class ManpowerExpenseSerializer(serializers.ModelSerializer):
     project_name = serializers.CharField(source='project.name', read_only=True)
     work_type_display = serializers.CharField(source='work_type.get_name_display', read_only=True)
+    work_type = CachedWorkTypeField(queryset=LaborWorkType.objects.all(), required=False, allow_null=True)
 
     class Meta:
         model = ManpowerExpense
@@ -107,6 +204,7 @@ class MaterialItemSerializer(serializers.ModelSerializer):
 class MaterialExpenseSerializer(serializers.ModelSerializer):
     project_name = serializers.CharField(source='project.name', read_only=True)
     item_display = serializers.CharField(source='item.display_name', read_only=True)
+    item = CachedMaterialItemField(queryset=MaterialItem.objects.all())
 
     class Meta:
         model = MaterialExpense
@@ -128,16 +226,14 @@ class MaterialExpenseSerializer(serializers.ModelSerializer):
         per_unit_cost = data.get('per_unit_cost')
         quantity = data.get('quantity')
         if per_unit_cost and quantity:
-            data['total_amount'] = per_unit_cost * quantity
+            data['total_amount'] = (per_unit_cost * quantity).quantize(Decimal('0.01'))
             
             # Check if total amount exceeds project budget
             project = data.get('project')
             if project:
-                total_expenses = (
-                    ManpowerExpense.objects.filter(project=project).aggregate(total=Sum('total_amount'))['total'] or 0
-                ) + (
-                    MaterialExpense.objects.filter(project=project).exclude(id=self.instance.id if self.instance else None).aggregate(total=Sum('total_amount'))['total'] or 0
-                )
+                total_expenses = ProjectLedger.for_project(project).total_expenses
+                if self.instance:
+                    total_expenses -= self.instance.total_amount
                 
                 if total_expenses + data['total_amount'] > project.budget:
                     raise serializers.ValidationError({
@@ -151,3 +247,31 @@ class MaterialExpenseSerializer(serializers.ModelSerializer):
 
     def update(self, instance, validated_data):
         return super().update(instance, validated_data)
+
+class ExpenseFeedSerializer(serializers.Serializer):
+    """Read-only rows of the ?type=all expense feed (see construction.expense_feed)."""
+    WORK_TYPE_NAMES = dict(LaborWorkType.WORK_TYPES)
+
+    id = serializers.IntegerField()
+    type = serializers.CharField(source='expense_type')
+    project = serializers.IntegerField(source='project_id')
+    project_name = serializers.CharField()
+    date = serializers.DateField()
+    total_amount = serializers.DecimalField(max_digits=15, decimal_places=2)
+    description = serializers.CharField(allow_null=True)
+    created_at = serializers.DateTimeField()
+    # Manpower only
+    work_type = serializers.IntegerField(source='work_type_ref', allow_null=True)
+    work_type_display = serializers.SerializerMethodField()
+    number_of_people = serializers.IntegerField(source='people', allow_null=True)
+    per_person_cost = serializers.DecimalField(source='person_cost', max_digits=15, decimal_places=2, allow_null=True)
+    # Material only
+    item = serializers.IntegerField(source='item_ref', allow_null=True)
+    item_display = serializers.CharField(source='item_label', allow_null=True)
+    custom_item_name = serializers.CharField(source='custom_name', allow_null=True)
+    quantity = serializers.DecimalField(source='item_quantity', max_digits=15, decimal_places=2, allow_null=True)
+    per_unit_cost = serializers.DecimalField(source='unit_cost', max_digits=15, decimal_places=2, allow_null=True)
+
+    def get_work_type_display(self, row):
+        name = row['work_type_name']
+        return self.WORK_TYPE_NAMES.get(name, name)
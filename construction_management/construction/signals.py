@@ -0,0 +1,26 @@
+from django.db.models import QuerySet
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+from .models import LaborWorkType, ManpowerExpense, MaterialExpense, MaterialItem, Payment, Project, StoredFile
+from .reference_data import reference_data
+
+@receiver([post_save, post_delete], sender=MaterialItem)
+@receiver([post_save, post_delete], sender=LaborWorkType)
+def invalidate_reference_data(sender, **kwargs):
+    reference_data.invalidate()
+
+@receiver(pre_delete, sender=ManpowerExpense)
+@receiver(pre_delete, sender=MaterialExpense)
+@receiver(pre_delete, sender=Payment)
+def remove_ledger_entry(sender, instance, origin=None, **kwargs):
+    """
+    Runs for instance.delete(), queryset.delete() and cascades alike (its
+    being connected also stops Django from fast-deleting these rows without
+    signals), inside the delete's transaction.
+    """
+    # When the project itself goes, its ledger goes with it
+    project_deleted = isinstance(origin, Project) or (isinstance(origin, QuerySet) and origin.model is Project)
+    if not project_deleted:
+        instance.remove_from_ledger()
+    if sender is Payment and instance.payment_file:
+        StoredFile.release(instance.payment_file.name)
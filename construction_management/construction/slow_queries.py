@@ -0,0 +1,198 @@
+"""
+Slow query capture. An execute wrapper on every connection times each query;
+one that takes SLOW_QUERY_THRESHOLD_MS or longer is kept with its SQL,
+parameters, the view and request it ran for and the project code that ran
+it. A background thread then adds the query's EXPLAIN plan from a
+connection of its own, so the request never waits for it. Entries live in a
+ring buffer per process (the /api/slow-queries/ staff view) and, with
+SLOW_QUERY_LOG_FILE set, are also appended to that file as JSON lines.
+"""
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+import traceback
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+from .query_stats import current as current_query_stats
+
+logger = logging.getLogger(__name__)
+
+# Set while the EXPLAIN thread runs, so its own queries are never captured
+_explaining = ContextVar('slow_query_explaining', default=False)
+
+MAX_PARAM_LENGTH = 200
+MAX_FRAMES = 8
+MAX_PENDING_PLANS = 16
+PLAN_CACHE_SIZE = 128
+
+
+def short_repr(value):
+    text = repr(value)
+    return text if len(text) <= MAX_PARAM_LENGTH else text[:MAX_PARAM_LENGTH] + '...'
+
+
+def describe_params(params, many):
+    if params is None:
+        return []
+    if many:
+        # executemany(): the first parameter set stands for the rest
+        params = list(params)
+        return {'sets': len(params), 'first': [short_repr(value) for value in params[0]] if params else []}
+    if isinstance(params, dict):
+        return {name: short_repr(value) for name, value in params.items()}
+    return [short_repr(value) for value in params]
+
+
+def call_site():
+    """The innermost frames of project code that led to the query, innermost last."""
+    base = str(settings.BASE_DIR)
+    frames = [
+        frame for frame in traceback.extract_stack()
+        if frame.filename.startswith(base) and frame.filename != __file__ and 'site-packages' not in frame.filename
+    ]
+    return [f'{os.path.relpath(frame.filename, base)}:{frame.lineno} in {frame.name}' for frame in frames[-MAX_FRAMES:]]
+
+
+def request_details(request):
+    if request is None:
+        return {'view': None, 'method': None, 'path': None}
+    match = getattr(request, 'resolver_match', None)
+    return {'view': match.view_name if match else None, 'method': request.method, 'path': request.get_full_path()}
+
+
+class SlowQueryLog:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = deque(maxlen=getattr(settings, 'SLOW_QUERY_LOG_SIZE', 200))
+        self.ids = itertools.count(1)
+        self.plans = OrderedDict()
+        self.pending = []
+        self.executor = None
+
+    @property
+    def threshold(self):
+        return getattr(settings, 'SLOW_QUERY_THRESHOLD_MS', 0) / 1000
+
+    def capture(self, execute, sql, params, many, context):
+        """connection.execute_wrapper() hook."""
+        threshold = self.threshold
+        if threshold <= 0 or _explaining.get():
+            return execute(sql, params, many, context)
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            if duration >= threshold:
+                self.record(sql, params, many, duration, context['connection'].alias)
+
+    def record(self, sql, params, many, duration, alias):
+        stats = current_query_stats()
+        entry = {
+            'id': next(self.ids),
+            'time': timezone.now().isoformat(),
+            'duration_ms': round(duration * 1000, 2),
+            'database': alias,
+            'sql': sql,
+            'params': describe_params(params, many),
+            **request_details(stats.request if stats else None),
+            'stack': call_site(),
+            'plan': None,
+        }
+        with self.lock:
+            self.entries.append(entry)
+        if not getattr(settings, 'SLOW_QUERY_EXPLAIN', False) or many or not sql.lstrip()[:6].upper() == 'SELECT':
+            # Only reads are explained; EXPLAIN of a write is not always side-effect free
+            self.write(entry)
+            return
+        plan = self.plans.get((alias, sql))
+        if plan is not None:
+            entry['plan'] = plan
+            self.write(entry)
+            return
+        self.explain_later(entry, sql, params, alias)
+
+    def explain_later(self, entry, sql, params, alias):
+        with self.lock:
+            self.pending = [future for future in self.pending if not future.done()]
+            if len(self.pending) >= MAX_PENDING_PLANS:
+                entry['plan_error'] = 'Skipped: too many plans pending'
+                skipped = True
+            else:
+                if self.executor is None:
+                    self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='slow-query-explain')
+                self.pending.append(self.executor.submit(self.explain, entry, sql, params, alias))
+                skipped = False
+        if skipped:
+            self.write(entry)
+
+    def explain(self, entry, sql, params, alias):
+        token = _explaining.set(True)
+        connection = connections[alias]
+        try:
+            prefix = connection.ops.explain_query_prefix()
+            with connection.cursor() as cursor:
+                cursor.execute(f'{prefix} {sql}', params)
+                plan = [' '.join(str(column) for column in row) for row in cursor.fetchall()]
+            entry['plan'] = plan
+            with self.lock:
+                self.plans[(alias, sql)] = plan
+                while len(self.plans) > PLAN_CACHE_SIZE:
+                    self.plans.popitem(last=False)
+        except Exception as e:
+            entry['plan_error'] = str(e)
+        finally:
+            # The explain thread's connection is only needed again for the next slow query
+            connection.close()
+            _explaining.reset(token)
+        self.write(entry)
+
+    def wait(self):
+        """Block until every pending EXPLAIN has finished."""
+        with self.lock:
+            pending = list(self.pending)
+        for future in pending:
+            future.result()
+
+    def write(self, entry):
+        path = getattr(settings, 'SLOW_QUERY_LOG_FILE', '')
+        if not path:
+            return
+        try:
+            self.dump(path, [entry], mode='a')
+        except OSError as e:
+            logger.error(f"Error writing slow query log {path}: {str(e)}")
+
+    def snapshot(self):
+        """Entries, newest first."""
+        with self.lock:
+            return [dict(entry) for entry in reversed(self.entries)]
+
+    def dump(self, path, entries=None, mode='w'):
+        entries = self.snapshot() if entries is None else entries
+        with open(path, mode) as output:
+            for entry in entries:
+                output.write(json.dumps(entry, default=str) + '\n')
+        return len(entries)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+slow_query_log = SlowQueryLog()
+
+
+def install(sender, connection, **kwargs):
+    """connection_created receiver."""
+    if slow_query_log.capture not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, slow_query_log.capture)
@@ -0,0 +1,107 @@
+import hashlib
+import os
+import re
+import tempfile
+
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+
+CHUNK_SIZE = 64 * 1024
+EXTENSION = re.compile(r'^\.[a-z0-9]{1,10}$')
+CONTENT_NAME = re.compile(r'(?:^|/)[0-9a-f]{2}/(?P<sha256>[0-9a-f]{64})(?:\.[a-z0-9]{1,10})?$')
+
+
+def content_name(name, sha256):
+    """
+    Storage name for content with the given digest, uploaded as name:
+    'payment_files/receipt.PDF' -> 'payment_files/ab/ab12...ef.pdf'.
+    """
+    directory = os.path.dirname(name)
+    extension = os.path.splitext(name)[1].lower()
+    if not EXTENSION.match(extension):
+        extension = ''
+    return os.path.join(directory, sha256[:2], sha256 + extension).replace('\\', '/')
+
+
+def content_digest(name):
+    """The SHA-256 a content-addressed name was derived from, or None for other names."""
+    match = CONTENT_NAME.search(name or '')
+    return match.group('sha256') if match else None
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File storage that keeps each distinct upload once, named by its SHA-256.
+
+    Saving hashes the content while streaming it to a temporary file next to
+    its destination (or takes the digest the upload handler already computed,
+    see construction.uploads) and moves it into place only if that content is
+    not stored yet. Every save takes a reference on the file's StoredFile row;
+    owners release it when they stop pointing at the file, and the file is
+    deleted once nothing references it (StoredFile.release/collect).
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # The final name depends on the content, see _save()
+        return name
+
+    def _save(self, name, content):
+        from .models import StoredFile
+
+        temp_path, sha256, size, owned = self._hash_to_temp(name, content)
+        name = content_name(name, sha256)
+        try:
+            with transaction.atomic():
+                # Takes the row lock before the file is written, so a
+                # concurrent collect() cannot delete it under us
+                StoredFile.acquire(name, sha256, size)
+                full_path = self.path(name)
+                if not os.path.exists(full_path):
+                    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                    if self.directory_permissions_mode is not None:
+                        os.chmod(os.path.dirname(full_path), self.directory_permissions_mode)
+                    if owned:
+                        os.replace(temp_path, full_path)
+                    else:
+                        file_move_safe(temp_path, full_path)
+                    temp_path = None
+                    if self.file_permissions_mode is not None:
+                        os.chmod(full_path, self.file_permissions_mode)
+        finally:
+            if owned and temp_path is not None:
+                os.remove(temp_path)
+        return name
+
+    def _hash_to_temp(self, name, content):
+        """(temp_path, sha256, size, owned) for content, copying it only if needed."""
+        sha256 = getattr(content, 'sha256', None)
+        if sha256 and hasattr(content, 'temporary_file_path'):
+            return content.temporary_file_path(), sha256, content.size, False
+
+        directory = self.path(os.path.dirname(name))
+        os.makedirs(directory, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        with tempfile.NamedTemporaryFile(dir=directory, prefix='.upload-', delete=False) as temp:
+            try:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for chunk in content.chunks(CHUNK_SIZE):
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode()
+                    digest.update(chunk)
+                    temp.write(chunk)
+                    size += len(chunk)
+            except BaseException:
+                temp.close()
+                os.remove(temp.name)
+                raise
+        return temp.name, digest.hexdigest(), size, True
+
+
+payment_file_storage = ContentAddressedStorage()
+
+
+def get_payment_file_storage():
+    return payment_file_storage
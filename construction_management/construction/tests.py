@@ -1,3 +1,1886 @@
-from django.test import TestCase
+import csv
+import hashlib
+import json
+import multiprocessing
+import os
+import pstats
+import random
+import shutil
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+
+from django.core.cache import caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.db.models import Sum
+from django.test import AsyncClient, AsyncRequestFactory, Client, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import async_views, benchmarks, loadtest, metrics, views
+from .middleware import profiling_middleware, query_stats_middleware
+from .models import (
+    Project, ManpowerExpense, MaterialExpense, Payment, LaborWorkType, MaterialItem, ProjectLedger, IdSequence, StoredFile,
+    UploadSession
+)
+from .query_stats import count_queries
+from .reference_data import reference_data, warm_on_startup
+from .report_cache import report_cache
+from .search import expense_search
+from .seeding import ScaleSeeder
+from .profiling import profile_store
+from .slow_queries import install as install_slow_query_capture, slow_query_log
+from .serializers import ManpowerExpenseSerializer, PaymentSerializer, ProjectSerializer
+from .sequences import PROJECT_ID_SEQUENCE, format_project_id, project_id_allocator
+
+
+def create_project(**kwargs):
+    defaults = {
+        'name': 'Test Project',
+        'land_details': 'Test Land',
+        'land_address': 'Test Address',
+        'budget': Decimal('1000000.00'),
+    }
+    defaults.update(kwargs)
+    return Project.objects.create(**defaults)
+
+
+class QueryCountTestMixin:
+    """
+    Checks that an endpoint's query count does not grow with the number of
+    rows it returns. ``seed(n)`` must add n more rows to the endpoint's data.
+    """
+    query_count_sizes = (10, 10000)
+
+    def assertQueryCountConstant(self, url, seed, sizes=None):
+        counts = {}
+        seeded = 0
+        for size in sizes or self.query_count_sizes:
+            seed(size - seeded)
+            seeded = size
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            counts[size] = len(ctx.captured_queries)
+        self.assertEqual(len(set(counts.values())), 1, f'{url}: {counts}')
+
+
+class ReportDataTests(TestCase):
+    def setUp(self):
+        caches['reports'].clear()
+        self.project = create_project()
+        self.work_type = LaborWorkType.objects.create(name='construction')
+        self.item = MaterialItem.objects.create(name='cement', display_name='Cement')
+        Payment.objects.create(project=self.project, amount=Decimal('50000'), payment_date=date(2025, 1, 10), payment_type='Advance')
+        Payment.objects.create(project=self.project, amount=Decimal('20000'), payment_date=date(2025, 3, 5), payment_type='Installment')
+        Payment.objects.create(project=self.project, amount=Decimal('10000'), payment_date=date(2024, 12, 5), payment_type='Full')
+        ManpowerExpense.objects.create(
+            project=self.project, work_type=self.work_type, date=date(2025, 1, 12),
+            number_of_people=4, per_person_cost=Decimal('500'), total_amount=Decimal('2000'),
+        )
+        ManpowerExpense.objects.create(
+            project=self.project, work_type=self.work_type, date=date(2025, 3, 2),
+            number_of_people=2, per_person_cost=Decimal('750'), total_amount=Decimal('1500'),
+        )
+        MaterialExpense.objects.create(
+            project=self.project, item=self.item, date=date(2025, 3, 3),
+            per_unit_cost=Decimal('400'), quantity=Decimal('10'), total_amount=Decimal('4000'),
+        )
+
+    def get_report(self, time_range, today=date(2025, 3, 15)):
+        url = reverse('report_data', args=[self.project.id])
+        with mock.patch('construction.reports.timezone.now') as now:
+            now.return_value = now_value = mock.Mock()
+            now_value.date.return_value = today
+            return self.client.get(url, {'time_range': time_range})
+
+    def test_year_report(self):
+        data = self.get_report('year').json()
+        self.assertEqual(data['overall']['total_expenses'], 7500)
+        self.assertEqual(data['overall']['total_payments'], 80000)
+        self.assertEqual(data['filtered']['total_payments'], 70000)
+        self.assertEqual(data['filtered']['expense_breakdown'], {'Manpower': 3500, 'Material': 4000})
+        self.assertEqual(data['filtered']['payment_breakdown'], {'Advance': 50000, 'Installment': 20000, 'Full': 0})
+        self.assertEqual(data['filtered']['monthly_trend']['expenses'], [
+            {'date': '2025-01', 'amount': 2000},
+            {'date': '2025-02', 'amount': 0},
+            {'date': '2025-03', 'amount': 5500},
+        ])
+        self.assertEqual(data['filtered']['monthly_trend']['payments'], [
+            {'date': '2025-01', 'amount': 50000},
+            {'date': '2025-02', 'amount': 0},
+            {'date': '2025-03', 'amount': 20000},
+        ])
+
+    def test_query_count_is_constant_across_time_ranges(self):
+        counts = {}
+        for time_range in ['month', 'quarter', 'year']:
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.get_report(time_range)
+            self.assertEqual(response.status_code, 200)
+            counts[time_range] = len(ctx.captured_queries)
+        self.assertEqual(len(set(counts.values())), 1, counts)
+
+
+    def test_cached_report_is_served_until_data_changes(self):
+        self.assertEqual(self.get_report('year')['X-Cache'], 'MISS')
+        with self.assertNumQueries(1):
+            response = self.get_report('year')
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(response.json()['overall']['total_payments'], 80000)
+
+        Payment.objects.create(project=self.project, amount=Decimal('5000'), payment_date=date(2025, 3, 10), payment_type='Full')
+        response = self.get_report('year')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['overall']['total_payments'], 85000)
+
+        self.project.budget = Decimal('2000000')
+        self.project.save()
+        response = self.get_report('year')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['budget'], 2000000)
+
+    def test_cached_report_rolls_over_with_the_date(self):
+        self.get_report('month')
+        response = self.get_report('month', today=date(2025, 4, 1))
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['filtered']['total_expenses'], 0)
+
+    def test_concurrent_misses_compute_once(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return {'value': 1}
+
+        report_cache.reset_stats()
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(lambda _: report_cache.get_or_compute('report:test', compute), range(8)))
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(value == {'value': 1} for value, hit in results))
+        self.assertEqual([hit for value, hit in results].count(False), 1)
+
+        self.assertEqual(report_cache._locks, {})
+
+        self.assertEqual(self.client.get('/api/reports/cache-stats/').status_code, 403)
+        from django.contrib.auth.models import User
+        self.client.force_login(User.objects.create_user('admin', password='x', is_staff=True))
+        stats = self.client.get('/api/reports/cache-stats/').json()
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hits'], 7)
+
+    def test_key_lock_outlives_early_releases(self):
+        lock = report_cache._key_lock('report:test')
+        self.assertIs(report_cache._key_lock('report:test'), lock)
+        report_cache._release_key_lock('report:test')
+        # Still in use by the first caller, so a newcomer shares it
+        self.assertIs(report_cache._key_lock('report:test'), lock)
+        report_cache._release_key_lock('report:test')
+        report_cache._release_key_lock('report:test')
+        self.assertNotIn('report:test', report_cache._locks)
+
+    def test_unknown_time_range_is_rejected(self):
+        response = self.get_report('decade')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'time_range must be one of month, quarter, year'})
+
+
+class ProjectLedgerTests(TestCase):
+    def setUp(self):
+        self.project = create_project(budget=Decimal('100000'))
+        self.item = MaterialItem.objects.create(name='cement', display_name='Cement')
+        Payment.objects.create(project=self.project, amount=Decimal('10000'), payment_date=date(2025, 1, 10), payment_type='Advance')
+
+    def add_manpower(self, amount='1000'):
+        return ManpowerExpense.objects.create(
+            project=self.project, date=date(2025, 1, 12), number_of_people=1,
+            per_person_cost=Decimal(amount), total_amount=Decimal(amount),
+        )
+
+    def test_ledger_follows_writes(self):
+        manpower = self.add_manpower('1000')
+        material = MaterialExpense.objects.create(
+            project=self.project, item=self.item, date=date(2025, 1, 12),
+            per_unit_cost=Decimal('100'), quantity=Decimal('5'), total_amount=Decimal('500'),
+        )
+        manpower.per_person_cost = Decimal('1200')
+        manpower.save()
+        material.delete()
+
+        ledger = ProjectLedger.objects.get(project=self.project)
+        self.assertEqual(ledger.total_payments, Decimal('10000'))
+        self.assertEqual(ledger.total_manpower, Decimal('1200'))
+        self.assertEqual(ledger.total_material, Decimal('0'))
+        self.assertEqual((ledger.manpower_count, ledger.material_count), (1, 0))
+        self.assertEqual(ledger.available_funds, Decimal('8800'))
+
+    def test_editing_a_payment_keeps_project_totals_in_step(self):
+        payment = Payment.objects.get(project=self.project)
+        payment.amount = Decimal('12000')
+        payment.save()
+        other = create_project(budget=Decimal('100000'))
+        moved = Payment.objects.create(project=self.project, amount=Decimal('500'), payment_date=date(2025, 1, 11), payment_type='Installment')
+        moved.project = other
+        moved.save()
+
+        for project, paid in ((self.project, Decimal('12000')), (other, Decimal('500'))):
+            project.refresh_from_db()
+            self.assertEqual((project.total_paid, project.remaining_amount), (paid, Decimal('100000') - paid))
+            self.assertEqual(ProjectLedger.objects.get(project=project).total_payments, paid)
+
+    def test_queryset_deletes_update_the_ledger(self):
+        for _ in range(3):
+            self.add_manpower('1000')
+        Payment.objects.create(project=self.project, amount=Decimal('500'), payment_date=date(2025, 1, 11), payment_type='Installment')
+        ManpowerExpense.objects.filter(pk__in=ManpowerExpense.objects.values('pk')[:2]).delete()
+        Payment.objects.filter(amount=Decimal('500')).delete()
+
+        self.project.refresh_from_db()
+        ledger = ProjectLedger.objects.get(project=self.project)
+        self.assertEqual((ledger.total_manpower, ledger.manpower_count), (Decimal('1000'), 1))
+        self.assertEqual(ledger.total_payments, Decimal('10000'))
+        self.assertEqual(self.project.total_paid, Decimal('10000'))
+
+    def test_expense_create_uses_ledger_for_funds_check(self):
+        self.add_manpower('9500')
+        response = self.client.post('/api/expenses/', {
+            'type': 'manpower', 'project': self.project.id, 'date': '2025-01-13',
+            'number_of_people': 1, 'per_person_cost': '600', 'total_amount': '600',
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(ManpowerExpense.objects.count(), 1)
+
+    def test_rebuild_ledger_fixes_drift(self):
+        self.add_manpower('1000')
+        ProjectLedger.objects.filter(project=self.project).update(total_manpower=Decimal('1'), manpower_count=7)
+        out = StringIO()
+        call_command('rebuild_ledger', stdout=out)
+        self.assertIn('Fixed 1 drifted', out.getvalue())
+        ledger = ProjectLedger.objects.get(project=self.project)
+        self.assertEqual((ledger.total_manpower, ledger.manpower_count), (Decimal('1000'), 1))
+
+
+class ConcurrencyTestMixin:
+    workers = 16
+
+    def run_concurrently(self, jobs):
+        def run(job):
+            try:
+                return job()
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return list(executor.map(run, jobs))
+
+
+@skipUnlessDBFeature('test_db_allows_multiple_connections')
+class FundReservationStressTests(ConcurrencyTestMixin, TransactionTestCase):
+
+    def test_concurrent_expenses_never_overspend(self):
+        projects = [create_project(budget=Decimal('100000')) for _ in range(2)]
+        for project in projects:
+            Payment.objects.create(project=project, amount=Decimal('10000'), payment_date=date(2025, 1, 10), payment_type='Advance')
+
+        def post_expense(project):
+            return lambda: Client().post('/api/expenses/', {
+                'type': 'manpower', 'project': project.id, 'date': '2025-01-12',
+                'number_of_people': 1, 'per_person_cost': '100', 'total_amount': '100',
+            }).status_code
+
+        # 150 attempts of 100 against 10000 paid per project: exactly 100 may succeed
+        statuses = self.run_concurrently([post_expense(project) for project in projects for _ in range(150)])
+        self.assertEqual(statuses.count(201), 200)
+        self.assertEqual(statuses.count(400), 100)
+        for project in projects:
+            ledger = ProjectLedger.objects.get(project=project)
+            spent = ManpowerExpense.objects.filter(project=project).aggregate(total=Sum('total_amount'))['total']
+            self.assertEqual(spent, Decimal('10000'))
+            self.assertEqual(ledger.total_manpower, Decimal('10000'))
+            self.assertEqual(ledger.manpower_count, 100)
+
+    def test_concurrent_payments_do_not_lose_updates(self):
+        project = create_project(budget=Decimal('1000000'))
+
+        def post_payment():
+            return Client().post('/api/payments/', {
+                'project': project.id, 'amount': '1000', 'payment_date': '2025-01-10', 'payment_type': 'Installment',
+            }).status_code
+
+        statuses = self.run_concurrently([post_payment] * 200)
+        self.assertEqual(statuses.count(201), 200)
+        project.refresh_from_db()
+        self.assertEqual(project.total_paid, Decimal('200000'))
+        self.assertEqual(project.remaining_amount, Decimal('800000'))
+        self.assertEqual(ProjectLedger.objects.get(project=project).total_payments, Decimal('200000'))
+
+    def test_concurrent_payments_and_expenses_on_one_project(self):
+        project = create_project(budget=Decimal('1000000'))
+        Payment.objects.create(project=project, amount=Decimal('5000'), payment_date=date(2025, 1, 10), payment_type='Advance')
+
+        def post_payment():
+            return Client().post('/api/payments/', {
+                'project': project.id, 'amount': '100', 'payment_date': '2025-01-10', 'payment_type': 'Installment',
+            }).status_code
+
+        def post_expense():
+            return Client().post('/api/expenses/', {
+                'type': 'manpower', 'project': project.id, 'date': '2025-01-12',
+                'number_of_people': 1, 'per_person_cost': '50', 'total_amount': '50',
+            }).status_code
+
+        # Both write paths lock the ledger row first, so none of these deadlock
+        statuses = self.run_concurrently([post_payment, post_expense] * 100)
+        self.assertEqual(statuses.count(201), 200)
+        project.refresh_from_db()
+        ledger = ProjectLedger.objects.get(project=project)
+        self.assertEqual(project.total_paid, Decimal('15000'))
+        self.assertEqual(ledger.total_payments, project.total_paid)
+        self.assertEqual((ledger.total_manpower, ledger.manpower_count), (Decimal('5000'), 100))
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.project = create_project()
+        Payment.objects.create(project=self.project, amount=Decimal('100000'), payment_date=date(2025, 1, 1), payment_type='Advance')
+        for day in range(1, 6):
+            for _ in range(5):
+                ManpowerExpense.objects.create(
+                    project=self.project, date=date(2025, 2, day), number_of_people=1,
+                    per_person_cost=Decimal('10'), total_amount=Decimal('10'),
+                )
+
+    def test_pages_follow_ordering_without_gaps(self):
+        expected = list(
+            ManpowerExpense.objects.order_by('-date', '-created_at', 'id').values_list('id', flat=True)
+        )
+        seen = []
+        url = '/api/expenses/?type=manpower&page_size=4'
+        while url:
+            data = self.client.get(url).json()
+            seen.extend(row['id'] for row in data['results'])
+            last = data
+            url = data['next']
+        self.assertEqual(seen, expected)
+
+        previous = self.client.get(last['previous']).json()
+        self.assertEqual([row['id'] for row in previous['results']], expected[-5:-1])
+
+    def test_all_rows_opt_in_and_invalid_cursor(self):
+        response = self.client.get('/api/expenses/?type=manpower&all=true')
+        self.assertEqual(len(response.json()), 25)
+        self.assertEqual(len(self.client.get('/api/payments/?all=true').json()), 1)
+        self.assertEqual(self.client.get('/api/projects/?cursor=bogus').status_code, 404)
+
+
+@override_settings(REFERENCE_DATA_VERSION_TTL=3600)
+class ExpenseFeedTests(TestCase):
+    def setUp(self):
+        self.project = create_project()
+        self.other = create_project(name='Other Project')
+        self.work_type = LaborWorkType.objects.create(name='electric')
+        self.item = MaterialItem.objects.create(name='cement', display_name='Cement')
+        for project in (self.project, self.other):
+            Payment.objects.create(project=project, amount=Decimal('100000'), payment_date=date(2025, 1, 1), payment_type='Advance')
+        for day in range(1, 6):
+            ManpowerExpense.objects.create(
+                project=self.project, work_type=self.work_type, date=date(2025, 2, day), number_of_people=2,
+                per_person_cost=Decimal('10'), total_amount=Decimal('20'), description=f'wiring {day}',
+            )
+            MaterialExpense.objects.create(
+                project=self.project, item=self.item, date=date(2025, 2, day),
+                per_unit_cost=Decimal('5'), quantity=Decimal('3'), total_amount=Decimal('15'),
+            )
+        MaterialExpense.objects.create(
+            project=self.other, item=self.item, date=date(2025, 2, 3),
+            per_unit_cost=Decimal('5'), quantity=Decimal('1'), total_amount=Decimal('5'),
+        )
+
+    def expected(self, **filters):
+        rows = [
+            (expense.date, expense.created_at, 'manpower', expense.id)
+            for expense in ManpowerExpense.objects.filter(**filters)
+        ] + [
+            (expense.date, expense.created_at, 'material', expense.id)
+            for expense in MaterialExpense.objects.filter(**filters)
+        ]
+        # -date, -created_at, type, id
+        rows.sort(key=lambda row: (row[2], row[3]))
+        rows.sort(key=lambda row: (row[0], row[1]), reverse=True)
+        return [(row[2], row[3]) for row in rows]
+
+    def test_pages_interleave_both_types(self):
+        seen = []
+        url = f'/api/expenses/?type=all&project_id={self.project.id}&page_size=3'
+        while url:
+            with CaptureQueriesContext(connection) as ctx:
+                data = self.client.get(url).json()
+            self.assertEqual(sum('UNION ALL' in query['sql'] for query in ctx.captured_queries), 1)
+            self.assertFalse(any('COUNT(' in query['sql'] for query in ctx.captured_queries))
+            seen.extend((row['type'], row['id']) for row in data['results'])
+            url = data['next']
+        self.assertEqual(seen, self.expected(project=self.project))
+
+        rows = self.client.get('/api/expenses/?type=all&all=true').json()
+        self.assertEqual([(row['type'], row['id']) for row in rows], self.expected())
+        manpower = next(row for row in rows if row['type'] == 'manpower')
+        self.assertEqual(manpower['work_type_display'], 'Electric')
+        self.assertEqual(manpower['number_of_people'], 2)
+        self.assertIsNone(manpower['item'])
+        material = next(row for row in rows if row['type'] == 'material')
+        self.assertEqual(material['item_display'], 'Cement')
+        self.assertEqual(material['quantity'], '3.00')
+        self.assertIsNone(material['work_type'])
+
+    def test_filters_apply_to_both_types(self):
+        rows = self.client.get('/api/expenses/?type=all&all=true&start_date=2025-02-02&end_date=2025-02-03').json()
+        self.assertEqual(len(rows), 5)
+        rows = self.client.get('/api/expenses/?type=all&all=true&search=wiring 4').json()
+        self.assertEqual([row['type'] for row in rows], ['manpower'])
+
+    def test_details_and_delete_use_type_routing(self):
+        row = self.client.get('/api/expenses/?type=all&page_size=1').json()['results'][0]
+        response = self.client.get(f"/api/expenses/{row['id']}/?type={row['type']}")
+        self.assertEqual(response.json()['id'], row['id'])
+        response = self.client.delete(f"/api/expenses/{row['id']}/?type={row['type']}")
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(len(self.client.get('/api/expenses/?type=all&all=true').json()), 10)
+
+
+class ExpenseSearchTests(TransactionTestCase):
+    # SQLite cannot reliably roll back the creation of FTS5 tables, so the
+    # index is created and dropped for real around each test
+    def setUp(self):
+        self.project = create_project()
+        Payment.objects.create(project=self.project, amount=Decimal('100000'), payment_date=date(2025, 1, 1), payment_type='Advance')
+        self.cement = MaterialItem.objects.create(name='cement', display_name='Cement')
+        self.others = MaterialItem.objects.create(name='others', display_name='Others')
+        self.wiring = self.add_manpower('Kitchen wiring, second floor', date(2025, 2, 1))
+        self.plaster = self.add_manpower('Plastering the kitchen walls', date(2025, 2, 2))
+        self.add_manpower('Terrace waterproofing', date(2025, 2, 3))
+        self.bags = MaterialExpense.objects.create(
+            project=self.project, item=self.cement, date=date(2025, 2, 4),
+            per_unit_cost=Decimal('400'), quantity=Decimal('10'), total_amount=Decimal('4000'),
+        )
+        self.marble = MaterialExpense.objects.create(
+            project=self.project, item=self.others, custom_item_name='Italian marble', date=date(2025, 2, 5),
+            per_unit_cost=Decimal('100'), quantity=Decimal('10'), total_amount=Decimal('1000'),
+        )
+        expense_search.install()
+        self.addCleanup(expense_search.uninstall)
+
+    def add_manpower(self, description, day):
+        return ManpowerExpense.objects.create(
+            project=self.project, date=day, number_of_people=1, per_person_cost=Decimal('100'),
+            total_amount=Decimal('100'), description=description,
+        )
+
+    def search(self, expense_type, text, **params):
+        params.update({'type': expense_type, 'search': text, 'all': 'true'})
+        return [row['id'] for row in self.client.get('/api/expenses/', params).json()]
+
+    def test_prefix_search_uses_the_index(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.search('manpower', 'kitch'), [self.plaster.id, self.wiring.id])
+        self.assertTrue(any('_fts' in query['sql'] for query in ctx.captured_queries))
+        self.assertFalse(any('LIKE' in query['sql'] for query in ctx.captured_queries))
+        self.assertEqual(self.search('manpower', 'kitchen wir'), [self.wiring.id])
+        self.assertEqual(self.search('material', 'cem'), [self.bags.id])
+        self.assertEqual(self.search('material', 'marble'), [self.marble.id])
+
+    def test_index_follows_writes(self):
+        self.wiring.description = 'Bathroom wiring'
+        self.wiring.save()
+        self.assertEqual(self.search('manpower', 'kitchen'), [self.plaster.id])
+        ManpowerExpense.objects.bulk_create([ManpowerExpense(
+            project=self.project, date=date(2025, 2, 6), number_of_people=1, per_person_cost=Decimal('1'),
+            total_amount=Decimal('1'), description='Kitchen chimney',
+        )])
+        self.assertEqual(len(self.search('manpower', 'kitchen')), 2)
+        self.plaster.delete()
+        self.assertEqual(len(self.search('manpower', 'kitchen')), 1)
+        self.cement.display_name = 'Portland cement'
+        self.cement.save()
+        self.assertEqual(self.search('material', 'portland'), [self.bags.id])
+
+    def test_relevance_ordering(self):
+        best = self.add_manpower('Kitchen kitchen kitchen', date(2025, 1, 1))
+        rows = self.client.get('/api/expenses/', {
+            'type': 'manpower', 'search': 'kitchen', 'ordering': 'relevance', 'page_size': 1,
+        }).json()
+        self.assertEqual([row['id'] for row in rows['results']], [best.id])
+        rows = self.client.get(rows['next']).json()
+        self.assertEqual(len(rows['results']), 1)
+        self.assertNotEqual(rows['results'][0]['id'], best.id)
+
+    def test_relevance_ordered_export(self):
+        for day in range(1, 6):
+            self.add_manpower('Kitchen ' * day, date(2025, 1, day))
+        response = self.client.get('/api/expenses/export/', {
+            'type': 'manpower', 'search': 'kitchen', 'ordering': 'relevance', 'chunk_size': 2, 'output': 'ndjson',
+        })
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(len(rows), 7)
+        self.assertEqual(len({row['id'] for row in rows}), 7)
+        self.assertEqual(rows[0]['description'], 'Kitchen ' * 5)
+        self.assertNotIn('search_rank', rows[0])
+
+    def test_matches_word_prefixes_not_substrings(self):
+        self.assertEqual(self.search('manpower', 'itchen'), [])
+        self.assertEqual(self.search('manpower', 'wiring kit'), [self.wiring.id])
+        self.assertEqual(self.search('material', 'arble'), [])
+
+    def test_short_terms_fall_back_to_icontains(self):
+        # As on MySQL, which does not index words under 3 characters
+        with mock.patch.object(expense_search.index, 'min_term_length', 3):
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(self.search('manpower', 'wi'), [self.wiring.id])
+            self.assertFalse(any('MATCH' in query['sql'] for query in ctx.captured_queries))
+            self.assertEqual(self.search('manpower', 'itchen'), [])
+
+    def test_falls_back_to_icontains_without_index(self):
+        expense_search.uninstall()
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.search('manpower', 'itchen wir'), [self.wiring.id])
+        self.assertFalse(any('MATCH' in query['sql'] for query in ctx.captured_queries))
+        with self.settings(EXPENSE_SEARCH_BACKEND='icontains'):
+            self.assertEqual(self.search('material', 'ortland') + self.search('material', 'Cem'), [self.bags.id])
+
+
+class EndpointQueryCountTests(QueryCountTestMixin, TestCase):
+    def setUp(self):
+        self.project = create_project()
+        self.work_type = LaborWorkType.objects.create(name='construction')
+        self.item = MaterialItem.objects.create(name='cement', display_name='Cement')
+        reference_data.snapshot()
+
+    def seed_manpower(self, count):
+        ManpowerExpense.objects.bulk_create(
+            ManpowerExpense(
+                project=self.project, work_type=self.work_type, date=date(2025, 1, 1),
+                number_of_people=1, per_person_cost=Decimal('1'), total_amount=Decimal('1'),
+            ) for _ in range(count)
+        )
+
+    def seed_material(self, count):
+        MaterialExpense.objects.bulk_create(
+            MaterialExpense(
+                project=self.project, item=self.item, date=date(2025, 1, 1),
+                per_unit_cost=Decimal('1'), quantity=Decimal('1'), total_amount=Decimal('1'),
+            ) for _ in range(count)
+        )
+
+    def seed_payments(self, count):
+        Payment.objects.bulk_create(
+            Payment(project=self.project, amount=Decimal('1'), payment_date=date(2025, 1, 1), payment_type='Advance')
+            for _ in range(count)
+        )
+
+    def test_manpower_expense_list(self):
+        self.assertQueryCountConstant('/api/expenses/?type=manpower&all=true', self.seed_manpower)
+
+    def test_material_expense_list(self):
+        self.assertQueryCountConstant(
+            f'/api/expenses/?type=material&project_id={self.project.id}&all=true', self.seed_material
+        )
+
+    def test_payment_list(self):
+        self.assertQueryCountConstant('/api/payments/?all=true', self.seed_payments)
+
+    def test_paginated_payment_list(self):
+        self.assertQueryCountConstant(f'/api/payments/?project_id={self.project.id}', self.seed_payments)
+
+
+class BulkExpenseImportTests(TestCase):
+    def setUp(self):
+        self.project = create_project(budget=Decimal('100000'))
+        self.other_project = create_project(budget=Decimal('100000'))
+        self.work_type = LaborWorkType.objects.create(name='construction')
+        self.item = MaterialItem.objects.create(name='cement', display_name='Cement')
+        self.others = MaterialItem.objects.create(name='others', display_name='Others')
+        for project in (self.project, self.other_project):
+            Payment.objects.create(project=project, amount=Decimal('5000'), payment_date=date(2025, 1, 1), payment_type='Advance')
+
+    def rows(self, project=None):
+        project = project or self.project
+        return [
+            {'type': 'manpower', 'project': project.id, 'date': '2025-01-02', 'work_type': self.work_type.id,
+             'number_of_people': 3, 'per_person_cost': '500'},
+            {'type': 'material', 'project': project.id, 'date': '2025-01-02', 'item': self.item.id,
+             'per_unit_cost': '250.50', 'quantity': '2'},
+        ]
+
+    def post(self, rows, mode='atomic'):
+        return self.client.post(f'/api/expenses/bulk/?mode={mode}', rows, content_type='application/json')
+
+    def test_mixed_rows_for_several_projects(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.post(self.rows() + self.rows(self.other_project))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(), {'created': 4, 'errors': []})
+        small_batch_queries = len(ctx.captured_queries)
+
+        ledger = ProjectLedger.objects.get(project=self.project)
+        self.assertEqual((ledger.total_manpower, ledger.total_material), (Decimal('1500'), Decimal('501')))
+        self.assertEqual((ledger.manpower_count, ledger.material_count), (1, 1))
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.post(self.rows() * 2 + self.rows(self.other_project) * 2)
+        self.assertEqual(len(ctx.captured_queries), small_batch_queries)
+
+    def test_atomic_mode_rejects_whole_batch(self):
+        rows = self.rows() + [
+            {'type': 'material', 'project': self.project.id, 'item': self.others.id, 'per_unit_cost': '1', 'quantity': '1'},
+            {'type': 'manpower', 'project': 999, 'number_of_people': 0, 'per_person_cost': '1'},
+        ]
+        response = self.post(rows)
+        self.assertEqual(response.status_code, 400)
+        errors = response.json()['errors']
+        self.assertEqual([error['row'] for error in errors], [3, 4])
+        self.assertIn('custom_item_name', errors[0]['errors'])
+        self.assertEqual(set(errors[1]['errors']), {'project', 'number_of_people'})
+        self.assertEqual(ManpowerExpense.objects.count() + MaterialExpense.objects.count(), 0)
+
+    def test_rows_past_column_limits_are_reported(self):
+        rows = [
+            {'type': 'material', 'project': self.project.id, 'item': self.others.id, 'custom_item_name': 'x' * 101,
+             'per_unit_cost': '1', 'quantity': '1'},
+            {'type': 'manpower', 'project': self.project.id, 'number_of_people': 2 ** 31, 'per_person_cost': '1'},
+            {'type': 'material', 'project': self.project.id, 'item': self.item.id,
+             'per_unit_cost': '9999999999999', 'quantity': '9999999999999'},
+        ]
+        response = self.post(self.rows() + rows, mode='best_effort')
+        self.assertEqual(response.status_code, 201)
+        data = response.json()
+        self.assertEqual(data['created'], 2)
+        self.assertEqual([list(error['errors']) for error in data['errors']],
+                         [['custom_item_name'], ['number_of_people'], ['total_amount']])
+
+    def test_malformed_rows_are_reported(self):
+        retired = MaterialItem.objects.create(name='lime', display_name='Lime', is_active=False)
+        manpower = {'type': 'manpower', 'project': self.project.id, 'per_person_cost': '1'}
+        rows = [
+            {**manpower, 'number_of_people': 2.7},
+            {**manpower, 'number_of_people': '2.7'},
+            {**manpower, 'number_of_people': True},
+            {**manpower, 'number_of_people': 2, 'description': ['Masons']},
+            {'type': 'material', 'project': self.project.id, 'item': retired.id, 'per_unit_cost': '1', 'quantity': '1'},
+            {**manpower, 'number_of_people': 2.0},
+        ]
+        data = self.post(rows, mode='best_effort').json()
+        self.assertEqual(data['created'], 1)
+        self.assertEqual([error['errors'] for error in data['errors']], [
+            {'number_of_people': 'Number of people must be a whole number greater than 0'},
+            {'number_of_people': 'Number of people must be a whole number greater than 0'},
+            {'number_of_people': 'Number of people must be a whole number greater than 0'},
+            {'description': 'Description must be text'},
+            {'item': 'Invalid material item'},
+        ])
+        self.assertEqual(ManpowerExpense.objects.get().number_of_people, 2)
+
+    def test_best_effort_skips_failing_rows_and_projects(self):
+        overspend = {'type': 'manpower', 'project': self.other_project.id, 'number_of_people': 10, 'per_person_cost': '600'}
+        rows = self.rows() + [{'type': 'unknown'}, overspend]
+        response = self.post(rows, mode='best_effort')
+        self.assertEqual(response.status_code, 201)
+        data = response.json()
+        self.assertEqual(data['created'], 2)
+        self.assertEqual([error['row'] for error in data['errors']], [3, 4])
+        self.assertIn('not sufficient', data['errors'][1]['errors']['total_amount'])
+        self.assertFalse(ManpowerExpense.objects.filter(project=self.other_project).exists())
+
+    def test_csv_upload(self):
+        csv_file = StringIO(
+            'type,project,date,work_type,number_of_people,per_person_cost,item,custom_item_name,per_unit_cost,quantity,description\n'
+            f'manpower,{self.project.id},2025-01-03,,2,100,,,,,Masons\n'
+            f'material,{self.project.id},2025-01-03,,,,{self.others.id},Gravel,10,5,\n'
+        )
+        csv_file.name = 'expenses.csv'
+        response = self.client.post('/api/expenses/bulk/', {'file': csv_file})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(MaterialExpense.objects.get().custom_item_name, 'Gravel')
+        self.assertEqual(ManpowerExpense.objects.get().description, 'Masons')
+
+
+class StreamingExportTests(TestCase):
+    def setUp(self):
+        self.project = create_project()
+        self.item = MaterialItem.objects.create(name='cement', display_name='Cement')
+
+    def seed(self, count):
+        MaterialExpense.objects.bulk_create(
+            MaterialExpense(
+                project=self.project, item=self.item, date=date(2025, 1, 1 + n % 28), description='x' * 40,
+                per_unit_cost=Decimal('2'), quantity=Decimal('3'), total_amount=Decimal('6'),
+            ) for n in range(count)
+        )
+
+    def test_csv_cells_cannot_start_formulas(self):
+        MaterialExpense.objects.bulk_create(
+            MaterialExpense(
+                project=self.project, item=self.item, date=date(2025, 1, 1), description=description,
+                per_unit_cost=Decimal('2'), quantity=Decimal('3'), total_amount=Decimal('-6'),
+            ) for description in ['=HYPERLINK("http://x")', '+1', '-2+3', '@SUM(A1)']
+        )
+        response = self.client.get('/api/expenses/export/?type=material')
+        rows = list(csv.DictReader(StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(
+            sorted(row['description'] for row in rows),
+            sorted(["'=HYPERLINK(\"http://x\")", "'+1", "'-2+3", "'@SUM(A1)"]),
+        )
+        # Numbers are not text and keep their sign
+        self.assertTrue(all(row['total_amount'].startswith('-6') for row in rows))
+
+        response = self.client.get('/api/expenses/export/?type=material&output=ndjson')
+        # NDJSON is not opened in spreadsheets and keeps the text as entered
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertIn('@SUM(A1)', [row['description'] for row in rows])
+
+    def export_peak_memory(self, url):
+        tracemalloc.start()
+        try:
+            response = self.client.get(url)
+            lines = sum(chunk.count(b'\n') for chunk in response.streaming_content)
+            return lines, tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    def test_csv_export_honours_filters(self):
+        self.seed(30)
+        response = self.client.get(
+            f'/api/expenses/export/?type=material&project_id={self.project.id}&start_date=2025-01-01&end_date=2025-01-02&chunk_size=7'
+        )
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertTrue(lines[0].startswith('id,project_id,date'))
+        self.assertEqual(len(lines), 1 + 4)
+
+    def test_ndjson_payment_export(self):
+        Payment.objects.create(project=self.project, amount=Decimal('10'), payment_date=date(2025, 1, 1), payment_type='Full')
+        response = self.client.get('/api/payments/export/?output=ndjson')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(rows[0]['project_name'], 'Test Project')
+        self.assertEqual(rows[0]['amount'], '10.00')
+
+    def test_memory_stays_flat_as_export_grows(self):
+        url = '/api/expenses/export/?type=material&chunk_size=500'
+        self.seed(2000)
+        small_lines, small_peak = self.export_peak_memory(url)
+        self.seed(18000)
+        large_lines, large_peak = self.export_peak_memory(url)
+        self.assertEqual((small_lines, large_lines), (2001, 20001))
+        # Ten times the rows must not cost anywhere near ten times the memory
+        self.assertLess(large_peak, small_peak * 2)
+
+
+class QueryPlanCommandTests(TestCase):
+    def test_endpoints_use_indexes(self):
+        project = create_project()
+        Payment.objects.create(project=project, amount=Decimal('5000'), payment_date=date(2025, 1, 1), payment_type='Advance')
+        ManpowerExpense.objects.create(
+            project=project, date=date(2025, 1, 2), number_of_people=1,
+            per_person_cost=Decimal('10'), total_amount=Decimal('10'),
+        )
+        out = StringIO()
+        call_command('check_query_plans', stdout=out)
+        self.assertNotIn('FULL SCAN', out.getvalue())
+
+
+class ProjectIdAllocatorTests(TestCase):
+    def setUp(self):
+        project_id_allocator.reset()
+        # Migration 0013 seeds the sequence row; each test sets it up itself
+        IdSequence.objects.filter(name=PROJECT_ID_SEQUENCE).delete()
+
+    def test_ids_follow_highest_existing_number(self):
+        # Without a sequence row the allocator starts after the highest id
+        create_project(project_id='ID-0041')
+        create_project(project_id='ID-ABCD')
+        self.assertEqual(create_project().project_id, 'ID-0042')
+        self.assertEqual(create_project().project_id, 'ID-0043')
+        self.assertEqual(IdSequence.objects.get(name='project_id').last_value, 43)
+
+    def test_manually_taken_ids_are_skipped(self):
+        create_project()
+        create_project(project_id='ID-0002')
+        self.assertEqual(create_project().project_id, 'ID-0003')
+
+    def test_seeded_sequence_skips_higher_manual_id(self):
+        IdSequence.objects.update_or_create(name=PROJECT_ID_SEQUENCE, defaults={'last_value': 5})
+        create_project(project_id='ID-0006')
+        create_project(project_id='ID-0042')
+        self.assertEqual(create_project().project_id, 'ID-0007')
+        self.assertEqual(IdSequence.objects.get(name=PROJECT_ID_SEQUENCE).last_value, 7)
+
+    def test_numbers_past_width_keep_counting(self):
+        IdSequence.objects.update_or_create(name=PROJECT_ID_SEQUENCE, defaults={'last_value': 9999})
+        self.assertEqual(create_project().project_id, 'ID-10000')
+        with self.settings(PROJECT_ID_WIDTH=6):
+            self.assertEqual(create_project().project_id, 'ID-010001')
+
+    def test_ids_longer_than_the_column_are_refused(self):
+        self.assertEqual(format_project_id(9999999), 'ID-9999999')
+        with self.assertRaisesMessage(ValueError, 'longer than 10 characters'):
+            format_project_id(10000000)
+        with self.settings(PROJECT_ID_WIDTH=8), self.assertRaises(ValueError):
+            format_project_id(1)
+        IdSequence.objects.update_or_create(name=PROJECT_ID_SEQUENCE, defaults={'last_value': 9999999})
+        with self.assertRaises(ValueError):
+            create_project()
+        self.assertFalse(Project.objects.filter(project_id__startswith='ID-1000').exists())
+
+    def test_block_reservation(self):
+        self.assertEqual(project_id_allocator.next_value(block_size=1), 1)
+        # Inside the test transaction blocks are not cached
+        self.assertEqual(project_id_allocator.next_value(block_size=50), 2)
+        self.assertEqual(IdSequence.objects.get(name='project_id').last_value, 2)
+
+
+@skipUnlessDBFeature('test_db_allows_multiple_connections')
+class ProjectIdAllocatorConcurrencyTests(ConcurrencyTestMixin, TransactionTestCase):
+    def setUp(self):
+        project_id_allocator.reset()
+
+    def test_parallel_creates_get_unique_ids(self):
+        self.run_concurrently([create_project] * 100)
+        ids = set(Project.objects.values_list('project_id', flat=True))
+        self.assertEqual(ids, {f'ID-{n:04d}' for n in range(1, 101)})
+
+    def test_blocks_per_worker_stay_unique(self):
+        values = self.run_concurrently([lambda: project_id_allocator.next_value(block_size=10)] * 200)
+        self.assertEqual(len(set(values)), 200)
+        self.assertEqual(IdSequence.objects.get(name='project_id').last_value % 10, 0)
+
+
+class ReferenceDataCacheTests(TestCase):
+    def setUp(self):
+        reference_data.clear()
+        self.item = MaterialItem.objects.create(name='cement', display_name='Cement')
+        self.work_type = LaborWorkType.objects.create(name='electric')
+
+    def test_lookups_are_served_from_memory(self):
+        reference_data.snapshot()
+        with self.assertNumQueries(0):
+            self.assertEqual(reference_data.get_material_item(self.item.id), self.item)
+            self.assertEqual(reference_data.get_material_item_by_name('cement'), self.item)
+            self.assertEqual(reference_data.get_work_type(self.work_type.id), self.work_type)
+            self.assertEqual(reference_data.get_work_type_by_name('electric'), self.work_type)
+
+    def test_writes_invalidate_the_cache(self):
+        version = reference_data.snapshot().version
+        self.item.display_name = 'Cement bags'
+        self.item.save()
+        snapshot = reference_data.snapshot()
+        self.assertGreater(snapshot.version, version)
+        self.assertEqual(snapshot.material_items[self.item.id].display_name, 'Cement bags')
+
+    def test_list_endpoints_answer_not_modified(self):
+        response = self.client.get('/api/material-items/')
+        self.assertEqual(response.json()[0]['name'], 'cement')
+        etag = response['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/material-items/', HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            response = self.client.get('/api/labor-work-types/', HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+
+        MaterialItem.objects.create(name='sand', display_name='Sand')
+        response = self.client.get('/api/material-items/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 2)
+
+    def test_background_warmup_closes_its_connection(self):
+        with mock.patch('construction.reference_data.connection') as thread_connection, \
+                mock.patch.object(reference_data, 'warm') as warm:
+            warm_on_startup()
+            for thread in threading.enumerate():
+                if thread.name == 'reference-data-warmup':
+                    thread.join(5)
+            with self.settings(REFERENCE_DATA_WARM_ON_STARTUP=False):
+                warm_on_startup()
+        warm.assert_called_once()
+        thread_connection.close.assert_called_once()
+
+
+class PortfolioSummaryTests(QueryCountTestMixin, TestCase):
+    def setUp(self):
+        self.first = create_project(budget=Decimal('100000'))
+        self.second = create_project(name='Second Project', budget=Decimal('50000'), status='On Hold')
+        create_project(name='Empty Project', budget=Decimal('10000'), status='Completed')
+        item = MaterialItem.objects.create(name='cement', display_name='Cement')
+        Payment.objects.create(project=self.first, amount=Decimal('30000'), payment_date=date(2025, 1, 10), payment_type='Advance')
+        Payment.objects.create(project=self.second, amount=Decimal('8000'), payment_date=date(2025, 1, 10), payment_type='Advance')
+        ManpowerExpense.objects.create(
+            project=self.first, date=date(2025, 1, 12), number_of_people=2,
+            per_person_cost=Decimal('1000'), total_amount=Decimal('2000'),
+        )
+        MaterialExpense.objects.create(
+            project=self.second, item=item, date=date(2025, 1, 12),
+            per_unit_cost=Decimal('1000'), quantity=Decimal('6'), total_amount=Decimal('6000'),
+        )
+
+    def test_summary_totals(self):
+        data = self.client.get('/api/portfolio/summary/').json()
+        self.assertEqual(data['project_count'], 3)
+        self.assertEqual(data['status_counts'], {'Active': 1, 'Completed': 1, 'On Hold': 1, 'Cancelled': 0})
+        totals = data['totals']
+        self.assertEqual(totals['budget'], '160000.00')
+        self.assertEqual(totals['paid'], '38000.00')
+        self.assertEqual(totals['spent'], {'manpower': '2000.00', 'material': '6000.00', 'total': '8000.00'})
+        self.assertEqual(totals['available_funds'], '30000.00')
+        self.assertEqual(totals['budget_utilization'], 5.0)
+        self.assertEqual(totals['expense_counts'], {'manpower': 1, 'material': 1})
+
+        rows = {row['id']: row for row in data['projects']}
+        self.assertEqual(rows[self.first.id]['spent'], '2000.00')
+        self.assertEqual(rows[self.first.id]['available_funds'], '28000.00')
+        self.assertEqual(rows[self.second.id]['spent'], '6000.00')
+        self.assertEqual(rows[self.second.id]['available_funds'], '2000.00')
+        self.assertEqual(rows[self.second.id]['budget_utilization'], 12.0)
+
+    def test_amounts_are_exact_to_the_cent(self):
+        for _ in range(10):
+            Payment.objects.create(project=self.first, amount=Decimal('0.10'), payment_date=date(2025, 1, 11), payment_type='Advance')
+        Payment.objects.create(project=self.second, amount=Decimal('0.20'), payment_date=date(2025, 1, 11), payment_type='Advance')
+        data = self.client.get('/api/portfolio/summary/').json()
+        self.assertEqual(data['totals']['paid'], '38001.20')
+        self.assertEqual(data['totals']['due_payments'], '121998.80')
+        rows = {row['id']: row for row in data['projects']}
+        self.assertEqual(rows[self.first.id]['paid'], '30001.00')
+        self.assertEqual(rows[self.second.id]['due_payments'], '41999.80')
+
+    def test_query_count_is_constant(self):
+        def seed(count):
+            projects = Project.objects.bulk_create(
+                Project(project_id=f'ID-S{Project.objects.count()}X{n}', name=f'Seeded {n}', land_details='-',
+                        land_address='-', budget=Decimal('1000'))
+                for n in range(count)
+            )
+            ProjectLedger.objects.bulk_create(ProjectLedger(project=project) for project in projects)
+
+        self.assertQueryCountConstant('/api/portfolio/summary/', seed, sizes=(10, 5000))
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        caches['reports'].clear()
+        self.project = create_project()
+        self.other = create_project(name='Other Project')
+        Payment.objects.create(project=self.project, amount=Decimal('50000'), payment_date=date(2025, 1, 10), payment_type='Advance')
+        ManpowerExpense.objects.create(
+            project=self.project, date=date(2025, 1, 12), number_of_people=1,
+            per_person_cost=Decimal('1000'), total_amount=Decimal('1000'),
+        )
+
+    def assertNotModifiedWithoutSerializing(self, url, serializer_class):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        with mock.patch.object(serializer_class, 'to_representation') as to_representation:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        to_representation.assert_not_called()
+        return etag
+
+    def test_lists_answer_not_modified_without_serializing(self):
+        self.assertNotModifiedWithoutSerializing('/api/projects/', ProjectSerializer)
+        self.assertNotModifiedWithoutSerializing('/api/payments/', PaymentSerializer)
+        self.assertNotModifiedWithoutSerializing(f'/api/payments/?project_id={self.project.id}', PaymentSerializer)
+        self.assertNotModifiedWithoutSerializing(f'/api/projects/{self.project.id}/payments/', PaymentSerializer)
+        self.assertNotModifiedWithoutSerializing('/api/expenses/?type=manpower', ManpowerExpenseSerializer)
+
+    def test_report_answers_not_modified_without_computing(self):
+        url = f'/api/reports/{self.project.id}/?time_range=year'
+        etag = self.client.get(url)['ETag']
+        with mock.patch('construction.views.build_report_data') as build, self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        build.assert_not_called()
+
+    def test_writes_change_the_etag(self):
+        project_url = f'/api/payments/?project_id={self.project.id}'
+        other_url = f'/api/payments/?project_id={self.other.id}'
+        etags = {url: self.client.get(url)['ETag'] for url in ['/api/projects/', project_url, other_url]}
+        self.assertNotEqual(etags[project_url], etags[other_url])
+
+        Payment.objects.create(project=self.project, amount=Decimal('100'), payment_date=date(2025, 2, 1), payment_type='Installment')
+        for url, expected_status in [('/api/projects/', 200), (project_url, 200), (other_url, 304)]:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etags[url])
+            self.assertEqual(response.status_code, expected_status, url)
+
+        etag = self.client.get('/api/projects/')['ETag']
+        Project.objects.filter(pk=self.other.pk).delete()
+        self.assertEqual(self.client.get('/api/projects/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class AsyncReadViewTests(TransactionTestCase):
+    """
+    The async views answer like the sync ones. A TransactionTestCase because
+    the async report runs its queries on other connections.
+    """
+
+    def setUp(self):
+        caches['reports'].clear()
+        reference_data.clear()
+        self.factory = AsyncRequestFactory()
+        self.project = create_project()
+        self.work_type = LaborWorkType.objects.create(name='electric')
+        self.item = MaterialItem.objects.create(name='cement', display_name='Cement')
+        Payment.objects.create(project=self.project, amount=Decimal('50000'), payment_date=date(2025, 1, 10), payment_type='Advance')
+        for day in range(1, 6):
+            ManpowerExpense.objects.create(
+                project=self.project, work_type=self.work_type, date=date(2025, 2, day), number_of_people=2,
+                per_person_cost=Decimal('10'), total_amount=Decimal('20'), description=f'wiring {day}',
+            )
+            MaterialExpense.objects.create(
+                project=self.project, item=self.item, date=date(2025, 2, day),
+                per_unit_cost=Decimal('5'), quantity=Decimal('3'), total_amount=Decimal('15'),
+            )
+
+    def async_get(self, view, path, *args, **headers):
+        return async_to_sync(view)(self.factory.get(path, headers=headers), *args)
+
+    def assertSameResponse(self, view, path, *args):
+        response = self.async_get(view, path, *args)
+        expected = self.client.get(path)
+        self.assertEqual(response.status_code, expected.status_code, path)
+        self.assertEqual(json.loads(response.content), expected.json(), path)
+        return response
+
+    def test_lists_match_sync_views(self):
+        for path in [
+            '/api/projects/',
+            '/api/payments/',
+            f'/api/payments/?project_id={self.project.id}',
+        ]:
+            view = async_views.project_list if path.startswith('/api/projects/') else async_views.payment_list
+            self.assertSameResponse(view, path)
+        for path in [
+            '/api/expenses/?type=manpower&page_size=2',
+            '/api/expenses/?type=material&search=cement',
+            '/api/expenses/?type=all&page_size=3',
+            '/api/expenses/?type=all&all=true',
+        ]:
+            self.assertSameResponse(async_views.expense_list, path)
+
+        # Follow a cursor
+        next_link = self.client.get('/api/expenses/?type=all&page_size=3').json()['next']
+        self.assertSameResponse(async_views.expense_list, next_link.replace('http://testserver', ''))
+
+    def test_report_and_reference_data_match_sync_views(self):
+        path = f'/api/reports/{self.project.id}/?time_range=year'
+        with override_settings(REPORT_PARALLEL_QUERIES=True):
+            caches['reports'].clear()
+            self.assertEqual(self.assertSameResponse(async_views.report_data, path, self.project.id)['X-Cache'], 'MISS')
+        with override_settings(REPORT_PARALLEL_QUERIES=False):
+            caches['reports'].clear()
+            self.assertSameResponse(async_views.report_data, path, self.project.id)
+        self.assertEqual(self.async_get(async_views.report_data, path, self.project.id)['X-Cache'], 'HIT')
+        self.assertEqual(self.async_get(async_views.report_data, '/api/reports/0/', 0).status_code, 404)
+        self.assertSameResponse(async_views.report_data, f'/api/reports/{self.project.id}/?time_range=decade', self.project.id)
+
+        self.assertSameResponse(async_views.project_payments, f'/api/projects/{self.project.id}/payments/', self.project.id)
+        self.assertSameResponse(async_views.material_items_list, '/api/material-items/')
+        self.assertSameResponse(async_views.labor_work_type_list, '/api/labor-work-types/')
+
+    def test_access_checks_match_sync_views(self):
+        from django.contrib.auth.models import User
+        from rest_framework.authentication import SessionAuthentication
+        from rest_framework.permissions import IsAuthenticated
+        user = User.objects.create_user('clerk', password='x')
+        restricted = {'authentication_classes': [SessionAuthentication], 'permission_classes': [IsAuthenticated]}
+        routes = [
+            (async_views.payment_list, views.PaymentViewSet, '/api/payments/', ()),
+            (async_views.report_data, views.report_data.cls, f'/api/reports/{self.project.id}/', (self.project.id,)),
+            (async_views.labor_work_type_list, views.labor_work_type_list.cls, '/api/labor-work-types/', ()),
+        ]
+        for view, view_class, path, args in routes:
+            with mock.patch.multiple(view_class, **restricted):
+                for logged_in in (False, True):
+                    if logged_in:
+                        self.client.force_login(user)
+                    else:
+                        self.client.logout()
+                    request = self.factory.get(path)
+                    if logged_in:
+                        request.user = user
+                    response = async_to_sync(view)(request, *args)
+                    expected = self.client.get(path)
+                    self.assertEqual(response.status_code, expected.status_code, (path, logged_in))
+                    self.assertEqual(response.status_code, 200 if logged_in else 403, (path, logged_in))
+                    self.assertEqual(json.loads(response.content), expected.json(), (path, logged_in))
+
+    def test_conditional_get_and_writes(self):
+        response = self.async_get(async_views.project_list, '/api/projects/')
+        self.assertEqual(response['ETag'], self.client.get('/api/projects/')['ETag'])
+        response = self.async_get(async_views.project_list, '/api/projects/', if_none_match=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        request = self.factory.post('/api/projects/', {
+            'project_id': 'ID-9001', 'name': 'Async', 'land_details': '-', 'land_address': '-',
+            'budget': '1000', 'duration_months': 3, 'status': 'Active',
+        }, content_type='application/json')
+        request._dont_enforce_csrf_checks = True
+        response = async_to_sync(async_views.project_list)(request)
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(Project.objects.filter(project_id='ID-9001').exists())
+
+
+class PaymentFileStorageTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.project = create_project()
+
+    def upload(self, content, name='receipt.pdf'):
+        response = self.client.post('/api/payments/', {
+            'project': self.project.id, 'amount': '100', 'payment_date': '2025-01-10', 'payment_type': 'Advance',
+            'payment_file': SimpleUploadedFile(name, content, content_type='application/pdf'),
+        })
+        self.assertEqual(response.status_code, 201, response.content)
+        return Payment.objects.get(pk=response.json()['id'])
+
+    def stored_files(self):
+        return sorted(
+            os.path.relpath(os.path.join(root, name), self.media_root)
+            for root, _, names in os.walk(self.media_root) for name in names
+        )
+
+    def test_identical_uploads_share_one_file(self):
+        first = self.upload(b'%PDF-1.4 bank transfer')
+        second = self.upload(b'%PDF-1.4 bank transfer', name='RECEIPT-copy.PDF')
+        other = self.upload(b'%PDF-1.4 another receipt')
+
+        self.assertEqual(first.payment_file.name, second.payment_file.name)
+        self.assertRegex(first.payment_file.name, r'^payment_files/[0-9a-f]{2}/[0-9a-f]{64}\.pdf$')
+        self.assertEqual(self.stored_files(), sorted([first.payment_file.name, other.payment_file.name]))
+        self.assertEqual(StoredFile.objects.get(name=first.payment_file.name).ref_count, 2)
+        with first.payment_file.open('rb') as stored:
+            self.assertEqual(stored.read(), b'%PDF-1.4 bank transfer')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertIn(second.payment_file.name, self.stored_files())
+        self.assertEqual(StoredFile.objects.get(name=second.payment_file.name).ref_count, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertEqual(self.stored_files(), [other.payment_file.name])
+        self.assertFalse(StoredFile.objects.filter(name=second.payment_file.name).exists())
+
+    def test_bulk_and_cascade_deletes_release_files(self):
+        first = self.upload(b'first receipt')
+        second = self.upload(b'second receipt')
+        with self.captureOnCommitCallbacks(execute=True):
+            Payment.objects.filter(pk=first.pk).delete()
+        self.assertEqual(self.stored_files(), [second.payment_file.name])
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.total_paid, Decimal('100'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.project.delete()
+        self.assertEqual(self.stored_files(), [])
+        self.assertFalse(StoredFile.objects.exists())
+
+    def test_replacing_a_file_releases_the_old_one(self):
+        payment = self.upload(b'first scan')
+        old_name = payment.payment_file.name
+        with self.captureOnCommitCallbacks(execute=True):
+            payment.payment_file = ContentFile(b'second scan', name='rescan.pdf')
+            payment.save()
+        self.assertEqual(self.stored_files(), [payment.payment_file.name])
+        self.assertFalse(StoredFile.objects.filter(name=old_name).exists())
+
+        # Re-uploading the same content keeps exactly one reference
+        payment.payment_file = ContentFile(b'second scan', name='rescan.pdf')
+        payment.save()
+        self.assertEqual(StoredFile.objects.get(name=payment.payment_file.name).ref_count, 1)
+
+    def test_migrate_payment_files_deduplicates_legacy_files(self):
+        os.makedirs(os.path.join(self.media_root, 'payment_files'))
+        legacy = {'a.pdf': b'same receipt', 'b.pdf': b'same receipt', 'c.pdf': b'different receipt'}
+        payments = {}
+        for name, content in legacy.items():
+            with open(os.path.join(self.media_root, 'payment_files', name), 'wb') as legacy_file:
+                legacy_file.write(content)
+            payment = Payment.objects.create(
+                project=self.project, amount=Decimal('10'), payment_date=date(2025, 1, 10), payment_type='Advance',
+            )
+            Payment.objects.filter(pk=payment.pk).update(payment_file=f'payment_files/{name}')
+            payments[name] = payment.pk
+
+        out = StringIO()
+        call_command('migrate_payment_files', '--dry-run', stdout=out)
+        self.assertIn(f'would reclaim {len(b"same receipt")} bytes', out.getvalue())
+        self.assertEqual(len(self.stored_files()), 3)
+
+        out = StringIO()
+        call_command('migrate_payment_files', stdout=out)
+        self.assertIn(f'Reclaimed {len(b"same receipt")} bytes', out.getvalue())
+
+        names = dict(Payment.objects.filter(pk__in=payments.values()).values_list('pk', 'payment_file'))
+        self.assertEqual(names[payments['a.pdf']], names[payments['b.pdf']])
+        self.assertEqual(self.stored_files(), sorted(set(names.values())))
+        self.assertEqual(StoredFile.objects.get(name=names[payments['a.pdf']]).ref_count, 2)
+        self.assertEqual(StoredFile.objects.get(name=names[payments['c.pdf']]).ref_count, 1)
+
+
+class PaymentFileDownloadTests(TestCase):
+    content = bytes(range(256)) * 4
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.project = create_project()
+        self.payment = Payment.objects.create(
+            project=self.project, amount=Decimal('100'), payment_date=date(2025, 1, 10), payment_type='Advance',
+            payment_file=ContentFile(self.content, name='receipt.pdf'),
+        )
+        self.url = f'/api/payments/{self.payment.id}/file/'
+        self.digest = StoredFile.objects.get(name=self.payment.payment_file.name).sha256
+        from django.contrib.auth.models import User
+        self.user = User.objects.create_user('clerk', password='x')
+        self.client.force_login(self.user)
+
+    def get(self, url=None, **headers):
+        response = self.client.get(url or self.url, headers=headers)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_download_and_cache_headers(self):
+        listed = self.client.get(f'/api/payments/?project_id={self.project.id}').json()['results'][0]
+        self.assertEqual(listed['payment_file_url'], f'{self.url}?v={self.digest}')
+
+        response, body = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.content)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertEqual(response['ETag'], f'"{self.digest}"')
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+        response, _ = self.get(listed['payment_file_url'])
+        self.assertEqual(response['Cache-Control'], 'private, max-age=31536000, immutable')
+
+        response, body = self.get(if_none_match=f'"{self.digest}"')
+        self.assertEqual((response.status_code, body), (304, b''))
+        response, _ = self.get(if_modified_since=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+        no_file = Payment.objects.create(project=self.project, amount=Decimal('1'), payment_date=date(2025, 1, 10), payment_type='Advance')
+        self.assertEqual(self.client.get(f'/api/payments/{no_file.id}/file/').status_code, 404)
+
+    def test_media_links_point_at_the_download_endpoint(self):
+        listed = self.client.get(f'/api/payments/?project_id={self.project.id}').json()['results'][0]
+        self.assertEqual(listed['payment_file'], f'http://testserver{self.url}?v={self.digest}')
+
+        response = self.client.get(f'/media/{self.payment.payment_file.name}')
+        self.assertRedirects(response, f'{self.url}?v={self.digest}', fetch_redirect_response=False)
+        self.assertEqual(self.client.get('/media/payment_files/missing.pdf').status_code, 404)
+        self.assertEqual(self.client.get('/media/uploads/session.part').status_code, 404)
+
+    def test_requires_login(self):
+        self.client.logout()
+        response, body = self.get()
+        self.assertEqual(response.status_code, 403)
+        self.assertNotEqual(body, self.content)
+
+    def test_range_requests(self):
+        response, body = self.get(range='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(body, self.content[10:20])
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(self.content)}')
+        self.assertEqual(response['Content-Length'], '10')
+
+        response, body = self.get(range='bytes=-16')
+        self.assertEqual((response.status_code, body), (206, self.content[-16:]))
+        response, body = self.get(range='bytes=1000-')
+        self.assertEqual((response.status_code, body), (206, self.content[1000:]))
+
+        response, _ = self.get(range=f'bytes={len(self.content)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.content)}')
+
+        # A stale If-Range or a multi-range request gets the whole file
+        for headers in ({'range': 'bytes=0-9', 'if_range': '"stale"'}, {'range': 'bytes=0-1,5-6'}):
+            response, body = self.get(**headers)
+            self.assertEqual((response.status_code, body), (200, self.content))
+        response, body = self.get(range='bytes=0-9', if_range=f'"{self.digest}"')
+        self.assertEqual((response.status_code, body), (206, self.content[:10]))
+
+    def test_asgi_streams_with_an_async_iterator(self):
+        async def download():
+            client = AsyncClient()
+            await client.aforce_login(self.user)
+            response = await client.get(self.url, headers={'range': 'bytes=100-'})
+            return response, b''.join([chunk async for chunk in response.streaming_content])
+
+        response, body = async_to_sync(download)()
+        self.assertTrue(response.is_async)
+        self.assertEqual((response.status_code, body), (206, self.content[100:]))
+
+    @override_settings(PAYMENT_FILE_SENDFILE='x-accel-redirect', PAYMENT_FILE_ACCEL_PREFIX='/protected/')
+    def test_front_server_handoff(self):
+        response, body = self.get()
+        self.assertEqual(body, b'')
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected/{self.payment.payment_file.name}')
+        self.assertEqual(response['ETag'], f'"{self.digest}"')
+
+
+@override_settings(CHUNKED_UPLOAD_CHUNK_SIZE=1000)
+class ChunkedUploadTests(TestCase):
+    content = os.urandom(2500)
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.project = create_project()
+
+    def start(self, content=None):
+        content = self.content if content is None else content
+        response = self.client.post('/api/uploads/', {
+            'filename': 'scan.PDF', 'size': len(content), 'sha256': hashlib.sha256(content).hexdigest(),
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        return response.json()
+
+    def put(self, upload_id, start, data, size=None):
+        end = start + len(data) - 1
+        return self.client.put(
+            f'/api/uploads/{upload_id}/', data, content_type='application/octet-stream',
+            headers={'content-range': f'bytes {start}-{end}/{size or len(self.content)}'},
+        )
+
+    def upload(self, content=None):
+        content = self.content if content is None else content
+        upload = self.start(content)
+        for start in range(0, len(content), 1000):
+            self.assertEqual(self.put(upload['id'], start, content[start:start + 1000], len(content)).status_code, 200)
+        return upload
+
+    def test_resume_complete_and_attach(self):
+        upload = self.start()
+        self.assertEqual((upload['received'], upload['chunk_size']), (0, 1000))
+        self.assertEqual(self.put(upload['id'], 0, self.content[:1000]).json()['received'], 1000)
+
+        # A chunk at the wrong offset is refused with the offset to resume from
+        response = self.put(upload['id'], 2000, self.content[2000:])
+        self.assertEqual((response.status_code, response.json()['received']), (409, 1000))
+        self.assertEqual(self.client.get(f'/api/uploads/{upload["id"]}/').json()['received'], 1000)
+        self.assertEqual(self.put(upload['id'], 1000, self.content[1000:2500]).status_code, 413)
+
+        response = self.client.post(f'/api/uploads/{upload["id"]}/complete/')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('incomplete', response.json()['error'])
+        self.put(upload['id'], 1000, self.content[1000:2000])
+        self.put(upload['id'], 2000, self.content[2000:])
+        response = self.client.post(f'/api/uploads/{upload["id"]}/complete/')
+        self.assertEqual(response.json()['status'], 'complete')
+        # The part file moved into content-addressed storage
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'uploads')), [])
+
+        response = self.client.post('/api/payments/', {
+            'project': self.project.id, 'amount': '100', 'payment_date': '2025-01-10',
+            'payment_type': 'Advance', 'upload_id': upload['id'],
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        payment = Payment.objects.get(pk=response.json()['id'])
+        with payment.payment_file.open('rb') as stored:
+            self.assertEqual(stored.read(), self.content)
+        self.assertTrue(payment.payment_file.name.endswith('.pdf'))
+        self.assertEqual(StoredFile.objects.get(name=payment.payment_file.name).ref_count, 1)
+        self.assertFalse(UploadSession.objects.exists())
+
+        # An upload is attached once
+        response = self.client.post('/api/payments/', {
+            'project': self.project.id, 'amount': '100', 'payment_date': '2025-01-10',
+            'payment_type': 'Advance', 'upload_id': upload['id'],
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_checksum_mismatch_starts_over(self):
+        upload = self.start()
+        tampered = b'x' + self.content[1:]
+        for start in range(0, len(tampered), 1000):
+            self.put(upload['id'], start, tampered[start:start + 1000])
+        response = self.client.post(f'/api/uploads/{upload["id"]}/complete/')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Checksum mismatch', response.json()['error'])
+        self.assertEqual(UploadSession.objects.get(pk=upload['id']).received, 0)
+        self.assertFalse(StoredFile.objects.exists())
+
+    def test_cleanup_deletes_idle_sessions(self):
+        partial = self.start()
+        self.put(partial['id'], 0, self.content[:1000])
+        unattached = self.upload(b'unattached receipt')
+        self.client.post(f'/api/uploads/{unattached["id"]}/complete/')
+        fresh = self.start()
+        UploadSession.objects.exclude(pk=fresh['id']).update(updated_at=timezone.now() - timedelta(days=2))
+
+        out = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('cleanup_uploads', hours=24, stdout=out)
+        self.assertIn('Deleted 2 upload sessions', out.getvalue())
+        self.assertEqual(list(UploadSession.objects.values_list('pk', flat=True)), [uuid.UUID(fresh['id'])])
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'uploads')), [f'{fresh["id"]}.part'])
+        # The completed but never attached file was released and collected
+        self.assertFalse(StoredFile.objects.exists())
+
+
+class SeedScaleTests(TestCase):
+    def seed(self, **options):
+        out = StringIO()
+        call_command('seed_scale', projects=6, expenses=600, payments=60, end_date=date(2026, 6, 30),
+                     batch_size=100, stdout=out, **options)
+        return out.getvalue()
+
+    def snapshot(self):
+        return (
+            sorted(Project.objects.values_list('name', 'budget', 'total_paid', 'status')),
+            sorted(Payment.objects.values_list('project__name', 'amount', 'payment_date', 'payment_type')),
+            sorted(ManpowerExpense.objects.values_list('project__name', 'date', 'number_of_people', 'total_amount')),
+            sorted(MaterialExpense.objects.values_list('project__name', 'date', 'item__name', 'total_amount')),
+        )
+
+    def test_totals_are_consistent(self):
+        output = self.seed()
+        self.assertIn('6 projects, 60 payments', output)
+        self.assertEqual(ManpowerExpense.objects.count() + MaterialExpense.objects.count(), 600)
+
+        for project in Project.objects.select_related('ledger'):
+            ledger = project.ledger
+            payments = sum(Payment.objects.filter(project=project).values_list('amount', flat=True))
+            manpower = list(ManpowerExpense.objects.filter(project=project).values_list('total_amount', flat=True))
+            material = list(MaterialExpense.objects.filter(project=project).values_list('total_amount', flat=True))
+            self.assertEqual(payments, project.total_paid)
+            self.assertEqual(ledger.total_payments, project.total_paid)
+            self.assertEqual((ledger.total_manpower, ledger.manpower_count), (sum(manpower), len(manpower)))
+            self.assertEqual((ledger.total_material, ledger.material_count), (sum(material), len(material)))
+            self.assertLessEqual(ledger.total_expenses, ledger.total_payments)
+            self.assertLessEqual(project.total_paid, project.budget)
+            self.assertEqual(project.remaining_amount, project.budget - project.total_paid)
+
+        # The seeded rows pass the validation bulk_create skipped
+        expense = ManpowerExpense.objects.first()
+        expense.full_clean()
+        MaterialExpense.objects.first().full_clean()
+
+    def test_same_seed_same_data(self):
+        snapshots = []
+        for options in ({}, {}, {'seed': 7}):
+            for model in (ManpowerExpense, MaterialExpense, Payment, ProjectLedger, Project):
+                model.objects.all().delete()
+            self.seed(**options)
+            snapshots.append(self.snapshot())
+        self.assertEqual(snapshots[0], snapshots[1])
+        self.assertNotEqual(snapshots[0], snapshots[2])
+
+    def test_add_test_data(self):
+        call_command('add_test_data', stdout=StringIO())
+        project = Project.objects.get(name='Test Project')
+        self.assertEqual(project.ledger.total_expenses, Decimal('48000'))
+
+
+class BenchmarkSuiteTests(TestCase):
+    def test_measure_every_scenario(self):
+        ScaleSeeder(projects=2, expenses=60, payments=6, seed=1).run()
+        ctx = benchmarks.benchmark_context()
+        for name in benchmarks.SCENARIOS:
+            metrics = benchmarks.measure(name, ctx, iterations=2, rounds=1, warmup=0)
+            self.assertEqual(set(metrics), {'median_ms', 'p95_ms', 'queries', 'peak_kb'})
+            self.assertGreater(metrics['queries'], 0, name)
+
+    def test_compare_flags_regressions_past_thresholds(self):
+        base = {'median_ms': 10.0, 'p95_ms': 20.0, 'queries': 4, 'peak_kb': 500.0}
+        baseline = {'datasets': {'small': {'report-year': base, 'projects-list': base}}}
+
+        def results(**changes):
+            return {'datasets': {'small': {'report-year': {**base, **changes}, 'create-payment': base}}}
+
+        self.assertEqual(benchmarks.compare(baseline, results(median_ms=14.9, peak_kb=590)), [])
+        # Below the absolute noise floor
+        self.assertEqual(benchmarks.compare(baseline, results(median_ms=11.9), threshold=0.1), [])
+        self.assertEqual(
+            benchmarks.compare(baseline, results(median_ms=16, queries=5, peak_kb=700)),
+            ['small/report-year: median_ms 10.0 -> 16',
+             'small/report-year: peak_kb 500.0 -> 700',
+             'small/report-year: queries 4 -> 5'],
+        )
+        self.assertEqual(benchmarks.compare(baseline, results(queries=5), query_threshold=1), [])
+
+
+class LoadTestTests(TestCase):
+    def test_profiles(self):
+        ramp = loadtest.LoadProfile('ramp', 10, 60, ramp_up=20)
+        self.assertEqual([ramp.clients_at(t) for t in (0, 2, 10, 20, 50)], [1, 1, 5, 10, 10])
+        step = loadtest.LoadProfile('step', 8, 40, steps=4)
+        self.assertEqual([step.clients_at(t) for t in (0, 10, 25, 39)], [2, 4, 6, 8])
+        spike = loadtest.LoadProfile('spike', 10, 100)
+        self.assertEqual([spike.clients_at(t) for t in (10, 45, 70)], [2, 10, 2])
+        self.assertAlmostEqual(sum(spike.time_at_levels().values()), 100)
+        self.assertAlmostEqual(spike.time_at_levels()[10], 20)
+
+    def test_scenario_result_reads_query_headers(self):
+        result = loadtest.ScenarioResult()
+        result.record(200, 0.01, {'x-db-queries': '4', 'server-timing': 'db;dur=2.50'})
+        result.record(201, 0.03, {'x-db-queries': '8', 'server-timing': 'app;dur=1, db;dur=7.50'})
+        result.record(400, 0.02, {})
+        result.elapsed = 1
+        summary = result.summary()
+        self.assertEqual((summary['requests'], summary['errors']), (3, 1))
+        self.assertEqual((summary['queries'], summary['queries_per_request'], summary['db_ms_per_request']),
+                         (12, 6.0, 5.0))
+
+    def test_query_stats_headers(self):
+        create_project()
+        self.assertNotIn('X-DB-Queries', Client().get('/api/projects/'))
+
+        # Installed at startup, as METRICS_ENABLED is on
+        self.assertIn(count_queries, connection.execute_wrappers)
+        with override_settings(QUERY_STATS_HEADERS=True), CaptureQueriesContext(connection) as queries:
+            response = Client().get('/api/projects/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(int(response['X-DB-Queries']), len(queries))
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+$')
+
+    def test_middleware_is_off_by_default(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            query_stats_middleware(lambda request: None)
+
+    def test_every_scenario_is_a_valid_request(self):
+        ScaleSeeder(projects=3, expenses=60, payments=6, seed=1).run()
+        totals = {project.pk: (project.total_paid, project.ledger.total_expenses)
+                  for project in Project.objects.select_related('ledger')}
+        ctx = loadtest.load_context(projects=3)
+        rng = random.Random(0)
+        client = Client()
+        load = loadtest.MixedLoad('localhost', 0, ctx, loadtest.LoadProfile('constant', 1, 1))
+        for name, (_, request) in loadtest.SCENARIOS.items():
+            method, path, payload = request(rng, ctx)
+            if payload is None:
+                response = client.generic(method, path)
+            else:
+                response = client.generic(method, path, json.dumps(payload), content_type='application/json')
+            self.assertLess(response.status_code, 400, f'{name}: {response.content[:200]!r}')
+            if name in loadtest.CREATED_MODELS:
+                load.created.append((name, response.json()['id']))
+
+        self.assertEqual(loadtest.delete_created(load.created), 3)
+        self.assertEqual(
+            {project.pk: (project.total_paid, project.ledger.total_expenses)
+             for project in Project.objects.select_related('ledger')},
+            totals,
+        )
+
+    def test_same_seed_same_requests(self):
+        ctx = {'projects': [1, 2, 3], 'work_types': [1, 2], 'items': [4, 5], 'today': '2026-01-01'}
+
+        def sequence(seed):
+            rng = random.Random(f'{seed}:0')
+            names = list(loadtest.SCENARIOS)
+            return [loadtest.SCENARIOS[rng.choice(names)][1](rng, ctx) for _ in range(50)]
+
+        self.assertEqual(sequence(42), sequence(42))
+        self.assertNotEqual(sequence(42), sequence(43))
+
+
+@override_settings(METRICS_TOKEN='s3cret')
+class MetricsTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(metrics, 'registry', metrics.MetricsRegistry())
+        self.registry = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def scrape(self, **headers):
+        headers.setdefault('HTTP_AUTHORIZATION', 'Bearer s3cret')
+        response = Client().get('/metrics', **headers)
+        return response, response.content.decode()
+
+    def test_requests_per_view(self):
+        project = create_project()
+        client = Client()
+        with CaptureQueriesContext(connection) as queries:
+            client.get('/api/projects/')
+        # Each request clears the query log, so count them now
+        project_list_queries = len(queries)
+        client.get('/api/projects/')
+        client.get('/api/expenses/', {'type': 'manpower', 'project_id': project.pk})
+        client.get('/no/such/page/')
+        client.get(f'/api/reports/{project.pk}/', {'time_range': 'year'})
+
+        response, text = self.scrape()
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+        self.assertIn('http_requests_total{view="project-list",method="GET",status="200"} 2\n', text)
+        self.assertIn('http_requests_total{view="expense-list",method="GET",status="200"} 1\n', text)
+        self.assertIn('http_requests_total{view="unmatched",method="GET",status="404"} 1\n', text)
+        self.assertIn('http_request_duration_seconds_bucket{view="project-list",method="GET",le="+Inf"} 2\n', text)
+        self.assertIn('http_request_duration_seconds_count{view="project-list",method="GET"} 2\n', text)
+        self.assertIn(f'db_queries_per_request_sum{{view="project-list",method="GET"}} {2 * project_list_queries}\n', text)
+        # These run their queries on worker threads, each with a connection of its own
+        self.assertRegex(text, r'db_queries_per_request_sum\{view="expense-list",method="GET"\} [1-9]')
+        self.assertRegex(text, r'db_queries_per_request_sum\{view="report_data",method="GET"\} [1-9]')
+        self.assertRegex(text, r'http_response_size_bytes_sum\{view="project-list",method="GET"\} [1-9]')
+        self.assertRegex(text, r'db_query_duration_seconds_total\{view="report_data",method="GET"\} [\d.e-]+\n')
+
+    def test_histogram_buckets_are_cumulative(self):
+        labels = ('report_data', 'GET')
+        for value in (0.003, 0.02, 0.02, 30):
+            self.registry.observe('http_request_duration_seconds', labels, value)
+        lines = metrics.render().splitlines()
+        buckets = [line.rsplit(' ', 1)[1] for line in lines if line.startswith('http_request_duration_seconds_bucket')]
+        self.assertEqual(buckets, ['1', '1', '3', '3', '3', '3', '3', '3', '3', '3', '3', '4'])
+        self.assertIn('http_request_duration_seconds_sum{view="report_data",method="GET"} 30.043', lines)
+
+    def test_token(self):
+        self.assertEqual(Client().get('/metrics').status_code, 401)
+        self.assertEqual(self.scrape(HTTP_AUTHORIZATION='Bearer wrong')[0].status_code, 401)
+        self.assertEqual(self.scrape()[0].status_code, 200)
+        with override_settings(METRICS_TOKEN=''):
+            self.assertEqual(Client().get('/metrics').status_code, 403)
+            with override_settings(DEBUG=True):
+                self.assertEqual(Client().get('/metrics').status_code, 200)
+
+    def test_aggregates_across_processes(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.registry.inc('http_requests_total', ('project-list', 'GET', '200'))
+
+        def worker(requests):
+            for _ in range(requests):
+                metrics.record_request('project-list', 'GET', 200, 0.01, 100, 2, 0.001)
+            metrics.registry.flush()
+
+        with override_settings(METRICS_DIR=directory):
+            context = multiprocessing.get_context('fork')
+            for requests in (3, 4):
+                process = context.Process(target=worker, args=(requests,))
+                process.start()
+                process.join()
+                self.assertEqual(process.exitcode, 0)
+            text = metrics.render()
+
+        # 3 + 4 from the workers, which did not inherit the parent's 1, plus
+        # that 1 from this process
+        self.assertIn('http_requests_total{view="project-list",method="GET",status="200"} 8\n', text)
+        self.assertIn('db_queries_per_request_sum{view="project-list",method="GET"} 14\n', text)
+        # The exited workers' files were folded into one
+        self.assertEqual(sorted(name for name in os.listdir(directory) if not name.startswith('.')),
+                         sorted([metrics.EXITED_FILE, metrics.registry.file_name]))
+
+        with override_settings(METRICS_DIR=directory):
+            process = context.Process(target=worker, args=(2,))
+            process.start()
+            process.join()
+            text = metrics.render()
+            self.assertIn('http_requests_total{view="project-list",method="GET",status="200"} 10\n', text)
+            # Folding in is idempotent
+            self.assertEqual(metrics.render(), text)
+        self.assertEqual(len([name for name in os.listdir(directory) if name.endswith('.json')]), 2)
+
+    def test_reused_pid_keeps_exited_workers_totals(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        with override_settings(METRICS_DIR=directory):
+            # Two registries in one process stand for two workers given the same pid
+            for requests in (3, 4):
+                registry = metrics.MetricsRegistry()
+                for _ in range(requests):
+                    registry.inc('http_requests_total', ('project-list', 'GET', '200'))
+                registry.flush()
+            totals = registry.collect()
+        self.assertEqual(totals[('http_requests_total', ('project-list', 'GET', '200'))], 7)
+        self.assertEqual(len([name for name in os.listdir(directory) if name.endswith('.json')]), 2)
+
+
+@override_settings(SLOW_QUERY_EXPLAIN=True)
+class SlowQueryTests(TestCase):
+    def setUp(self):
+        slow_query_log.clear()
+        self.addCleanup(slow_query_log.clear)
+        # Capture is off by default, so its wrapper is not installed at startup
+        connection_created.connect(install_slow_query_capture)
+        self.addCleanup(connection_created.disconnect, install_slow_query_capture)
+        install_slow_query_capture(None, connection)
+        self.addCleanup(connection.execute_wrappers.remove, slow_query_log.capture)
+
+    def test_captures_slow_queries_with_view_stack_and_plan(self):
+        project = create_project()
+        with override_settings(SLOW_QUERY_THRESHOLD_MS=0.001):
+            response = Client().get(f'/api/reports/{project.pk}/', {'time_range': 'year'})
+            slow_query_log.wait()
+        self.assertEqual(response.status_code, 200)
+
+        entries = [entry for entry in slow_query_log.snapshot() if entry['view'] == 'report_data']
+        self.assertTrue(entries)
+        for entry in entries:
+            self.assertEqual(entry['method'], 'GET')
+            self.assertTrue(entry['path'].startswith(f'/api/reports/{project.pk}/'))
+            self.assertTrue(entry['sql'].startswith('SELECT'))
+            self.assertTrue(entry['plan'], entry)
+        self.assertTrue(any('construction/reports.py' in frame for entry in entries for frame in entry['stack']))
+        # The EXPLAIN queries themselves are not captured
+        self.assertFalse([entry for entry in slow_query_log.snapshot() if 'EXPLAIN' in entry['sql']])
+
+    def test_threshold_and_writes(self):
+        for threshold in (60_000, 0):
+            with override_settings(SLOW_QUERY_THRESHOLD_MS=threshold):
+                create_project()
+        self.assertEqual(slow_query_log.snapshot(), [])
+
+        with override_settings(SLOW_QUERY_THRESHOLD_MS=0.001):
+            create_project(name='Slow')
+            slow_query_log.wait()
+        insert = next(entry for entry in slow_query_log.snapshot() if entry['sql'].startswith(f'INSERT INTO {connection.ops.quote_name("construction_project")}'))
+        self.assertIsNone(insert['plan'])
+        self.assertNotIn('plan_error', insert)
+        self.assertIn("'Slow'", insert['params'])
+        self.assertIsNone(insert['view'])
+
+    def test_log_file(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'slow.jsonl')
+        with override_settings(SLOW_QUERY_THRESHOLD_MS=0.001, SLOW_QUERY_LOG_FILE=path):
+            Project.objects.filter(name='x').count()
+            slow_query_log.wait()
+        with open(path) as log:
+            lines = [json.loads(line) for line in log]
+        self.assertEqual(len(lines), 1)
+        self.assertIn('COUNT', lines[0]['sql'])
+        self.assertTrue(lines[0]['plan'])
+
+    def test_staff_endpoint(self):
+        from django.contrib.auth.models import User
+        client = Client()
+        self.assertEqual(client.get('/api/slow-queries/').status_code, 403)
+        client.force_login(User.objects.create_user('clerk', password='x'))
+        self.assertEqual(client.get('/api/slow-queries/').status_code, 403)
+
+        client.force_login(User.objects.create_user('admin', password='x', is_staff=True))
+        with override_settings(SLOW_QUERY_THRESHOLD_MS=0.001):
+            client.get('/api/projects/')
+            slow_query_log.wait()
+        data = client.get('/api/slow-queries/').json()
+        self.assertEqual(data['count'], len(data['queries']))
+        self.assertIn('project-list', [entry['view'] for entry in data['queries']])
+
+        response = client.get('/api/slow-queries/', {'format': 'jsonl'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = [json.loads(line) for line in response.content.decode().splitlines()]
+        self.assertEqual(len(lines), len(slow_query_log.snapshot()))
+
+
+@override_settings(REQUEST_PROFILING=True)
+class RequestProfilingTests(TestCase):
+    def setUp(self):
+        from django.contrib.auth.models import User
+        self.staff = User.objects.create_user('admin', password='x', is_staff=True)
+        self.client.force_login(self.staff)
+        self.project = create_project()
+        self.addCleanup(profile_store.profiles.clear)
+
+    def test_only_staff_can_profile(self):
+        from django.contrib.auth.models import User
+        client = Client()
+        client.force_login(User.objects.create_user('clerk', password='x'))
+        response = client.get('/api/projects/', {'profile': '1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(client.get('/api/profiles/').status_code, 403)
+        self.assertNotIn('X-Profile-Id', self.client.get('/api/projects/'))
+
+    def test_profile_of_a_payment_post(self):
+        response = self.client.post('/api/payments/?profile=1', {
+            'project': self.project.pk, 'amount': '5000', 'payment_date': date.today().isoformat(),
+            'payment_type': 'Advance',
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+
+        profile = self.client.get(f'/api/profiles/{response["X-Profile-Id"]}/').json()
+        self.assertEqual((profile['view'], profile['method'], profile['status']), ('payment-list', 'POST', 201))
+        for layer in ('drf_validation', 'drf_serialization', 'model_full_clean', 'orm', 'database'):
+            self.assertGreater(profile['layers'][layer], 0, layer)
+        self.assertGreater(profile['sql']['count'], 0)
+        self.assertEqual(profile['sql']['count'], len(profile['sql']['timeline']))
+        self.assertTrue(profile['hot_functions']['by_own_time'])
+        self.assertTrue(any('construction/models.py' in row['function']
+                            for row in profile['hot_functions']['by_cumulative_time']))
+
+        raw = self.client.get(f'/api/profiles/{profile["id"]}/', {'format': 'pstats'}).content
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'payment.prof')
+        with open(path, 'wb') as output:
+            output.write(raw)
+        self.assertGreater(pstats.Stats(path).total_calls, 0)
+        self.assertEqual([entry['id'] for entry in self.client.get('/api/profiles/').json()['profiles']],
+                         [profile['id']])
+
+    def test_inline_profile_by_header(self):
+        response = self.client.get(
+            f'/api/reports/{self.project.pk}/', {'time_range': 'month'}, HTTP_X_PROFILE='inline',
+        )
+        self.assertEqual(response.status_code, 200)
+        profile = response.json()
+        self.assertEqual((profile['view'], profile['status']), ('report_data', 200))
+        self.assertIn('layers', profile)
+
+    def test_async_handler_profiles_sync_views(self):
+        client = AsyncClient()
+
+        async def profiled():
+            await client.aforce_login(self.staff)
+            return await client.get('/api/projects/', {'profile': '1'})
+
+        response = async_to_sync(profiled)()
+        self.assertEqual(response.status_code, 200)
+        profile, _ = profile_store.get(response['X-Profile-Id'])
+        self.assertGreater(profile['layers']['orm'], 0)
+        self.assertEqual(profile['sql']['count'], len(profile['sql']['timeline']))
+        self.assertGreater(profile['sql']['count'], 0)
+
+    def test_profile_dir_shares_profiles(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        with override_settings(REQUEST_PROFILE_DIR=directory, REQUEST_PROFILE_LOG_SIZE=2):
+            ids = [self.client.get('/api/projects/', {'profile': '1'})['X-Profile-Id'] for _ in range(3)]
+            # Another worker's memory: only the directory has them
+            profile_store.profiles.clear()
+            self.assertEqual(self.client.get(f'/api/profiles/{ids[0]}/').status_code, 404)
+            self.assertEqual(self.client.get(f'/api/profiles/{ids[2]}/').json()['id'], ids[2])
+            self.assertEqual(len(self.client.get('/api/profiles/').json()['profiles']), 2)
+
+    def test_off_by_setting(self):
+        with override_settings(REQUEST_PROFILING=False), self.assertRaises(MiddlewareNotUsed):
+            profiling_middleware(lambda request: None)
+        with override_settings(REQUEST_PROFILING=False):
+            client = Client()
+            client.force_login(self.staff)
+            response = client.get('/api/projects/', {'profile': '1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Profile-Id', response)
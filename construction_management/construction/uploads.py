@@ -0,0 +1,217 @@
+"""
+Uploads: the handler that hashes multipart uploads on the way in, and the
+resumable upload protocol behind /api/uploads/ for files too large (or
+connections too flaky) for a single request:
+
+1. POST /api/uploads/ {filename, size, sha256} starts a session.
+2. PUT /api/uploads/<id>/ with `Content-Range: bytes <start>-<end>/<size>`
+   writes one chunk at its offset; GET returns `received`, the offset to
+   resume from after a dropped connection.
+3. POST /api/uploads/<id>/complete/ verifies the SHA-256 and moves the file
+   into payment file storage.
+4. The session id is then sent as `upload_id` when creating or updating a
+   payment.
+
+Chunks are streamed into the session's part file, which is assembled in
+place; nothing holds a whole file in memory. The cleanup_uploads command
+deletes abandoned sessions.
+"""
+import hashlib
+import logging
+import os
+
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.db import transaction
+from django.http import UnreadablePostError
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+
+from .storage import CHUNK_SIZE, payment_file_storage
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_DIR = 'uploads'
+
+
+class HashingFileUploadHandler(TemporaryFileUploadHandler):
+    """
+    Streams every upload to a temporary file, never holding it in memory,
+    and computes its SHA-256 on the way in. The digest is set as
+    ``uploaded_file.sha256`` so ContentAddressedStorage can move the file
+    into place without reading it again.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.digest = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.digest.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        uploaded_file = super().file_complete(file_size)
+        uploaded_file.sha256 = self.digest.hexdigest()
+        return uploaded_file
+
+
+class UploadConflict(Exception):
+    """A chunk did not start where the session's data ends."""
+
+    def __init__(self, received):
+        super().__init__(f'Expected a chunk starting at byte {received}')
+        self.received = received
+
+
+class AssembledUpload(File):
+    """A completed part file, handed to ContentAddressedStorage to move into place."""
+
+    def __init__(self, path, sha256, size):
+        super().__init__(None, name=os.path.basename(path))
+        self.path = path
+        self.sha256 = sha256
+        self.size = size
+
+    def temporary_file_path(self):
+        return self.path
+
+
+def part_path(session_id):
+    return payment_file_storage.path(f'{UPLOAD_DIR}/{session_id}.part')
+
+
+def start_session(filename, size, sha256):
+    from .models import UploadSession
+
+    session = UploadSession.objects.create(
+        filename=get_valid_filename(os.path.basename(filename)) or 'upload', size=size, sha256=sha256.lower(),
+    )
+    path = part_path(session.pk)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, 'wb').close()
+    return session
+
+
+def write_chunk(session, start, length, stream):
+    """
+    Stream `length` bytes from stream into the session's part file at
+    start, which must be where the data received so far ends. If the
+    client goes away mid-chunk, the bytes that did arrive are kept so it
+    can resume from there.
+
+    Two clients racing to write the same offset are told apart by the
+    conditional update; the loser gets an UploadConflict, and the checksum
+    check in complete_session() catches any bytes it overwrote.
+    """
+    from .models import UploadSession
+
+    if session.status != 'pending':
+        raise ValidationError('This upload is already complete')
+    if start != session.received:
+        raise UploadConflict(session.received)
+    if start + length > session.size:
+        raise ValidationError(f'Chunk runs past the end of the {session.size} byte file')
+
+    written = 0
+    interrupted = False
+    with open(part_path(session.pk), 'r+b') as part:
+        part.seek(start)
+        try:
+            while written < length:
+                data = stream.read(min(CHUNK_SIZE, length - written))
+                if not data:
+                    break
+                part.write(data)
+                written += len(data)
+        except UnreadablePostError:
+            interrupted = True
+
+    received = start + written
+    if written and not UploadSession.objects.filter(pk=session.pk, status='pending', received=start).update(
+        received=received, updated_at=timezone.now()
+    ):
+        raise UploadConflict(UploadSession.objects.values_list('received', flat=True).get(pk=session.pk))
+    session.received = received
+    if interrupted or written < length:
+        logger.warning(f"Upload {session.pk}: chunk at {start} cut short after {written} of {length} bytes")
+        raise ValidationError(f'Chunk was cut short after {written} of {length} bytes')
+    return session
+
+
+def complete_session(session):
+    """
+    Verify the assembled file against the declared SHA-256 and move it into
+    payment file storage. The session then holds a reference on the stored
+    file until a payment claims it. On a checksum mismatch the received data
+    is discarded and the client has to upload the file again.
+    """
+    from .models import UploadSession
+
+    if session.status == 'complete':
+        return session
+    if session.received != session.size:
+        raise ValidationError(f'Upload is incomplete: {session.received} of {session.size} bytes received')
+
+    path = part_path(session.pk)
+    digest = hashlib.sha256()
+    with open(path, 'rb') as part:
+        for chunk in iter(lambda: part.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    sha256 = digest.hexdigest()
+    if sha256 != session.sha256:
+        UploadSession.objects.filter(pk=session.pk).update(received=0, updated_at=timezone.now())
+        open(path, 'wb').close()
+        session.received = 0
+        logger.warning(f"Upload {session.pk}: checksum mismatch, expected {session.sha256}, got {sha256}")
+        raise ValidationError('Checksum mismatch: the received data does not match sha256; upload the file again')
+
+    with transaction.atomic():
+        session = UploadSession.objects.select_for_update().get(pk=session.pk)
+        if session.status == 'complete':
+            # A concurrent request finished it first
+            return session
+        session.stored_name = payment_file_storage.save(
+            f'payment_files/{session.filename}', AssembledUpload(path, sha256, session.size)
+        )
+        session.status = 'complete'
+        session.save(update_fields=['stored_name', 'status', 'updated_at'])
+    # Still there if identical content was already stored
+    if os.path.exists(path):
+        os.remove(path)
+    return session
+
+
+def claim_upload(upload_id):
+    """
+    Storage name of a completed upload for a payment to point at. The
+    session is deleted and its StoredFile reference passes to the payment;
+    call this in the transaction that saves the payment.
+    """
+    from .models import UploadSession
+
+    session = UploadSession.objects.select_for_update().filter(pk=upload_id, status='complete').first()
+    if session is None:
+        raise ValidationError('Upload not found, not complete or already attached to a payment')
+    session.delete()
+    return session.stored_name
+
+
+def discard_session(session):
+    """Delete a session and its data; returns the bytes freed from the upload area."""
+    from .models import StoredFile, UploadSession
+
+    freed = 0
+    path = part_path(session.pk)
+    with transaction.atomic():
+        session = UploadSession.objects.select_for_update().filter(pk=session.pk).first()
+        if session is None:
+            return 0
+        session.delete()
+        if session.status == 'complete':
+            StoredFile.release(session.stored_name)
+    if os.path.exists(path):
+        freed = os.path.getsize(path)
+        os.remove(path)
+    return freed
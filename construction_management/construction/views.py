@@ -1,21 +1,53 @@
 from django.shortcuts import render
 from rest_framework import viewsets, status
 from rest_framework.response import Response
+from rest_framework.authentication import SessionAuthentication
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.decorators import api_view, action
-from django.db.models import Sum, Q
+from rest_framework.exceptions import NotFound
 from django.views.decorators.csrf import ensure_csrf_cookie, csrf_protect
+from django.views.decorators.http import condition, require_GET
+from django.http import Http404, HttpResponse, HttpResponseRedirect, JsonResponse
+from django.utils.crypto import constant_time_compare
 from django.utils.decorators import method_decorator
-from .models import Project, ManpowerExpense, MaterialExpense, Payment, LaborWorkType, MaterialItem
+from django.core.exceptions import ValidationError
+from django.conf import settings
+from .models import (
+    Project, ManpowerExpense, MaterialExpense, Payment, ProjectLedger, InsufficientFundsError, UploadSession
+)
 from .serializers import (
     ProjectSerializer, ManpowerExpenseSerializer, 
     MaterialExpenseSerializer, PaymentSerializer,
-    LaborWorkTypeSerializer, MaterialItemSerializer
+    ExpenseFeedSerializer, UploadSessionSerializer
+)
+from .reports import TIME_RANGES, build_report_data
+from .expense_feed import ExpenseFeed, FEED_ORDERING
+from .search import expense_search
+from .storage import content_digest
+from .downloads import payment_file_url, serve_file
+from .uploads import UploadConflict, complete_session, discard_session, write_chunk
+from .portfolio import build_portfolio_summary
+from .report_cache import report_cache
+from .metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, render as render_metrics
+from .slow_queries import slow_query_log
+from .profiling import profile_store
+from .etags import (
+    project_version, project_list_etag, portfolio_etag, payment_list_etag, project_payments_etag, expense_list_etag, report_etag
+)
+from .reference_data import reference_data
+from .expense_import import ExpenseImport, read_csv_rows
+from .exports import (
+    EXPENSE_EXPORT_FIELDS, PAYMENT_EXPORT_FIELDS, DEFAULT_CHUNK_SIZE, MAX_CHUNK_SIZE,
+    iter_rows, export_response
 )
+import csv
+import json
 import logging
+import os
+import re
+from functools import wraps
 from django.utils import timezone
-from datetime import datetime, timedelta
-from decimal import Decimal 
+from datetime import datetime
 
 
 
@@ -46,12 +78,20 @@ class ProjectViewSet(viewsets.ModelViewSet):
     queryset = Project.objects.all()
     serializer_class = ProjectSerializer
     permission_classes = [AllowAny]
+    keyset_ordering = ('-created_at', 'id')
 
+    @method_decorator(condition(etag_func=project_list_etag))
     def list(self, request, *args, **kwargs):
         try:
             projects = self.get_queryset()
+            page = self.paginate_queryset(projects)
+            if page is not None:
+                serializer = self.get_serializer(page, many=True)
+                return self.get_paginated_response(serializer.data)
             serializer = self.get_serializer(projects, many=True)
             return Response(serializer.data)
+        except NotFound:
+            raise
         except Exception as e:
             logger.error(f"Error in project list: {str(e)}")
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -114,40 +154,79 @@ class ProjectViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+def reference_data_etag(request, *args, **kwargs):
+    return reference_data.snapshot().etag
+
+@condition(etag_func=reference_data_etag)
 @api_view(['GET'])
 def material_items_list(request):
-    items = MaterialItem.objects.filter(is_active=True)
-    serializer = MaterialItemSerializer(items, many=True)
-    return Response(serializer.data)
+    return Response(reference_data.snapshot().material_items_data)
+
+def get_chunk_size(request):
+    try:
+        chunk_size = int(request.query_params.get('chunk_size', DEFAULT_CHUNK_SIZE))
+    except ValueError:
+        return DEFAULT_CHUNK_SIZE
+    return min(max(chunk_size, 1), MAX_CHUNK_SIZE)
 
 @method_decorator(csrf_protect, name='dispatch')
 class ExpenseViewSet(viewsets.ModelViewSet):
     permission_classes = [AllowAny]
     http_method_names = ['get', 'post', 'delete']
+    search_ranked = False
+
+    @property
+    def keyset_ordering(self):
+        if self.request.query_params.get('type') == 'all':
+            return FEED_ORDERING
+        if self.search_ranked:
+            # ?search=...&ordering=relevance, answered from the full-text index
+            return ('-search_rank', '-date', '-created_at', 'id')
+        return ('-date', '-created_at', 'id')
+
+    @method_decorator(condition(etag_func=expense_list_etag))
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
     
     def get_queryset(self):
         expense_type = self.request.query_params.get('type')
-        project_id = self.request.query_params.get('project_id')
-        start_date = self.request.query_params.get('start_date')
-        end_date = self.request.query_params.get('end_date')
-        search = self.request.query_params.get('search', '')
 
         # Base queryset based on expense type
-        if expense_type == 'manpower':
-            queryset = ManpowerExpense.objects.all()
+        # Related rows read by the serializers are joined in up front
+        if expense_type == 'all':
+            # Both kinds in one date-ordered UNION ALL query
+            return ExpenseFeed.from_querysets(
+                self.filter_expenses(ManpowerExpense.objects.all(), 'manpower'),
+                self.filter_expenses(MaterialExpense.objects.all(), 'material'),
+            ).order_by(*FEED_ORDERING)
+        elif expense_type == 'manpower':
+            queryset = ManpowerExpense.objects.select_related('project', 'work_type')
         elif expense_type == 'material':
-            queryset = MaterialExpense.objects.all()
+            queryset = MaterialExpense.objects.select_related('project', 'item')
         else:
             # Default to manpower expenses if no type specified
-            queryset = ManpowerExpense.objects.all()
+            queryset = ManpowerExpense.objects.select_related('project', 'work_type')
+
+        ranked = self.request.query_params.get('ordering') == 'relevance'
+        queryset = self.filter_expenses(queryset, expense_type, ranked=ranked)
+
+        # Apply ordering
+        if 'search_rank' in queryset.query.annotations:
+            self.search_ranked = True
+            return queryset.order_by('-search_rank', '-date', '-created_at')
+        queryset = queryset.order_by('-date', '-created_at')
+
+        return queryset
+
+    def filter_expenses(self, queryset, expense_type, ranked=False):
+        project_id = self.request.query_params.get('project_id')
+        start_date = self.request.query_params.get('start_date')
+        end_date = self.request.query_params.get('end_date')
+        search = self.request.query_params.get('search', '')
 
-        # Filter by project if provided
+        # Filter by project if provided (an unknown project matches nothing)
         if project_id:
-            try:
-                project = Project.objects.get(id=project_id)
-                queryset = queryset.filter(project=project)
-            except Project.DoesNotExist:
-                return ManpowerExpense.objects.none()
+            queryset = queryset.filter(project_id=project_id)
 
         # Apply date filters if provided
         if start_date:
@@ -155,28 +234,18 @@ class ExpenseViewSet(viewsets.ModelViewSet):
                 start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
                 queryset = queryset.filter(date__gte=start_date)
             except ValueError:
-                return ManpowerExpense.objects.none()
+                return queryset.none()
 
         if end_date:
             try:
                 end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
                 queryset = queryset.filter(date__lte=end_date)
             except ValueError:
-                return ManpowerExpense.objects.none()
-
-        # Apply search filter
-        if search:
-            if expense_type == 'manpower':
-                queryset = queryset.filter(description__icontains=search)
-            elif expense_type == 'material':
-                queryset = queryset.filter(
-                    Q(item__display_name__icontains=search) |
-                    Q(custom_item_name__icontains=search) |
-                    Q(description__icontains=search)
-                )
+                return queryset.none()
 
-        # Apply ordering
-        queryset = queryset.order_by('-date', '-created_at')
+        # Apply search filter (full-text index when available, else icontains)
+        if search and expense_type in ('manpower', 'material'):
+            queryset = expense_search.filter(queryset, search, ranked=ranked)
 
         return queryset
     
@@ -186,6 +255,8 @@ class ExpenseViewSet(viewsets.ModelViewSet):
         else:
             expense_type = self.request.query_params.get('type')
             
+        if expense_type == 'all' and self.request.method == 'GET':
+            return ExpenseFeedSerializer
         if expense_type == 'manpower':
             return ManpowerExpenseSerializer
         elif expense_type == 'material':
@@ -236,13 +307,7 @@ class ExpenseViewSet(viewsets.ModelViewSet):
             
     def _create_manpower_expense(self, data, project):
         # Calculate available funds
-        total_paid = Payment.objects.filter(project=project).aggregate(total=Sum('amount'))['total'] or 0
-        total_expenses = (
-            ManpowerExpense.objects.filter(project=project).aggregate(total=Sum('total_amount'))['total'] or 0
-        ) + (
-            MaterialExpense.objects.filter(project=project).aggregate(total=Sum('total_amount'))['total'] or 0
-        )
-        available_funds = max(total_paid - total_expenses, 0)
+        available_funds = ProjectLedger.for_project(project).available_funds
         try:
             amount = float(data.get('total_amount', 0))
         except Exception:
@@ -262,6 +327,8 @@ class ExpenseViewSet(viewsets.ModelViewSet):
             try:
                 expense = serializer.save(project=project)
                 return Response(serializer.data, status=status.HTTP_201_CREATED)
+            except InsufficientFundsError as e:
+                return Response({'error': e.message}, status=status.HTTP_400_BAD_REQUEST)
             except Exception as e:
                 return Response(
                     {'error': str(e)},
@@ -279,22 +346,15 @@ class ExpenseViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            try:
-                item = MaterialItem.objects.get(id=item_id)
-            except MaterialItem.DoesNotExist:
+            item = reference_data.get_material_item(item_id)
+            if item is None:
                 return Response(
                     {'error': 'Invalid material item'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
             # Calculate available funds
-            total_paid = Payment.objects.filter(project=project).aggregate(total=Sum('amount'))['total'] or 0
-            total_expenses = (
-                ManpowerExpense.objects.filter(project=project).aggregate(total=Sum('total_amount'))['total'] or 0
-            ) + (
-                MaterialExpense.objects.filter(project=project).aggregate(total=Sum('total_amount'))['total'] or 0
-            )
-            available_funds = max(total_paid - total_expenses, 0)
+            available_funds = ProjectLedger.for_project(project).available_funds
 
             # Calculate total amount
             per_unit_cost = float(data.get('per_unit_cost', 0))
@@ -338,6 +398,8 @@ class ExpenseViewSet(viewsets.ModelViewSet):
                 return Response(serializer.data, status=status.HTTP_201_CREATED)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+        except InsufficientFundsError as e:
+            return Response({'error': e.message}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             logger.error(f"Error creating material expense: {str(e)}", exc_info=True)
             return Response(
@@ -356,6 +418,59 @@ class ExpenseViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Create many manpower/material expenses at once from a JSON array
+        (or {"rows": [...]}) or an uploaded CSV file with the same columns.
+        ?mode=best_effort writes the valid rows and reports the others;
+        the default all-or-nothing mode writes nothing if any row fails.
+        """
+        uploaded_file = request.FILES.get('file')
+        if uploaded_file:
+            try:
+                rows = list(read_csv_rows(uploaded_file))
+            except (UnicodeDecodeError, csv.Error) as e:
+                return Response({'error': f'Invalid CSV file: {e}'}, status=status.HTTP_400_BAD_REQUEST)
+        elif isinstance(request.data, list):
+            rows = request.data
+        else:
+            rows = request.data.get('rows')
+        if not isinstance(rows, list) or not rows:
+            return Response(
+                {'error': 'Expected a non-empty list of expense rows or a CSV file'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        mode = request.query_params.get('mode', 'atomic')
+        if mode not in ('atomic', 'best_effort'):
+            return Response({'error': 'Invalid mode'}, status=status.HTTP_400_BAD_REQUEST)
+
+        result = ExpenseImport(rows, atomic=(mode == 'atomic')).run()
+        return Response(
+            {'created': result.created, 'errors': result.error_list()},
+            status=status.HTTP_201_CREATED if result.created else status.HTTP_400_BAD_REQUEST
+        )
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Stream every expense matching the list filters as CSV, or as NDJSON
+        with ?output=ndjson.
+        """
+        queryset = self.get_queryset()
+        if isinstance(queryset, ExpenseFeed):
+            return Response(
+                {'error': 'Export one expense type at a time'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        expense_type = 'material' if queryset.model is MaterialExpense else 'manpower'
+        fields, expressions = EXPENSE_EXPORT_FIELDS[expense_type]
+        rows = iter_rows(queryset, self.keyset_ordering, fields, expressions, get_chunk_size(request))
+        return export_response(
+            rows, fields + list(expressions), f'{expense_type}_expenses', request.query_params.get('output')
+        )
+
     @action(detail=False, methods=['get'])
     def summary(self, request):
         project_id = request.query_params.get('project_id')
@@ -373,17 +488,12 @@ class ExpenseViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_404_NOT_FOUND
             )
 
-        # Get expense summaries
-        manpower_expenses = ManpowerExpense.objects.filter(project=project)
-        material_expenses = MaterialExpense.objects.filter(project=project)
-
-        # Calculate totals
-        manpower_total = manpower_expenses.aggregate(total=Sum('total_amount'))['total'] or 0
-        material_total = material_expenses.aggregate(total=Sum('total_amount'))['total'] or 0
-
-        # Get expense counts
-        manpower_count = manpower_expenses.count()
-        material_count = material_expenses.count()
+        # Expense totals and counts are kept on the project's ledger
+        ledger = ProjectLedger.for_project(project)
+        manpower_total = ledger.total_manpower
+        material_total = ledger.total_material
+        manpower_count = ledger.manpower_count
+        material_count = ledger.material_count
 
         return Response({
             'manpower': {
@@ -398,131 +508,128 @@ class ExpenseViewSet(viewsets.ModelViewSet):
         })
 
 @csrf_protect
+@condition(etag_func=report_etag)
 @api_view(['GET'])
 def report_data(request, project_id):
     try:
-        project = Project.objects.get(id=project_id)
+        version = project_version(request._request, project_id)
+        if version is None:
+            version = ProjectLedger.for_project(Project.objects.get(id=project_id)).version
         time_range = request.query_params.get('time_range', 'month')
-        
-        # Calculate date range based on time_range
+        if time_range not in TIME_RANGES:
+            return Response({"error": f"time_range must be one of {', '.join(TIME_RANGES)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
         today = timezone.now().date()
-        if time_range == 'month':
-            start_date = today.replace(day=1)
-        elif time_range == 'quarter':
-            current_quarter = (today.month - 1) // 3
-            start_date = today.replace(month=current_quarter * 3 + 1, day=1)
-        else:  # year
-            start_date = today.replace(month=1, day=1)
-        
-        # --- OVERALL STATS (not filtered by time) ---
-        all_manpower_expenses = ManpowerExpense.objects.filter(project_id=project_id)
-        all_material_expenses = MaterialExpense.objects.filter(project_id=project_id)
-        all_payments = Payment.objects.filter(project_id=project_id)
-
-        overall_total_manpower = all_manpower_expenses.aggregate(total=Sum('total_amount'))['total'] or 0
-        overall_total_material = all_material_expenses.aggregate(total=Sum('total_amount'))['total'] or 0
-        overall_total_expenses = overall_total_manpower + overall_total_material
-        overall_total_payments = all_payments.aggregate(total=Sum('amount'))['total'] or 0
-        overall_due_payments = project.budget - overall_total_payments
-        overall_available_funds = max(overall_total_payments - overall_total_expenses, 0)
-        overall_budget_utilization = (overall_total_expenses / project.budget * 100) if project.budget > 0 else 0
-
-        # --- FILTERED DATA (for charts) ---
-        manpower_expenses = all_manpower_expenses.filter(date__gte=start_date, date__lte=today)
-        material_expenses = all_material_expenses.filter(date__gte=start_date, date__lte=today)
-        payments = all_payments.filter(payment_date__gte=start_date, payment_date__lte=today)
-        
-        total_manpower = manpower_expenses.aggregate(total=Sum('total_amount'))['total'] or 0
-        total_material = material_expenses.aggregate(total=Sum('total_amount'))['total'] or 0
-        total_expenses = total_manpower + total_material
-        
-        expense_breakdown = {
-            'Manpower': total_manpower,
-            'Material': total_material
-        }
-
-        payment_breakdown = {}
-        for payment_type in ['Advance', 'Installment', 'Full']:
-            type_payments = payments.filter(payment_type=payment_type)
-            total = type_payments.aggregate(total=Sum('amount'))['total'] or 0
-            payment_breakdown[payment_type] = total
-
-        total_payments = payments.aggregate(total=Sum('amount'))['total'] or 0
-        due_payments = project.budget - total_payments
-        available_funds = max(total_payments - total_expenses, 0)
-        budget_utilization = (total_expenses / project.budget * 100) if project.budget > 0 else 0
-
-        # Get monthly expense trend
-        monthly_expenses = []
-        monthly_payments = []
-        current_date = start_date
-        while current_date <= today:
-            month_end = (current_date.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
-            
-            month_expenses = manpower_expenses.filter(
-                date__year=current_date.year,
-                date__month=current_date.month
-            ).aggregate(total=Sum('total_amount'))['total'] or 0
-            
-            month_expenses += material_expenses.filter(
-                date__year=current_date.year,
-                date__month=current_date.month
-            ).aggregate(total=Sum('total_amount'))['total'] or 0
-            
-            month_payments = payments.filter(
-                payment_date__year=current_date.year,
-                payment_date__month=current_date.month
-            ).aggregate(total=Sum('amount'))['total'] or 0
-            
-            monthly_expenses.append({
-                'date': current_date.strftime('%Y-%m'),
-                'amount': month_expenses
-            })
-            
-            monthly_payments.append({
-                'date': current_date.strftime('%Y-%m'),
-                'amount': month_payments
-            })
-            
-            current_date = (current_date.replace(day=28) + timedelta(days=4)).replace(day=1)
-
-        return Response({
-            'project_name': project.name,
-            'budget': project.budget,
-            # --- OVERALL STATS ---
-            'overall': {
-                'total_expenses': overall_total_expenses,
-                'total_payments': overall_total_payments,
-                'available_funds': overall_available_funds,
-                'due_payments': overall_due_payments,
-                'budget_utilization': round(overall_budget_utilization, 2),
-            },
-            # --- FILTERED DATA (for charts) ---
-            'filtered': {
-                'total_expenses': total_expenses,
-                'total_payments': total_payments,
-                'available_funds': available_funds,
-                'due_payments': due_payments,
-                'budget_utilization': round(budget_utilization, 2),
-                'expense_breakdown': expense_breakdown,
-                'payment_breakdown': payment_breakdown,
-                'monthly_trend': {
-                    'expenses': monthly_expenses,
-                    'payments': monthly_payments
-                }
-            }
-        })
+        key = report_cache.make_key(project_id, time_range, version, today)
+        data, hit = report_cache.get_or_compute(
+            key, lambda: build_report_data(Project.objects.get(id=project_id), time_range, today)
+        )
+        response = Response(data)
+        response['X-Cache'] = 'HIT' if hit else 'MISS'
+        return response
     except Project.DoesNotExist:
         return Response({"error": "Project not found"}, status=status.HTTP_404_NOT_FOUND)
     except Exception as e:
         logger.error(f"Error in report_data: {str(e)}")
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+@csrf_protect
+@condition(etag_func=portfolio_etag)
+@api_view(['GET'])
+def portfolio_summary(request):
+    try:
+        # DjangoJSONEncoder renders the Decimal amounts as strings
+        return JsonResponse(build_portfolio_summary())
+    except Exception as e:
+        logger.error(f"Error in portfolio_summary: {str(e)}")
+        return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@require_GET
+def metrics(request):
+    """Request metrics in Prometheus text format, for a scraper with METRICS_TOKEN."""
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if not token and not settings.DEBUG:
+        return HttpResponse('Set METRICS_TOKEN to serve metrics', status=403, content_type='text/plain')
+    if token and not constant_time_compare(request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}'):
+        response = HttpResponse('Unauthorized', status=401, content_type='text/plain')
+        response['WWW-Authenticate'] = 'Bearer'
+        return response
+    return HttpResponse(render_metrics(), content_type=METRICS_CONTENT_TYPE)
+
+def staff_only(view):
+    """403 unless a staff user is logged in (through /admin/)."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not (request.user.is_active and request.user.is_staff):
+            return JsonResponse({'error': 'Staff access required'}, status=403)
+        return view(request, *args, **kwargs)
+    return wrapper
+
+@require_GET
+@staff_only
+def slow_queries(request):
+    """
+    This process's slow queries, newest first, as JSON or with
+    ?format=jsonl as a JSON-lines download.
+    """
+    entries = slow_query_log.snapshot()
+    if request.GET.get('format') == 'jsonl':
+        response = HttpResponse(
+            ''.join(json.dumps(entry, default=str) + '\n' for entry in entries),
+            content_type='application/x-ndjson',
+        )
+        response['Content-Disposition'] = f'attachment; filename="slow-queries-{os.getpid()}.jsonl"'
+        return response
+    return JsonResponse({
+        'pid': os.getpid(),
+        'threshold_ms': getattr(settings, 'SLOW_QUERY_THRESHOLD_MS', 0),
+        'count': len(entries),
+        'queries': entries,
+    })
+
+@require_GET
+@staff_only
+def report_cache_stats(request):
+    return JsonResponse(report_cache.stats())
+
+@require_GET
+@staff_only
+def request_profiles(request):
+    return JsonResponse({'profiles': profile_store.recent()})
+
+@require_GET
+@staff_only
+def request_profile(request, profile_id):
+    """One profile as JSON, or with ?format=pstats the raw stats for pstats/snakeviz."""
+    stored = profile_store.get(profile_id)
+    if stored is None:
+        return JsonResponse({'error': 'Profile not found'}, status=404)
+    profile, raw = stored
+    if request.GET.get('format') == 'pstats':
+        response = HttpResponse(raw, content_type='application/octet-stream')
+        response['Content-Disposition'] = f'attachment; filename="{profile_id}.prof"'
+        return response
+    return JsonResponse(profile)
+
+@require_GET
+def payment_media(request, path):
+    """
+    Payment files and in-progress uploads are not served from MEDIA_URL;
+    links to a payment file's media URL redirect to its download endpoint.
+    """
+    payment = None
+    if path.startswith('payment_files/'):
+        payment = Payment.objects.filter(payment_file=path).order_by('pk').first()
+    if payment is None:
+        raise Http404('No such payment file')
+    return HttpResponseRedirect(payment_file_url(payment))
+
 @method_decorator(csrf_protect, name='dispatch')
 class PaymentViewSet(viewsets.ModelViewSet):
-    queryset = Payment.objects.all()
+    queryset = Payment.objects.select_related('project')
     serializer_class = PaymentSerializer
     permission_classes = [AllowAny]
+    keyset_ordering = ('-payment_date', 'id')
 
     def create(self, request, *args, **kwargs):
         try:
@@ -532,38 +639,161 @@ class PaymentViewSet(viewsets.ModelViewSet):
                 serializer.save()
                 return Response(serializer.data, status=status.HTTP_201_CREATED)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        except ValidationError as e:
+            return Response({'error': ' '.join(e.messages)}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             logger.error(f"Error in PaymentViewSet.create: {str(e)}", exc_info=True)
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    @method_decorator(condition(etag_func=payment_list_etag))
     def list(self, request, *args, **kwargs):
         try:
             payments = self.get_queryset()
+            page = self.paginate_queryset(payments)
+            if page is not None:
+                serializer = self.get_serializer(page, many=True)
+                return self.get_paginated_response(serializer.data)
             serializer = self.get_serializer(payments, many=True)
             return Response(serializer.data)
+        except NotFound:
+            raise
         except Exception as e:
             logger.error(f"Error in payment list: {str(e)}")
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
     def get_queryset(self):
         project_id = self.request.query_params.get('project_id')
+        payments = Payment.objects.select_related('project')
         if project_id:
-            return Payment.objects.filter(project_id=project_id)
-        return Payment.objects.all()
+            return payments.filter(project_id=project_id)
+        return payments
+
+    @action(detail=True, methods=['get'], authentication_classes=[SessionAuthentication],
+            permission_classes=[IsAuthenticated])
+    def file(self, request, pk=None):
+        """
+        Download the payment's receipt, with Range and conditional GET
+        support. Unlike the rest of the API this needs a logged-in Django
+        session (e.g. from /admin/). URLs carrying the file's digest (?v=,
+        see PaymentSerializer.payment_file_url) are cached for good.
+        """
+        payment = self.get_object()
+        if not payment.payment_file:
+            raise NotFound('This payment has no file')
+        name = payment.payment_file.name
+        digest = content_digest(name)
+        return serve_file(
+            request, payment.payment_file.storage, name,
+            f'payment-{payment.pk}{os.path.splitext(name)[1]}',
+            immutable=digest is not None and request.query_params.get('v') == digest,
+        )
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Stream payments as CSV, or as NDJSON with ?output=ndjson. Accepts
+        project_id plus start_date/end_date on the payment date.
+        """
+        queryset = self.get_queryset()
+        try:
+            start_date = request.query_params.get('start_date')
+            if start_date:
+                queryset = queryset.filter(payment_date__gte=datetime.strptime(start_date, '%Y-%m-%d').date())
+            end_date = request.query_params.get('end_date')
+            if end_date:
+                queryset = queryset.filter(payment_date__lte=datetime.strptime(end_date, '%Y-%m-%d').date())
+        except ValueError:
+            queryset = queryset.none()
+        fields, expressions = PAYMENT_EXPORT_FIELDS
+        rows = iter_rows(queryset, self.keyset_ordering, fields, expressions, get_chunk_size(request))
+        return export_response(rows, fields + list(expressions), 'payments', request.query_params.get('output'))
+
+CONTENT_RANGE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+
+@method_decorator(csrf_protect, name='dispatch')
+class UploadViewSet(viewsets.ViewSet):
+    """
+    Resumable uploads for large payment files (protocol in
+    construction.uploads): create a session, PUT chunks with Content-Range,
+    GET to find where to resume, POST complete/, then attach the id to a
+    payment as upload_id.
+    """
+    permission_classes = [AllowAny]
+    lookup_value_regex = '[0-9a-fA-F-]{36}'
+
+    def get_object(self, pk):
+        try:
+            return UploadSession.objects.get(pk=pk)
+        except (UploadSession.DoesNotExist, ValidationError):
+            raise NotFound('Upload not found')
+
+    def create(self, request):
+        serializer = UploadSessionSerializer(data=request.data)
+        if serializer.is_valid():
+            serializer.save()
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    def retrieve(self, request, pk=None):
+        return Response(UploadSessionSerializer(self.get_object(pk)).data)
+
+    def update(self, request, pk=None):
+        """Write one chunk; the body goes straight to the part file."""
+        session = self.get_object(pk)
+        match = CONTENT_RANGE.match(request.META.get('HTTP_CONTENT_RANGE', ''))
+        if not match:
+            return Response({'error': 'Content-Range: bytes <start>-<end>/<size> is required'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        start, end, total = (int(value) for value in match.groups())
+        length = end - start + 1
+        if end < start or total != session.size:
+            return Response({'error': f'Invalid range for a {session.size} byte file'},
+                            status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        if int(request.META.get('CONTENT_LENGTH') or 0) != length:
+            return Response({'error': 'Content-Length does not match Content-Range'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        max_chunk = getattr(settings, 'CHUNKED_UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024)
+        if length > max_chunk:
+            return Response({'error': f'Chunks must be at most {max_chunk} bytes'},
+                            status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        try:
+            write_chunk(session, start, length, request.stream)
+        except UploadConflict as e:
+            return Response({'error': str(e), 'received': e.received}, status=status.HTTP_409_CONFLICT)
+        except ValidationError as e:
+            return Response({'error': ' '.join(e.messages), 'received': session.received},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response(UploadSessionSerializer(session).data)
+
+    def destroy(self, request, pk=None):
+        discard_session(self.get_object(pk))
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=True, methods=['post'])
+    def complete(self, request, pk=None):
+        """Verify the checksum and store the file; the response id is the upload_id for a payment."""
+        try:
+            session = complete_session(self.get_object(pk))
+        except ValidationError as e:
+            return Response({'error': ' '.join(e.messages)}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            logger.error(f"Error completing upload {pk}: {str(e)}", exc_info=True)
+            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return Response(UploadSessionSerializer(session).data)
 
 @csrf_protect
+@condition(etag_func=project_payments_etag)
 @api_view(['GET'])
 def project_payments(request, project_id):
     try:
-        payments = Payment.objects.filter(project_id=project_id)
+        payments = Payment.objects.filter(project_id=project_id).select_related('project')
         serializer = PaymentSerializer(payments, many=True)
         return Response(serializer.data)
     except Exception as e:
         logger.error(f"Error in project_payments: {str(e)}")
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+@condition(etag_func=reference_data_etag)
 @api_view(['GET'])
 def labor_work_type_list(request):
-    work_types = LaborWorkType.objects.all()
-    serializer = LaborWorkTypeSerializer(work_types, many=True)
-    return Response(serializer.data)
+    return Response(reference_data.snapshot().work_types_data)
@@ -14,3 +14,7 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'construction_management.settings')
 
 application = get_asgi_application()
+
+from construction.reference_data import warm_on_startup  # noqa: E402 - needs the apps loaded
+
+warm_on_startup()
@@ -29,10 +29,13 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',  # Must be first for CORS
     'django.middleware.security.SecurityMiddleware',
+    'construction.middleware.metrics_middleware',  # Outside the rest, to time and count their queries too
+    'construction.middleware.query_stats_middleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'construction.middleware.profiling_middleware',  # Needs request.user
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -47,6 +50,90 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [],
     'DEFAULT_AUTHENTICATION_CLASSES': [],
     'DEFAULT_RENDERER_CLASSES': ['rest_framework.renderers.JSONRenderer'],
+    'DEFAULT_PAGINATION_CLASS': 'construction.pagination.KeysetPagination',
+    'PAGE_SIZE': config('API_PAGE_SIZE', cast=int, default=50),
+}
+
+# Project id allocation: zero-padded width of the number in 'ID-0001' (at
+# most 7, project_id holds 10 characters) and how many ids each worker
+# process reserves from the sequence at a time. Ids are unique but may have
+# gaps, e.g. after a failed save or a restart with an unused block
+PROJECT_ID_WIDTH = config('PROJECT_ID_WIDTH', cast=int, default=4)
+PROJECT_ID_BLOCK_SIZE = config('PROJECT_ID_BLOCK_SIZE', cast=int, default=1)
+
+# Material items and labour work types are cached per process; other workers
+# notice edits within REFERENCE_DATA_VERSION_TTL seconds. Server processes
+# (wsgi.py, asgi.py, runserver) fill the cache in the background on startup
+REFERENCE_DATA_VERSION_TTL = config('REFERENCE_DATA_VERSION_TTL', cast=float, default=5)
+REFERENCE_DATA_WARM_ON_STARTUP = config('REFERENCE_DATA_WARM_ON_STARTUP', cast=bool, default=True)
+
+# Expense search uses the database's full-text index ('fulltext': MySQL
+# FULLTEXT or SQLite FTS5, see the rebuild_search_index command) and falls
+# back to icontains when it is missing; 'icontains' always uses the fallback.
+# The index matches whole words by prefix ('kitch' finds 'Kitchen', 'itchen'
+# finds nothing), unlike icontains which matches anywhere in the text. MySQL
+# does not index words under 3 characters, so searches with a shorter word
+# use icontains there.
+EXPENSE_SEARCH_BACKEND = config('EXPENSE_SEARCH_BACKEND', default='fulltext')
+
+# Serve the read API (lists, reports, reference data) from async views when
+# running under ASGI, e.g. uvicorn construction_management.asgi:application
+ASYNC_READ_VIEWS = config('ASYNC_READ_VIEWS', cast=bool, default=False)
+# The async report view runs its aggregate queries concurrently, one database
+# connection each; worth it when the database is on another host
+REPORT_PARALLEL_QUERIES = config('REPORT_PARALLEL_QUERIES', cast=bool, default=True)
+
+# Report each request's query count and database time in response headers
+# (X-DB-Queries, Server-Timing); the loadtest command turns this on for the
+# server it starts. Leave it off in production.
+QUERY_STATS_HEADERS = config('QUERY_STATS_HEADERS', cast=bool, default=False)
+
+# Per-view request metrics (construction.metrics), served at /metrics in
+# Prometheus text format. Point METRICS_DIR at a directory all workers on the
+# host share so any of them reports the whole server. /metrics requires
+# "Authorization: Bearer <METRICS_TOKEN>"; without a token it is only served
+# with DEBUG on
+METRICS_ENABLED = config('METRICS_ENABLED', cast=bool, default=True)
+METRICS_DIR = config('METRICS_DIR', default='')
+METRICS_FLUSH_INTERVAL = config('METRICS_FLUSH_INTERVAL', cast=float, default=1.0)
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
+# Slow query capture (construction.slow_queries), off by default: with
+# SLOW_QUERY_THRESHOLD_MS set (e.g. 200), queries taking at least that long
+# are kept, with their EXPLAIN plan when SLOW_QUERY_EXPLAIN is on, in a ring
+# buffer of SLOW_QUERY_LOG_SIZE entries per process that staff can read at
+# /api/slow-queries/. SLOW_QUERY_LOG_FILE also appends them to that file as
+# JSON lines. EXPLAIN runs on the same database as the query
+SLOW_QUERY_THRESHOLD_MS = config('SLOW_QUERY_THRESHOLD_MS', cast=float, default=0)
+SLOW_QUERY_EXPLAIN = config('SLOW_QUERY_EXPLAIN', cast=bool, default=False)
+SLOW_QUERY_LOG_SIZE = config('SLOW_QUERY_LOG_SIZE', cast=int, default=200)
+SLOW_QUERY_LOG_FILE = config('SLOW_QUERY_LOG_FILE', default='')
+
+# With REQUEST_PROFILING on, staff can profile a single request with
+# ?profile=1 or an X-Profile: 1 header (construction.profiling); the last
+# REQUEST_PROFILE_LOG_SIZE profiles are kept per process, and in
+# REQUEST_PROFILE_DIR if set, for any worker to serve at /api/profiles/<id>/.
+# Off by default; turn it on where it is needed
+REQUEST_PROFILING = config('REQUEST_PROFILING', cast=bool, default=False)
+REQUEST_PROFILE_LOG_SIZE = config('REQUEST_PROFILE_LOG_SIZE', cast=int, default=20)
+REQUEST_PROFILE_DIR = config('REQUEST_PROFILE_DIR', default='')
+
+# Cached report payloads (see construction.report_cache). 'locmem' keeps them
+# per process; 'file' shares them between workers on the same host.
+REPORT_CACHE_BACKEND = config('REPORT_CACHE_BACKEND', default='locmem')
+REPORT_CACHE_TIMEOUT = config('REPORT_CACHE_TIMEOUT', cast=int, default=86400)
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'reports': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': config('REPORT_CACHE_LOCATION', default=str(BASE_DIR / 'cache' / 'reports')),
+    } if REPORT_CACHE_BACKEND == 'file' else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'reports',
+    },
 }
 
 # URL configuration
@@ -120,6 +207,26 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Uploads stream to temporary files and are hashed on the way in; payment
+# files are then stored once per distinct content (construction.storage)
+FILE_UPLOAD_HANDLERS = ['construction.uploads.HashingFileUploadHandler']
+
+# How /api/payments/<id>/file/ sends file bodies: '' streams them from Django
+# (WSGI servers sendfile() them through wsgi.file_wrapper), 'x-accel-redirect'
+# hands off to an nginx internal location at PAYMENT_FILE_ACCEL_PREFIX that
+# aliases MEDIA_ROOT, 'x-sendfile' to Apache mod_xsendfile or lighttpd.
+# Downloads need a logged-in Django session (log in at /admin/); the rest of
+# the API stays open. Old /media/payment_files/ links redirect to it.
+PAYMENT_FILE_SENDFILE = config('PAYMENT_FILE_SENDFILE', default='')
+PAYMENT_FILE_ACCEL_PREFIX = config('PAYMENT_FILE_ACCEL_PREFIX', default='/protected-media/')
+
+# Resumable uploads (/api/uploads/, construction.uploads): the largest file a
+# session may declare, the largest chunk one PUT may carry, and how long an
+# idle session is kept before cleanup_uploads deletes it
+CHUNKED_UPLOAD_MAX_SIZE = config('CHUNKED_UPLOAD_MAX_SIZE', cast=int, default=100 * 1024 * 1024)
+CHUNKED_UPLOAD_CHUNK_SIZE = config('CHUNKED_UPLOAD_CHUNK_SIZE', cast=int, default=8 * 1024 * 1024)
+CHUNKED_UPLOAD_EXPIRY_HOURS = config('CHUNKED_UPLOAD_EXPIRY_HOURS', cast=int, default=24)
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -1,8 +1,8 @@
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
 from django.conf.urls.static import static
-from construction import views
+from construction import async_views, views
 from rest_framework import routers
 
 
@@ -10,16 +10,48 @@ router = routers.DefaultRouter()
 router.register(r'projects', views.ProjectViewSet, basename='project')
 router.register(r'expenses', views.ExpenseViewSet, basename='expense')
 router.register(r'payments', views.PaymentViewSet, basename='payment')
+router.register(r'uploads', views.UploadViewSet, basename='upload')
+
+if settings.ASYNC_READ_VIEWS:
+    # Read endpoints served by async views (see construction.async_views);
+    # they come before the router so they shadow its list routes
+    read_urlpatterns = [
+        path('api/projects/', async_views.project_list, name='project-list'),
+        path('api/expenses/', async_views.expense_list, name='expense-list'),
+        path('api/payments/', async_views.payment_list, name='payment-list'),
+        path('api/projects/<int:project_id>/payments/', async_views.project_payments, name='project_payments'),
+        path('api/reports/<int:project_id>/', async_views.report_data, name='report_data'),
+        path('api/labor-work-types/', async_views.labor_work_type_list, name='labor-work-type-list'),
+        path('api/material-items/', async_views.material_items_list, name='material-items-list'),
+    ]
+else:
+    read_urlpatterns = [
+        path('api/projects/<int:project_id>/payments/', views.project_payments, name='project_payments'),
+        path('api/reports/<int:project_id>/', views.report_data, name='report_data'),
+        path('api/labor-work-types/', views.labor_work_type_list, name='labor-work-type-list'),
+    ]
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', views.metrics, name='metrics'),
     path('', views.index, name='index'),
     path('projects/', views.projects, name='projects'),
     path('expenses/', views.expenses, name='expenses'),
     path('reports/', views.reports, name='reports'),
     path('payments/', views.payments, name='payments'),
+    path('api/reports/cache-stats/', views.report_cache_stats, name='report_cache_stats'),
+    path('api/slow-queries/', views.slow_queries, name='slow_queries'),
+    path('api/profiles/', views.request_profiles, name='request_profiles'),
+    re_path(r'^api/profiles/(?P<profile_id>[0-9a-f]{32})/$', views.request_profile, name='request_profile'),
+    # With the action's own authentication and permission classes, as the router would pass them
+    path('api/payments/<int:pk>/file/', views.PaymentViewSet.as_view({'get': 'file'}, **views.PaymentViewSet.file.kwargs),
+         name='payment_file'),
+    *read_urlpatterns,
     path('api/', include(router.urls)),
-    path('api/reports/<int:project_id>/', views.report_data, name='report_data'),
-    path('api/labor-work-types/', views.labor_work_type_list, name='labor-work-type-list'),
+    path('api/portfolio/summary/', views.portfolio_summary, name='portfolio_summary'),
     path('api/', include('construction.urls')),
+    # Payment files only go out through payment_file; other media is served
+    # in development as before
+    re_path(r'^%s(?P<path>(?:payment_files|uploads)/.*)$' % settings.MEDIA_URL.lstrip('/'), views.payment_media,
+            name='payment_media'),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)